@@ -1,22 +1,17 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context, g
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from bson.objectid import ObjectId
 import os
 from datetime import datetime, timedelta
 import secrets
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 import requests
 import re
-try:
-    from openai import OpenAI
-except ImportError:
-    OpenAI = None
+import json
+import time
 try:
     from googletrans import Translator
 except ImportError:
@@ -25,17 +20,36 @@ try:
     import bleach
 except ImportError:
     bleach = None
-from config import get_config, DEFAULT_HEALTH_PROBLEMS, DEFAULT_HEALTH_PLANS
+from config import get_config, DEFAULT_HEALTH_PROBLEMS, DEFAULT_HEALTH_PLANS, SUPPORTED_LANGUAGES, REPORT_STATUSES
+from cache import LRUCache
+from health_status import calculate_health_status
+from jobs import JobQueue
+from translation_memory import TranslationMemory, create_translator_breaker
+import metrics
+from mailer import OutboxSender, save_report_with_outbox
+import report_rollups
+from consultation import AI_ERROR_MESSAGE, ConsultationEngine, create_backend, create_backend_breaker, fallback_response
+from resilience import CircuitOpen, DeadlineExceeded
+from token_budget import create_budget, estimate_tokens
+from triage import EmergencyResponder
+from retrieval import Retriever
 
 # Initialize Flask app with configuration
 app = Flask(__name__)
 config_class = get_config()
 app.config.from_object(config_class)
 
-# Initialize rate limiter
+def rate_limit_key():
+    """Signed-in user, else the client address"""
+    return session.get('user_id') or get_remote_address()
+
+# Initialize rate limiter; counters live in RATELIMIT_STORAGE_URL (MongoDB by default) so
+# the limits hold across gunicorn workers. Static files never count.
 limiter = Limiter(
-    key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
+    key_func=rate_limit_key,
+    default_limits=[app.config['RATELIMIT_DEFAULT']],
+    default_limits_exempt_when=lambda: request.endpoint == 'static',
+    storage_uri=app.config['RATELIMIT_STORAGE_URL']
 )
 limiter.init_app(app)
 
@@ -44,26 +58,130 @@ limiter.init_app(app)
 # csrf = CSRFProtect(app)
 
 # MongoDB Configuration
-client = MongoClient(app.config['MONGODB_URI'])
+client = MongoClient(app.config['MONGODB_URI'], event_listeners=[metrics.MongoCommandMetrics()])
 db = client[app.config['MONGODB_DB_NAME']]
 
-# AI Configuration
-openai_client = None
-if app.config['OPENAI_API_KEY'] and OpenAI is not None:
-    openai_client = OpenAI(api_key=app.config['OPENAI_API_KEY'])
-
 # Google Translate
 translator = None
 if Translator is not None:
     try:
-        translator = Translator()
+        if app.config['GOOGLE_TRANSLATE_SERVICE_URLS']:
+            translator = Translator(service_urls=app.config['GOOGLE_TRANSLATE_SERVICE_URLS'].split(','))
+        else:
+            translator = Translator()
     except Exception as e:
         print(f"Failed to initialize translator: {e}")
         translator = None
 
+# Translation memory shared with the Telegram bot; translator calls have a deadline and a circuit breaker
+translation_memory = TranslationMemory(
+    db.translation_memory,
+    translator,
+    max_entries=app.config['TRANSLATION_MEMORY_MAX_ENTRIES'],
+    breaker=create_translator_breaker(app.config)
+)
+try:
+    translation_memory.ensure_indexes()
+except Exception as e:
+    print(f"Failed to create translation memory indexes: {e}")
+
+# AI response cache (per worker process)
+ai_response_cache = None
+if app.config['AI_CACHE_ENABLED']:
+    ai_response_cache = LRUCache(
+        max_entries=app.config['AI_CACHE_MAX_ENTRIES'],
+        ttl_seconds=app.config['AI_CACHE_TTL'],
+        max_entry_size=app.config['AI_CACHE_MAX_ENTRY_BYTES']
+    )
+
+# Expose in-process cache counters on /metrics
+if ai_response_cache is not None:
+    metrics.register_cache('ai_response', ai_response_cache)
+metrics.register_cache('translation_memory', translation_memory.cache)
+
+# Per-user token budgets for model and translator calls, shared with the Telegram bot
+ai_budget = create_budget(db, 'ai', app.config, 'AI')
+translate_budget = create_budget(db, 'translate', app.config, 'TRANSLATE')
+
+# Local answers for common questions from the health catalog and curated chats
+retriever = None
+if app.config['RETRIEVAL_ENABLED']:
+    retriever = Retriever(
+        db,
+        threshold=app.config['RETRIEVAL_THRESHOLD'],
+        curated_limit=app.config['RETRIEVAL_MAX_CURATED']
+    ).rebuild()
+    if app.config['RETRIEVAL_REFRESH_INTERVAL'] > 0:
+        retriever.refresh_in_background(app.config['RETRIEVAL_REFRESH_INTERVAL'])
+
+# Consultation engine shared with the Telegram bot (prompts, model backend, limits)
+ai_backend = create_backend(app.config)
+consultation_engine = ConsultationEngine(
+    ai_backend,
+    translate=translation_memory.translate,
+    cache=ai_response_cache,
+    coalesce=app.config['AI_COALESCE_ENABLED'],
+    follower_timeout=app.config['AI_COALESCE_TIMEOUT'],
+    retriever=retriever,
+    breaker=create_backend_breaker(ai_backend, app.config),
+    budget=ai_budget
+)
+
+# Emergency guidance for red-flag messages, pre-translated for every language
+emergency_responder = EmergencyResponder(translation_memory)
+
+# Background sender for report emails
+email_sender = None
+if app.config['EMAIL_USER'] and app.config['EMAIL_PASSWORD']:
+    email_sender = OutboxSender(db, app.config)
+    if app.config['EMAIL_SENDER_IN_PROCESS']:
+        email_sender.start()
+
+# Background workers for AI consultations
+ai_jobs = JobQueue(
+    db.ai_jobs,
+    max_workers=app.config['AI_JOB_WORKERS'],
+    timeout_seconds=app.config['AI_JOB_TIMEOUT'],
+    name='ai-consultation'
+)
+
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Profile fields that go into the AI prompt
+USER_PROMPT_FIELDS = {'age': 1, 'gender': 1, 'medical_history': 1, 'health_status': 1, 'blood_group': 1}
+
+def load_current_user(projection=None):
+    """Load the signed-in user at most once per request (identity map on flask.g)"""
+    if 'user_id' not in session:
+        return None
+    
+    user_id = session['user_id']
+    users = g.setdefault('user_identity_map', {})
+    if (user_id, None) in users:
+        return users[(user_id, None)]
+    
+    key = (user_id, tuple(sorted(projection)) if projection else None)
+    if key not in users:
+        users[key] = db.users.find_one({'_id': ObjectId(user_id)}, projection)
+    return users[key]
+
+def remember_current_user(user):
+    """Replace the request's cached user after a write returned the new document"""
+    g.user_identity_map = {(str(user['_id']), None): user}
+    return user
+
+def update_current_user(update, return_document=ReturnDocument.AFTER):
+    """Apply an update to the signed-in user in a single round trip"""
+    user = db.users.find_one_and_update(
+        {'_id': ObjectId(session['user_id'])},
+        update,
+        return_document=return_document
+    )
+    if user is not None and return_document == ReturnDocument.AFTER:
+        remember_current_user(user)
+    return user
+
 @app.route('/')
 def index():
     if 'user_id' in session:
@@ -228,17 +346,27 @@ def community_reports():
             'issue_title': request.form['issue_title'],
             'description': request.form['description'],
             'location': request.form['location'],
+            'location_key': report_rollups.location_key(request.form['location']),
             'severity': request.form['severity'],
             'submitted_at': datetime.utcnow(),
             'status': 'pending'
         }
         
-        # Save report to database
-        db.reports.insert_one(report_data)
-        
-        # Send email to authorities (if configured)
-        if app.config['EMAIL_USER'] and app.config['EMAIL_PASSWORD']:
-            send_report_email(report_data)
+        # Save report to database, queueing the email to authorities (if configured)
+        if email_sender is not None:
+            save_report_with_outbox(
+                client, db, report_data,
+                digest_window=app.config['EMAIL_DIGEST_WINDOW'],
+                bypass_severities=app.config['EMAIL_DIGEST_BYPASS_SEVERITIES'].split(',')
+            )
+            email_sender.wake()
+        else:
+            db.reports.insert_one(report_data)
+        try:
+            report_rollups.record_report(db, report_data)
+        except Exception as e:
+            # The scheduled rollup rebuild repairs a missed increment
+            print(f"Failed to update report rollups: {e}")
         
         flash('Report submitted successfully!', 'success')
         return redirect(url_for('community_reports'))
@@ -248,13 +376,60 @@ def community_reports():
     
     return render_template('community_reports.html', reports=user_reports)
 
+def current_user_is_admin():
+    user = load_current_user({'is_admin': 1})
+    return bool(user and user.get('is_admin'))
+
+@app.route('/community-reports/<report_id>/status', methods=['POST'])
+def update_report_status(report_id):
+    """Change a report's status (admins only), keeping the rollups in step"""
+    if not current_user_is_admin():
+        return jsonify({'error': 'Not authorized'}), 403
+    
+    data = request.get_json(silent=True) or request.form
+    new_status = data.get('status')
+    if new_status not in REPORT_STATUSES:
+        return jsonify({'error': 'Invalid status'}), 400
+    try:
+        report_oid = ObjectId(report_id)
+    except Exception:
+        return jsonify({'error': 'Report not found'}), 404
+    
+    previous = db.reports.find_one_and_update(
+        {'_id': report_oid, 'status': {'$ne': new_status}},
+        {'$set': {'status': new_status, 'status_updated_at': datetime.utcnow()}},
+        projection={'location': 1, 'location_key': 1, 'severity': 1, 'status': 1, 'submitted_at': 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if previous is not None:
+        report_rollups.record_status_change(db, previous, new_status)
+    elif db.reports.count_documents({'_id': report_oid}, limit=1) == 0:
+        return jsonify({'error': 'Report not found'}), 404
+    
+    return jsonify({'id': report_id, 'status': new_status})
+
+@app.route('/api/reports/rollups')
+def report_rollups_api():
+    """Heatmap and daily time series of community reports (admins only)"""
+    if not current_user_is_admin():
+        return jsonify({'error': 'Not authorized'}), 403
+    
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    return jsonify(report_rollups.query_rollups(
+        db,
+        days=days,
+        location=request.args.get('location'),
+        severity=request.args.get('severity'),
+        status=request.args.get('status')
+    ))
+
 @app.route('/digital-health-card')
 def digital_health_card():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
     # Get fresh user data from database
-    user = db.users.find_one({'_id': ObjectId(session['user_id'])})
+    user = load_current_user()
     
     # Always recalculate health status to ensure it's current
     health_status = calculate_health_status(user)
@@ -262,12 +437,9 @@ def digital_health_card():
     # Update user's health status in database if it changed
     current_status = user.get('health_status')
     if current_status != health_status:
-        db.users.update_one(
-            {'_id': ObjectId(session['user_id'])},
+        user = update_current_user(
             {'$set': {'health_status': health_status, 'health_status_updated': datetime.utcnow()}}
         )
-        # Refresh user data with updated status
-        user = db.users.find_one({'_id': ObjectId(session['user_id'])})
     
     # Get health status configuration for display
     from config import HEALTH_STATUS_CONFIG
@@ -288,8 +460,6 @@ def profile():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    user = db.users.find_one({'_id': ObjectId(session['user_id'])})
-    
     if request.method == 'POST':
         # Get all form data
         medical_history = [hist for hist in request.form.getlist('medical_history') if hist.strip()]
@@ -306,30 +476,26 @@ def profile():
             'last_updated': datetime.utcnow()
         }
         
-        db.users.update_one(
-            {'_id': ObjectId(session['user_id'])},
-            {'$set': update_data}
+        # Health status depends only on medical history, so it is written in the same update
+        update_data['health_status'] = calculate_health_status(update_data)
+        previous_user = update_current_user(
+            {'$set': update_data},
+            return_document=ReturnDocument.BEFORE
         )
         
-        # Recalculate health status after medical history update
-        updated_user = db.users.find_one({'_id': ObjectId(session['user_id'])})
-        new_health_status = calculate_health_status(updated_user)
-        
-        if new_health_status != user.get('health_status'):
-            db.users.update_one(
-                {'_id': ObjectId(session['user_id'])},
-                {'$set': {'health_status': new_health_status}}
-            )
-            flash(f'Profile updated successfully! Health status updated to {new_health_status.title()}.', 'success')
+        if update_data['health_status'] != previous_user.get('health_status'):
+            flash(f"Profile updated successfully! Health status updated to {update_data['health_status'].title()}.", 'success')
         else:
             flash('Profile updated successfully!', 'success')
         
         session['user_name'] = update_data['name']
         return redirect(url_for('profile'))
     
+    user = load_current_user()
     return render_template('profile.html', user=user)
 
 @app.route('/ai-chat', methods=['GET', 'POST'])
+@limiter.limit(lambda: app.config['RATELIMIT_AI_CHAT'], methods=['POST'], key_func=rate_limit_key)
 def ai_chat():
     if 'user_id' not in session:
         return redirect(url_for('login'))
@@ -338,223 +504,261 @@ def ai_chat():
         user_message = request.form['message']
         language = request.form.get('language', 'en')
         
-        # Get user information for personalized advice
-        user = db.users.find_one({'_id': ObjectId(session['user_id'])})
+        # Red-flag symptoms are answered at once with emergency guidance
+        emergency_response = triage_consultation(session['user_id'], user_message, language)
+        if emergency_response is not None:
+            return jsonify({'status': 'done', 'response': emergency_response})
         
-        # Get AI response with user context
-        ai_response = get_ai_medical_advice(user_message, language, user)
+        # Get user information for personalized advice
+        user = load_current_user(USER_PROMPT_FIELDS)
         
-        # Save chat history
-        chat_data = {
-            'user_id': session['user_id'],
-            'user_message': user_message,
-            'ai_response': ai_response,
-            'language': language,
-            'timestamp': datetime.utcnow()
-        }
-        db.chat_history.insert_one(chat_data)
+        # Hand the consultation to the worker pool and return immediately
+        job_id = ai_jobs.submit(
+            run_ai_consultation, session['user_id'], user_message, language, user,
+            owner=session['user_id']
+        )
         
-        return jsonify({'response': ai_response})
+        return jsonify({
+            'job_id': job_id,
+            'status': 'pending',
+            'result_url': url_for('ai_chat_result', job_id=job_id)
+        }), 202
     
-    # Get chat history
-    chat_history = list(db.chat_history.find({'user_id': session['user_id']}).sort('timestamp', -1).limit(20))
+    # Get the most recent page of chat history, oldest first for display
+    chat_history, next_cursor = fetch_chat_page(session['user_id'])
+    chat_history.reverse()
     
-    return render_template('ai_chat.html', chat_history=chat_history)
+    return render_template('ai_chat.html',
+                         chat_history=chat_history,
+                         next_cursor=next_cursor,
+                         streaming_enabled=app.config['AI_CHAT_STREAMING'])
+
+# Characters of each AI response included in chat history list views
+CHAT_PREVIEW_LENGTH = 280
 
-def get_ai_medical_advice(message, language='en', user=None):
-    """Get medical advice from AI (OpenAI GPT or fallback) with user context"""
+def encode_chat_cursor(chat):
+    """Opaque keyset cursor pointing just past a chat history entry"""
+    return f"{chat['timestamp'].isoformat()}_{chat['_id']}"
+
+def decode_chat_cursor(cursor):
+    """Parse a cursor into (timestamp, ObjectId); raises ValueError if malformed"""
+    timestamp, _, chat_id = cursor.rpartition('_')
     try:
-        if openai_client and user:
-            # Create user context for personalized advice
-            user_context = f"""
-            User Profile:
-            - Age: {user.get('age', 'Unknown')}
-            - Gender: {user.get('gender', 'Unknown')}
-            - Medical History: {', '.join(user.get('medical_history', [])) if user.get('medical_history') else 'No significant medical history'}
-            - Health Status: {user.get('health_status', 'Unknown')}
-            - Blood Group: {user.get('blood_group', 'Unknown')}
-            """
-            
-            system_content = f"""You are MedAether AI, a medical assistant. Provide helpful health advice and information based on the user's profile.
-            
-            {user_context}
-            
-            Important guidelines:
-            - Consider the user's age, gender, and medical history when providing advice
-            - If the user has serious medical conditions (like diabetes, heart disease), mention their relevance to current symptoms
-            - Always remind users to consult healthcare professionals for serious conditions
-            - Keep responses concise, informative, and empathetic
-            - Do not provide specific drug dosages without proper medical consultation
-            - Include relevant precautions and when to seek immediate medical help
-            - Personalize your response based on their medical history
-            """
-            
-            response = openai_client.chat.completions.create(
-                model=app.config['OPENAI_MODEL'],
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_content
-                    },
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=600,
-                temperature=0.3
-            )
-            ai_response = response.choices[0].message.content
-        elif openai_client:
-            # Basic AI response without user context
-            response = openai_client.chat.completions.create(
-                model=app.config['OPENAI_MODEL'],
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are MedAether AI, a medical assistant. Provide helpful health advice and information. 
-                        Always remind users to consult healthcare professionals for serious conditions. 
-                        Keep responses concise, informative, and empathetic. Do not provide specific drug dosages without 
-                        proper medical consultation. Include relevant precautions and when to seek immediate medical help."""
-                    },
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=500,
-                temperature=0.3
-            )
-            ai_response = response.choices[0].message.content
-        else:
-            # Fallback response when API is not configured
-            if user and user.get('medical_history'):
-                conditions = ', '.join(user.get('medical_history', []))
-                ai_response = f"""I'm here to help with general health information. Based on your medical history ({conditions}), I recommend:
-                
-                1. Monitor your symptoms carefully, especially considering your existing conditions
-                2. Stay hydrated and get adequate rest
-                3. Consult your healthcare professional for personalized advice
-                4. Seek immediate medical attention if symptoms worsen or interact with your existing conditions
-                
-                Please note: This is general guidance only and not a substitute for professional medical consultation, especially given your medical history."""
-            else:
-                ai_response = """I'm here to help with general health information. For your specific concern, I recommend:
-                
-                1. Monitor your symptoms carefully
-                2. Stay hydrated and get adequate rest
-                3. Consult a healthcare professional for personalized advice
-                4. Seek immediate medical attention if symptoms worsen
-                
-                Please note: This is general guidance only and not a substitute for professional medical consultation."""
-        
-        # Translate if needed
-        if language != 'en':
-            try:
-                ai_response = translator.translate(ai_response, dest=language).text
-            except:
-                pass  # Continue with English if translation fails
-        
-        return ai_response
-    except Exception as e:
-        print(f"AI consultation error: {e}")
-        return "Sorry, I'm experiencing technical difficulties. Please try again later or consult a healthcare professional directly."
-
-def calculate_health_status(user):
-    """Calculate user's health status based on medical history and conditions"""
-    medical_history = user.get('medical_history', [])
-    
-    # Serious conditions that require immediate medical attention
-    serious_conditions = [
-        'diabetes', 'heart disease', 'cancer', 'kidney disease', 'liver disease',
-        'stroke', 'heart attack', 'coronary artery disease', 'chronic kidney disease',
-        'cirrhosis', 'heart failure', 'chronic obstructive pulmonary disease', 'copd',
-        'tuberculosis', 'tb', 'hiv', 'aids', 'leukemia', 'lymphoma', 'brain tumor',
-        'liver cancer', 'lung cancer', 'breast cancer', 'prostate cancer',
-        'chronic liver disease', 'end stage renal disease', 'cardiomyopathy',
-        'pulmonary embolism', 'deep vein thrombosis', 'aortic aneurysm'
-    ]
-    
-    # Moderate conditions requiring monitoring
-    moderate_conditions = [
-        'hypertension', 'asthma', 'arthritis', 'thyroid', 'anxiety', 'depression',
-        'high blood pressure', 'high cholesterol', 'osteoporosis', 'fibromyalgia',
-        'migraines', 'sleep apnea', 'acid reflux', 'irritable bowel syndrome', 'ibs',
-        'rheumatoid arthritis', 'osteoarthritis', 'hypothyroidism', 'hyperthyroidism',
-        'bipolar disorder', 'schizophrenia', 'epilepsy', 'seizures', 'chronic pain',
-        'psoriasis', 'eczema', 'crohn disease', 'ulcerative colitis', 'gallstones',
-        'kidney stones', 'chronic fatigue syndrome', 'lupus', 'multiple sclerosis',
-        'parkinson', 'alzheimer', 'dementia', 'glaucoma', 'cataracts'
-    ]
+        return datetime.fromisoformat(timestamp), ObjectId(chat_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def fetch_chat_page(user_id, before=None, limit=20):
+    """Return a page of chat history (newest first) and the cursor for the next page.
     
-    # Mild conditions that don't significantly affect daily life
-    mild_conditions = [
-        'allergies', 'seasonal allergies', 'mild asthma', 'occasional headaches',
-        'minor joint pain', 'occasional insomnia', 'hay fever', 'sinusitis',
-        'minor back pain', 'vitamin deficiency', 'iron deficiency', 'anemia'
-    ]
+    Pages are keyed on (timestamp, _id) so older pages cost the same as the first.
+    Only a preview of each AI response is loaded; full bodies are fetched on demand."""
+    query = {'user_id': user_id}
+    if before is not None:
+        before_timestamp, before_id = before
+        query['$or'] = [
+            {'timestamp': {'$lt': before_timestamp}},
+            {'timestamp': before_timestamp, '_id': {'$lt': before_id}}
+        ]
     
-    if not medical_history:
-        return 'green'
+    projection = {
+        'user_message': 1,
+        'language': 1,
+        'timestamp': 1,
+        'ai_preview': {'$substrCP': ['$ai_response', 0, CHAT_PREVIEW_LENGTH]},
+        'ai_length': {'$strLenCP': '$ai_response'}
+    }
+    chats = list(
+        db.chat_history.find(query, projection)
+        .sort([('timestamp', -1), ('_id', -1)])
+        .limit(limit + 1)
+    )
     
-    # Check for serious conditions
-    for condition in serious_conditions:
-        for hist in medical_history:
-            if condition.lower() in hist.lower():
-                return 'red'
+    next_cursor = encode_chat_cursor(chats[limit - 1]) if len(chats) > limit else None
+    chats = chats[:limit]
+    for chat in chats:
+        chat['truncated'] = chat.pop('ai_length', 0) > CHAT_PREVIEW_LENGTH
+    return chats, next_cursor
+
+@app.route('/ai-chat/history')
+def ai_chat_history():
+    """Paginated chat history for infinite scroll"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
     
-    # Check for moderate conditions
-    for condition in moderate_conditions:
-        for hist in medical_history:
-            if condition.lower() in hist.lower():
-                return 'yellow'
+    before = request.args.get('before')
+    try:
+        before = decode_chat_cursor(before) if before else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
     
-    # Check for mild conditions
-    for condition in mild_conditions:
-        for hist in medical_history:
-            if condition.lower() in hist.lower():
-                return 'yellow'  # Even mild conditions warrant yellow status
+    chats, next_cursor = fetch_chat_page(session['user_id'], before, limit)
+    return jsonify({
+        'chats': [{
+            'id': str(chat['_id']),
+            'user_message': chat['user_message'],
+            'ai_preview': chat['ai_preview'],
+            'truncated': chat['truncated'],
+            'language': chat.get('language', 'en'),
+            'timestamp': chat['timestamp'].isoformat()
+        } for chat in chats],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/ai-chat/history/<chat_id>')
+def ai_chat_history_entry(chat_id):
+    """Full AI response for a single chat history entry"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
     
-    # If medical history exists but no specific conditions matched, assume yellow
-    if medical_history:
-        return 'yellow'
+    try:
+        query = {'_id': ObjectId(chat_id), 'user_id': session['user_id']}
+    except Exception:
+        return jsonify({'error': 'Chat not found'}), 404
     
-    # Default to green (healthy)
-    return 'green'
+    chat = db.chat_history.find_one(query, {'ai_response': 1})
+    if chat is None:
+        return jsonify({'error': 'Chat not found'}), 404
+    return jsonify({'id': chat_id, 'ai_response': chat['ai_response']})
 
-def send_report_email(report_data):
-    """Send community report via email to authorities"""
+@app.route('/ai-chat/history/<chat_id>/curate', methods=['POST'])
+def curate_chat_answer(chat_id):
+    """Add or remove a chat answer from the local answer index (admins only)"""
+    if not current_user_is_admin():
+        return jsonify({'error': 'Not authorized'}), 403
+    
+    data = request.get_json(silent=True) or request.form
+    curated = str(data.get('curated', True)).lower() == 'true'
     try:
-        msg = MIMEMultipart()
-        msg['From'] = app.config['EMAIL_USER']
-        msg['To'] = app.config['HEALTH_DEPARTMENT_EMAIL']
-        msg['Subject'] = f"Health Report: {report_data['issue_title']}"
-        
-        body = f"""
-        Health Issue Report
-        
-        Title: {report_data['issue_title']}
-        Location: {report_data['location']}
-        Severity: {report_data['severity']}
-        Description: {report_data['description']}
-        
-        Submitted by User ID: {report_data['user_id']}
-        Submitted at: {report_data['submitted_at']}
-        
-        This report was submitted through the MedAether platform.
-        Please review and take appropriate action as necessary.
-        
-        Best regards,
-        MedAether System
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        server = smtplib.SMTP(app.config['SMTP_SERVER'], app.config['SMTP_PORT'])
-        server.starttls()
-        server.login(app.config['EMAIL_USER'], app.config['EMAIL_PASSWORD'])
-        text = msg.as_string()
-        server.sendmail(app.config['EMAIL_USER'], app.config['HEALTH_DEPARTMENT_EMAIL'], text)
-        server.quit()
+        chat_oid = ObjectId(chat_id)
+    except Exception:
+        return jsonify({'error': 'Chat not found'}), 404
+    
+    result = db.chat_history.update_one(
+        {'_id': chat_oid},
+        {'$set': {'curated': curated, 'curated_at': datetime.utcnow()}}
+    )
+    if result.matched_count == 0:
+        return jsonify({'error': 'Chat not found'}), 404
+    # Other workers and the bot pick the change up on their next refresh
+    if retriever is not None:
+        retriever.rebuild()
+    return jsonify({'id': chat_id, 'curated': curated})
+
+@app.route('/ai-chat/jobs/<job_id>')
+@limiter.limit(lambda: app.config['RATELIMIT_AI_JOBS'], key_func=rate_limit_key)
+def ai_chat_result(job_id):
+    """Poll the status of a submitted AI consultation"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    job = ai_jobs.get(job_id, owner=session['user_id'])
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if job['status'] == 'done':
+        return jsonify({'status': 'done', 'response': job['result']['response']})
+    if job['status'] == 'failed':
+        return jsonify({'status': 'failed', 'response': AI_ERROR_MESSAGE})
+    return jsonify({'status': job['status']}), 202
+
+def run_ai_consultation(user_id, user_message, language, user):
+    """Worker task: get the AI response and save it to chat history"""
+    ai_response = get_ai_medical_advice(user_message, language, user, user_id)
+    
+    # Save chat history
+    chat_data = {
+        'user_id': user_id,
+        'user_message': user_message,
+        'ai_response': ai_response,
+        'language': language,
+        'timestamp': datetime.utcnow()
+    }
+    db.chat_history.insert_one(chat_data)
+    
+    return {'response': ai_response}
+
+def triage_consultation(user_id, user_message, language):
+    """Answer a red-flag message with emergency guidance and save it; None if it is not one"""
+    if not app.config['TRIAGE_ENABLED']:
+        return None
+    category, response = emergency_responder.triage(user_message, language, markdown=False)
+    if category is None:
+        return None
+    
+    db.chat_history.insert_one({
+        'user_id': user_id,
+        'user_message': user_message,
+        'ai_response': response,
+        'language': language,
+        'triage': category,
+        'timestamp': datetime.utcnow()
+    })
+    return response
+
+def sse_event(data, event=None):
+    """Format a Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ''
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+@app.route('/ai-chat/stream', methods=['POST'])
+@limiter.limit(lambda: app.config['RATELIMIT_AI_CHAT'], key_func=rate_limit_key)
+def ai_chat_stream():
+    """Stream the AI response as Server-Sent Events"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    user_message = request.form['message']
+    language = request.form.get('language', 'en')
+    
+    emergency_response = triage_consultation(user_id, user_message, language)
+    if emergency_response is not None:
+        response = Response(sse_event({'response': emergency_response}, event='done'), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    user = load_current_user(USER_PROMPT_FIELDS)
+    
+    def generate():
+        parts = []
+        try:
+            for chunk in stream_ai_medical_advice(user_message, language, user, user_id):
+                parts.append(chunk)
+                yield sse_event({'token': chunk})
+            ai_response = ''.join(parts)
+            yield sse_event({'response': ai_response}, event='done')
+        except Exception as e:
+            print(f"AI streaming error: {e}")
+            ai_response = AI_ERROR_MESSAGE
+            yield sse_event({'response': ai_response}, event='error')
         
-    except Exception as e:
-        print(f"Failed to send email: {e}")
+        # Save chat history once the full reply is known
+        db.chat_history.insert_one({
+            'user_id': user_id,
+            'user_message': user_message,
+            'ai_response': ai_response,
+            'language': language,
+            'timestamp': datetime.utcnow()
+        })
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def get_ai_medical_advice(message, language='en', user=None, user_id=None):
+    """Get medical advice, served from the response cache when possible"""
+    ai_response = consultation_engine.advise(message, language, user, budget_key=user_id)
+    return ai_response if ai_response is not None else AI_ERROR_MESSAGE
+
+def stream_ai_medical_advice(message, language='en', user=None, user_id=None):
+    """Yield the AI response in chunks as they arrive from the model"""
+    return consultation_engine.stream(message, language, user, budget_key=user_id)
 
 @app.route('/translate', methods=['POST'])
+@limiter.limit(lambda: app.config['RATELIMIT_TRANSLATE'], key_func=rate_limit_key)
 def translate_text():
     """Translate text to specified language"""
     data = request.get_json()
@@ -562,8 +766,17 @@ def translate_text():
     target_language = data.get('target_language', 'en')
     
     try:
-        translated = translator.translate(text, dest=target_language)
-        return jsonify({'translated_text': translated.text})
+        # Only translator calls are charged; stored translations are free
+        translated = translation_memory.lookup(text, target_language) if text and target_language != 'en' else text
+        if translated is None:
+            if (translate_budget is not None
+                    and not translate_budget.acquire(rate_limit_key(), estimate_tokens(text))):
+                return jsonify({'translated_text': text, 'translated': False})
+            translated = translation_memory.translate(text, target_language)
+        return jsonify({'translated_text': translated})
+    except (CircuitOpen, DeadlineExceeded):
+        # Translator unhealthy or too slow: answer with the original text
+        return jsonify({'translated_text': text, 'translated': False})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -606,13 +819,11 @@ def update_health_status_route():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user = db.users.find_one({'_id': ObjectId(session['user_id'])})
+    user = load_current_user({'medical_history': 1, 'health_status': 1})
     new_status = calculate_health_status(user)
     
-    db.users.update_one(
-        {'_id': ObjectId(session['user_id'])},
-        {'$set': {'health_status': new_status}}
-    )
+    if new_status != user.get('health_status'):
+        update_current_user({'$set': {'health_status': new_status, 'health_status_updated': datetime.utcnow()}})
     
     return jsonify({'success': True, 'new_status': new_status})
 
@@ -625,7 +836,7 @@ def change_password():
     current_password = request.form['current_password']
     new_password = request.form['new_password']
     
-    user = db.users.find_one({'_id': ObjectId(session['user_id'])})
+    user = load_current_user({'password': 1})
     
     if not check_password_hash(user['password'], current_password):
         return jsonify({'success': False, 'message': 'Current password is incorrect'})
@@ -757,6 +968,23 @@ def ratelimit_handler(e):
 
 # Note: Rate limiting will be applied to existing ai-chat route
 
+# Request latency metrics
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unmatched',
+            method=request.method,
+            status=response.status_code
+        )
+    return response
+
 # Security Headers
 @app.after_request
 def add_security_headers(response):
@@ -776,8 +1004,25 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.utcnow().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'ai_cache': ai_response_cache.stats() if ai_response_cache is not None else None
     })
 
+# Prometheus metrics endpoint
+@app.route('/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Pre-translate fixed responses for every supported language
+if app.config['TRANSLATION_PREWARM'] and translator is not None:
+    translation_memory.prewarm_in_background(
+        [AI_ERROR_MESSAGE, fallback_response()],
+        SUPPORTED_LANGUAGES.keys()
+    )
+# Every worker loads its own emergency table (from MongoDB when already translated)
+if app.config['TRANSLATION_PREWARM']:
+    emergency_responder.prewarm_in_background(SUPPORTED_LANGUAGES.keys())
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Consultation engine benchmark
+Drives ConsultationEngine directly, without Flask or Telegram, against the
+stub backend or the fake OpenAI server, and reports throughput, latency and
+rejected calls for each backend concurrency limit, with or without
+in-flight coalescing of repeated questions. Use it to pick
+AI_BACKEND_CONCURRENCY and AI_BACKEND_QUEUE_TIMEOUT for a given model latency.
+With --stall-rate some stub calls hang for --stall seconds; --breaker and
+--hedge show how the circuit breaker's deadline and hedged attempts bound
+the tail.
+
+Usage:
+    python benchmarks/bench_consultation.py --backend stub --concurrency 4 8 16 --callers 64
+    python benchmarks/bench_consultation.py --backend openai --mode async --latency 0.3
+    python benchmarks/bench_consultation.py --stall-rate 0.05 --stall 20 --timeout 2 --breaker --hedge
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from consultation import ConsultationEngine, OpenAIBackend, StubBackend
+from resilience import CircuitBreaker
+from fake_services import FaultProfile, FakeOpenAIServer
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+class StallingStubBackend(StubBackend):
+    """Stub backend where a share of calls hang, like a degraded model API"""
+
+    def __init__(self, stall_rate, stall, **options):
+        super().__init__(**options)
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.random = random.Random(7)
+
+    def _latency(self):
+        return self.stall if self.random.random() < self.stall_rate else self.latency
+
+    def complete(self, messages, max_tokens, user=None):
+        # A blocking client gives up at its own timeout, as the OpenAI client does
+        latency = self._latency()
+        time.sleep(min(latency, self.timeout))
+        if latency > self.timeout:
+            raise TimeoutError("Stub call timed out")
+        return self.REPLY
+
+    async def acomplete(self, messages, max_tokens, user=None):
+        await asyncio.sleep(self._latency())
+        return self.REPLY
+
+
+def make_backend(args, concurrency, fake_openai):
+    limits = {'max_concurrency': concurrency, 'timeout': args.timeout, 'queue_timeout': args.queue_timeout}
+    if args.backend == 'openai':
+        return OpenAIBackend('benchmark-key', 'fake-model', base_url=fake_openai.url, **limits)
+    if args.stall_rate:
+        return StallingStubBackend(args.stall_rate, args.stall, latency=args.latency, **limits)
+    return StubBackend(latency=args.latency, **limits)
+
+
+def make_breaker(args, backend):
+    if not args.breaker:
+        return None
+    # Every stall should count against the breaker, but the benchmark keeps it closed
+    # so the numbers show deadlines and hedging rather than fast failures
+    return CircuitBreaker(backend.name, args.timeout + args.queue_timeout, hedge=args.hedge,
+                          failure_rate=1.1, max_workers=2 * backend.max_concurrency)
+
+
+def run_sync(engine, questions, callers):
+    latencies = []
+    failures = 0
+
+    def ask(question):
+        started = time.perf_counter()
+        response = engine.advise(question)
+        return time.perf_counter() - started, response is None
+
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        for elapsed, failed in pool.map(ask, questions):
+            latencies.append(elapsed)
+            failures += failed
+    return latencies, failures
+
+
+async def run_async(engine, questions, callers):
+    latencies = []
+    failures = 0
+    pending = iter(questions)
+
+    async def caller():
+        nonlocal failures
+        for question in pending:
+            started = time.perf_counter()
+            response = await engine.aadvise(question)
+            latencies.append(time.perf_counter() - started)
+            failures += response is None
+
+    await asyncio.gather(*(caller() for _ in range(callers)))
+    await engine.aclose()
+    return latencies, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultation engine throughput by backend concurrency")
+    parser.add_argument('--backend', choices=['stub', 'openai'], default='stub')
+    parser.add_argument('--mode', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--callers', type=int, default=64, help="Concurrent callers (threads or tasks)")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.2, help="Model latency (s)")
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--queue-timeout', type=float, default=10)
+    parser.add_argument('--distinct', type=int, default=0,
+                        help="Distinct questions (0 = every request differs); fewer shows coalescing")
+    parser.add_argument('--no-coalesce', action='store_true', help="Disable in-flight coalescing")
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="Share of stub calls that hang")
+    parser.add_argument('--stall', type=float, default=20.0, help="How long a hanging stub call takes (s)")
+    parser.add_argument('--breaker', action='store_true', help="Call the backend through a circuit breaker")
+    parser.add_argument('--hedge', action='store_true', help="Hedge after the p95 latency (needs --breaker)")
+    args = parser.parse_args()
+
+    fake_openai = None
+    if args.backend == 'openai':
+        fake_openai = FakeOpenAIServer(profile=FaultProfile(args.latency, args.latency * 0.2)).start()
+
+    # No response cache, so repeated questions only share work while they are in flight
+    distinct = args.distinct or args.requests
+    questions = [f"I have had a headache for {index % distinct} hours" for index in range(args.requests)]
+    print(f"{'limit':>6} {'requests':>9} {'seconds':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'failed':>7}")
+    try:
+        for concurrency in args.concurrency:
+            backend = make_backend(args, concurrency, fake_openai)
+            engine = ConsultationEngine(backend, coalesce=not args.no_coalesce, breaker=make_breaker(args, backend))
+            started = time.perf_counter()
+            if args.mode == 'async':
+                latencies, failures = asyncio.run(run_async(engine, questions, args.callers))
+            else:
+                latencies, failures = run_sync(engine, questions, args.callers)
+            elapsed = time.perf_counter() - started
+            print(f"{concurrency:>6} {len(questions):>9} {elapsed:>8.2f} {len(questions) / elapsed:>8.1f} "
+                  f"{percentile(latencies, 0.5) * 1000:>8.0f} {percentile(latencies, 0.95) * 1000:>8.0f} "
+                  f"{percentile(latencies, 0.99) * 1000:>8.0f} {max(latencies) * 1000:>8.0f} {failures:>7}")
+    finally:
+        if fake_openai is not None:
+            fake_openai.stop()
+
+
+if __name__ == '__main__':
+    main()
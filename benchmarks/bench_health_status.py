@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for calculate_health_status
+Compares the compiled matcher against the original nested-loop scan
+"""
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import MEDICAL_CONDITIONS
+from health_status import calculate_health_status
+
+
+def legacy_calculate_health_status(user):
+    """The nested-loop implementation the compiled matcher replaced"""
+    medical_history = user.get('medical_history', [])
+    if not medical_history:
+        return 'green'
+    for category, status in (('serious', 'red'), ('moderate', 'yellow'), ('mild', 'yellow')):
+        for condition in MEDICAL_CONDITIONS[category]:
+            for hist in medical_history:
+                if condition.lower() in hist.lower():
+                    return status
+    return 'yellow'
+
+
+FILLER = [
+    'Seasonal Allergies', 'Occasional Headaches', 'Broken arm (2015)', 'Appendectomy',
+    'Vitamin D Deficiency', 'Minor back pain after sports', 'Mild Asthma as a child',
+    'Lactose intolerance', 'Myopia', 'Tonsillectomy in childhood'
+]
+
+
+def make_history(length, serious_at=None):
+    """Build a history of the given length, optionally with a serious condition at the end"""
+    rng = random.Random(length)
+    history = [rng.choice(FILLER) for _ in range(length)]
+    if serious_at is not None and history:
+        history[-1] = serious_at
+    return history
+
+
+def main():
+    print(f"{'entries':>8} {'case':>10} {'legacy (us)':>12} {'compiled (us)':>14} {'speedup':>8}")
+    for length in (1, 10, 100, 1000):
+        for case, serious in (('no match', None), ('serious', 'Aortic aneurysm (repaired)')):
+            user = {'medical_history': make_history(length, serious)}
+            assert calculate_health_status(user) == legacy_calculate_health_status(user)
+
+            number = max(1, 20000 // length)
+            legacy = min(timeit.repeat(lambda: legacy_calculate_health_status(user), number=number, repeat=3)) / number
+            compiled = min(timeit.repeat(lambda: calculate_health_status(user), number=number, repeat=3)) / number
+            print(f"{length:>8} {case:>10} {legacy * 1e6:>12.1f} {compiled * 1e6:>14.1f} {legacy / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
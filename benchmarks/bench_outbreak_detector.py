@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Throughput and accuracy check for the outbreak detector
+Replays a synthetic day of reports across many locations with one injected
+surge and reports how fast OutbreakDetector.observe runs
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from outbreak_detector import OutbreakDetector
+
+
+def make_reports(locations=500, hours=24, per_minute=2000, surge_location='location-7',
+                 surge_hour=18, surge_multiplier=8, seed=42):
+    """Background reports spread over locations, plus a surge at one location for one hour"""
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    names = [f'location-{index}' for index in range(locations)]
+    weights = [1 / (index + 1) for index in range(locations)]  # a few busy places, many quiet ones
+    surge_share = weights[names.index(surge_location)] / sum(weights)
+    reports = []
+    for minute in range(hours * 60):
+        moment = start + timedelta(minutes=minute)
+        batch = rng.choices(names, weights=weights, k=per_minute)
+        if surge_hour * 60 <= minute < (surge_hour + 1) * 60:
+            batch += [surge_location] * int(per_minute * surge_share * (surge_multiplier - 1))
+        for name in batch:
+            reports.append((name, moment + timedelta(seconds=rng.random() * 60)))
+    return reports
+
+
+def main():
+    reports = make_reports()
+    detector = OutbreakDetector()
+    alerts = []
+    started = time.perf_counter()
+    for name, submitted_at in reports:
+        alert = detector.observe(name, name, submitted_at)
+        if alert is not None:
+            alerts.append(alert)
+    elapsed = time.perf_counter() - started
+
+    print(f"{len(reports):,} reports in {elapsed:.2f}s ({len(reports) / elapsed:,.0f} reports/s)")
+    print(f"tracked locations: {len(detector.locations)}")
+    for alert in alerts:
+        print(f"alert: {alert['location']} at {alert['window_end']:%H:%M} "
+              f"({alert['report_count']} reports vs {alert['expected_count']} expected)")
+
+
+if __name__ == '__main__':
+    main()
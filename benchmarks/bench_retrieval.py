@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Local answer index benchmark
+Runs the labeled questions in benchmarks/retrieval_questions.jsonl (expected
+catalog entry, or null when the question should go to the model) through the
+retrieval index at several confidence thresholds and reports hit rate and
+wrong answers, then times lookups with extra synthetic curated answers in the
+index. Use it to pick RETRIEVAL_THRESHOLD.
+
+Usage:
+    python benchmarks/bench_retrieval.py --thresholds 0.6 0.7 0.8 0.9 --curated 0 1000 10000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval import BM25Index, build_documents, np
+
+QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'retrieval_questions.jsonl')
+
+VOCABULARY = (
+    'rash itching swelling dizziness nausea vomiting fatigue insomnia anxiety allergy asthma acne '
+    'back knee shoulder joint muscle ear eye tooth skin throat chest child baby pregnancy elderly '
+    'morning night week month after before eating walking running sleeping exercise water sugar'
+).split()
+
+
+def load_questions(path=QUESTIONS):
+    with open(path, encoding='utf-8') as questions:
+        return [json.loads(line) for line in questions if line.strip()]
+
+
+def synthetic_curated(count, seed=7):
+    rng = random.Random(seed)
+    return [{
+        'user_message': ' '.join(rng.sample(VOCABULARY, rng.randint(3, 7))),
+        'ai_response': f"Curated answer {index}"
+    } for index in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval hit rate by threshold and lookup latency by index size")
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.6, 0.7, 0.8, 0.9])
+    parser.add_argument('--curated', type=int, nargs='+', default=[0, 1000, 10000],
+                        help="Synthetic curated answers added to the catalog for timing")
+    parser.add_argument('--iterations', type=int, default=50, help="Passes over the questions for timing")
+    args = parser.parse_args()
+
+    questions = load_questions()
+    index = BM25Index(build_documents())
+    matches = [index.best(question['text']) for question in questions]
+    print(f"{'threshold':>9} {'hit rate':>9} {'wrong':>6} {'missed':>7}")
+    for threshold in args.thresholds:
+        hits = wrong = missed = 0
+        for question, (document, confidence) in zip(questions, matches):
+            answered = document['title'] if document is not None and confidence >= threshold else None
+            hits += answered is not None
+            wrong += answered is not None and answered != question['expected']
+            missed += answered is None and question['expected'] is not None
+        print(f"{threshold:>9.2f} {hits / len(questions):>9.0%} {wrong:>6} {missed:>7}")
+
+    print(f"\nscoring with {'NumPy' if np is not None else 'pure Python'}")
+    print(f"{'documents':>9} {'build s':>8} {'µs/lookup':>10}")
+    texts = [question['text'] for question in questions]
+    for count in args.curated:
+        started = time.perf_counter()
+        index = BM25Index(build_documents(curated=synthetic_curated(count)))
+        built = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(args.iterations):
+            for text in texts:
+                index.best(text)
+        elapsed = time.perf_counter() - started
+        print(f"{len(index):>9} {built:>8.2f} {elapsed / (args.iterations * len(texts)) * 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Accuracy and speed check for the red-flag triage detector
+Runs triage.detect over the labeled corpus in benchmarks/triage_corpus.jsonl,
+prints every disagreement with the labels, per-language recall and false
+positives, and the time per message. Exits non-zero on any disagreement.
+
+Usage:
+    python benchmarks/bench_triage.py [--iterations 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from triage import detect
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'triage_corpus.jsonl')
+
+
+def load_corpus(path=CORPUS):
+    with open(path, encoding='utf-8') as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Red-flag triage accuracy and latency")
+    parser.add_argument('--iterations', type=int, default=200, help="Passes over the corpus for timing")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    by_language = {}
+    mistakes = 0
+    for example in corpus:
+        predicted = detect(example['text'])
+        stats = by_language.setdefault(example['language'], {'emergencies': 0, 'found': 0, 'false_positives': 0})
+        if example['label'] is not None:
+            stats['emergencies'] += 1
+            stats['found'] += predicted == example['label']
+        elif predicted is not None:
+            stats['false_positives'] += 1
+        if predicted != example['label']:
+            mistakes += 1
+            print(f"expected {example['label']}, got {predicted}: {example['text']}")
+
+    print(f"{'language':>8} {'emergencies':>12} {'recall':>7} {'false +':>8}")
+    for language, stats in sorted(by_language.items()):
+        recall = stats['found'] / stats['emergencies'] if stats['emergencies'] else 1.0
+        print(f"{language:>8} {stats['emergencies']:>12} {recall:>7.0%} {stats['false_positives']:>8}")
+
+    texts = [example['text'] for example in corpus]
+    started = time.perf_counter()
+    for _ in range(args.iterations):
+        for text in texts:
+            detect(text)
+    elapsed = time.perf_counter() - started
+    calls = args.iterations * len(texts)
+    print(f"{len(corpus)} examples, {mistakes} disagreements; "
+          f"{elapsed / calls * 1e6:.1f} µs per message over {calls:,} calls")
+    sys.exit(1 if mistakes else 0)
+
+
+if __name__ == '__main__':
+    main()
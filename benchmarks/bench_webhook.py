@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Webhook throughput benchmark for the MedAether Telegram bot
+Starts the webhook receiver with 1..N worker processes against a fake Bot
+API server, posts synthetic menu-button updates from many users and reports
+updates/sec per worker count. Also checks that every user's replies arrive
+in the order their messages were sent.
+
+Usage:
+    python benchmarks/bench_webhook.py --workers 1 2 4 --users 200 --messages 20
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from fake_services import FaultProfile, FakeTelegramServer, make_telegram_update
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Menu buttons that need no database or model, and a marker identifying each reply
+BUTTONS = [
+    ("🔍 Quick Health Solutions", "QUICK HEALTH SOLUTIONS"),
+    ("💊 Health Plans", "HEALTH PLANS"),
+    ("🆘 Emergency Help", "EMERGENCY CONTACTS"),
+    ("ℹ️ About MedAether", "ABOUT MEDAETHER"),
+]
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_receiver(workers, port, telegram, args):
+    env = dict(os.environ)
+    env.update({
+        'TELEGRAM_BOT_TOKEN': '123456:BENCHMARK',
+        'TELEGRAM_API_BASE_URL': telegram.url,
+        'BOT_WEBHOOK_HOST': '127.0.0.1',
+        'BOT_WEBHOOK_PORT': str(port),
+        'BOT_WEBHOOK_WORKERS': str(workers),
+        'BOT_WEBHOOK_SECRET': 'benchmark-secret',
+        'MONGODB_URI': args.mongodb_uri,
+        # Keep tracking writes buffered for the whole run
+        'BOT_WRITE_FLUSH_MS': str(3600 * 1000),
+        'BOT_WRITE_FLUSH_OPS': str(10 ** 9),
+    })
+    env.pop('BOT_WEBHOOK_URL', None)
+    env.pop('OPENAI_API_KEY', None)
+    process = subprocess.Popen(
+        [sys.executable, os.path.join('telegram_bot', 'webhook.py')],
+        cwd=REPO_ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL
+    )
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("webhook receiver exited during startup")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError("webhook workers did not become ready within 60s")
+
+
+def post_updates(url, users, messages, senders):
+    """Post every user's messages in order, spread over sender threads"""
+    headers = {'X-Telegram-Bot-Api-Secret-Token': 'benchmark-secret'}
+    user_ids = [1000 + index for index in range(users)]
+    counter = iter(range(1, users * messages + 1))
+    counter_lock = threading.Lock()
+
+    def send(my_users):
+        session = requests.Session()
+        for sequence in range(messages):
+            for user_id in my_users:
+                with counter_lock:
+                    update_id = next(counter)
+                text = BUTTONS[(user_id + sequence) % len(BUTTONS)][0]
+                response = session.post(url, json=make_telegram_update(update_id, user_id, text),
+                                        headers=headers, timeout=30)
+                response.raise_for_status()
+
+    threads = [threading.Thread(target=send, args=(user_ids[index::senders],)) for index in range(senders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return user_ids
+
+
+def check_order(telegram, user_ids, messages):
+    """Number of users whose replies arrived out of order"""
+    out_of_order = 0
+    for user_id in user_ids:
+        expected = [BUTTONS[(user_id + sequence) % len(BUTTONS)][1] for sequence in range(messages)]
+        replies = telegram.sent.get(user_id, [])
+        if len(replies) != messages or any(marker not in reply for marker, reply in zip(expected, replies)):
+            out_of_order += 1
+    return out_of_order
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Telegram webhook throughput by worker count")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=20, help="Messages per user")
+    parser.add_argument('--senders', type=int, default=16, help="Concurrent HTTP senders")
+    parser.add_argument('--api-latency', type=float, default=0.02, help="Fake sendMessage latency (s)")
+    parser.add_argument('--mongodb-uri', default='mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=200')
+    parser.add_argument('--verbose', action='store_true', help="Show receiver and worker logs")
+    args = parser.parse_args()
+
+    telegram = FakeTelegramServer(profile=FaultProfile(args.api_latency, args.api_latency * 0.2)).start()
+    total = args.users * args.messages
+    print(f"{'workers':>8} {'updates':>8} {'seconds':>8} {'updates/s':>10} {'out of order':>13}")
+    try:
+        for workers in args.workers:
+            telegram.reset()
+            port = free_port()
+            process = start_receiver(workers, port, telegram, args)
+            try:
+                started = time.perf_counter()
+                user_ids = post_updates(f"http://127.0.0.1:{port}/telegram/webhook",
+                                        args.users, args.messages, args.senders)
+                if not telegram.wait_for_messages(total, timeout=300):
+                    print(f"{workers:>8} timed out with {telegram.sent_count}/{total} replies")
+                    continue
+                elapsed = time.perf_counter() - started
+                print(f"{workers:>8} {total:>8} {elapsed:>8.2f} {total / elapsed:>10.1f} "
+                      f"{check_order(telegram, user_ids, args.messages):>13}")
+            finally:
+                process.terminate()
+                process.wait(60)
+    finally:
+        telegram.stop()
+
+
+if __name__ == '__main__':
+    main()
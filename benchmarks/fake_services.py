@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for MedAether's external dependencies
+Fake OpenAI-compatible, Google Translate, SMTP and Telegram Bot API servers
+with configurable latency and error rates, used by the load-test harnesses
+"""
+
+import base64
+import json
+import os
+import random
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FaultProfile:
+    """Latency and error settings for one fake dependency"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def delay(self, scale=1.0):
+        """Sleep for the configured latency (plus jitter) times scale"""
+        with self.lock:
+            seconds = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        if seconds:
+            time.sleep(seconds * scale)
+
+    def should_fail(self):
+        """Count a request and decide whether it should fail"""
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'errors': self.errors}
+
+
+def generate_self_signed_cert(directory=None):
+    """Create a throwaway certificate for 127.0.0.1/localhost; returns (cert, key) paths"""
+    directory = directory or tempfile.mkdtemp(prefix='medaether-bench-')
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes',
+        '-keyout', key_path, '-out', cert_path, '-days', '1',
+        '-subj', '/CN=localhost',
+        '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1'
+    ], check=True, capture_output=True)
+    return cert_path, key_path
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+
+# Canned advice returned by the fake model, split into words for streaming
+FAKE_ADVICE = (
+    "Based on what you describe, rest and stay well hydrated. Monitor your temperature and symptoms, "
+    "and consider an over-the-counter remedy if appropriate. If symptoms worsen, last more than three "
+    "days, or you develop difficulty breathing, please consult a healthcare professional promptly."
+)
+
+
+class FakeOpenAIServer:
+    """OpenAI-compatible /v1/chat/completions endpoint, streaming and non-streaming"""
+
+    def __init__(self, host='127.0.0.1', port=0, profile=None, tokens_per_second=50):
+        self.profile = profile or FaultProfile()
+        self.tokens_per_second = tokens_per_second
+        server = self
+
+        class Handler(_QuietHandler):
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self.send_json(404, {'error': {'message': 'Not found'}})
+                    return
+                request = json.loads(self.read_body() or b'{}')
+                server.profile.delay()
+                if server.profile.should_fail():
+                    self.send_json(500, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+                    return
+                if request.get('stream'):
+                    server.stream(self, request)
+                else:
+                    server.complete(self, request)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _usage(self, request):
+        prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in request.get('messages', []))
+        completion_tokens = len(FAKE_ADVICE.split())
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+
+    def complete(self, handler, request):
+        handler.send_json(200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'fake-model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': FAKE_ADVICE},
+                'finish_reason': 'stop'
+            }],
+            'usage': self._usage(request)
+        })
+
+    def stream(self, handler, request):
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.close_connection = True
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        words = FAKE_ADVICE.split(' ')
+        for index, word in enumerate(words):
+            token = word if index == 0 else ' ' + word
+            chunk = {
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': request.get('model', 'fake-model'),
+                'choices': [{'index': 0, 'delta': {'content': token}, 'finish_reason': None}]
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            handler.wfile.flush()
+            if self.tokens_per_second:
+                time.sleep(1.0 / self.tokens_per_second)
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='fake-openai', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeTranslateServer:
+    """HTTPS stand-in for the endpoints googletrans calls.
+
+    googletrans always uses https, so the web app must trust the certificate
+    (the harness points SSL_CERT_FILE at it)."""
+
+    def __init__(self, cert_path, key_path, host='127.0.0.1', port=0, profile=None):
+        self.profile = profile or FaultProfile()
+        server = self
+
+        class Handler(_QuietHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path == '/translate_a/single':
+                    server.translate(self, parse_qs(parsed.query))
+                    return
+                # Token page scraped by googletrans' TokenAcquirer
+                body = b"<html><script>tkk:'445678.1618007056'</script></html>"
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                parsed = urlparse(self.path)
+                params = parse_qs(parsed.query)
+                params.update(parse_qs(self.read_body().decode('utf-8')))
+                server.translate(self, params)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+
+    @property
+    def host(self):
+        return f"localhost:{self.httpd.server_address[1]}"
+
+    def translate(self, handler, params):
+        self.profile.delay()
+        if self.profile.should_fail():
+            handler.send_json(503, {'error': 'Injected failure'})
+            return
+        text = (params.get('q') or [''])[0]
+        target = (params.get('tl') or ['en'])[0]
+        source = (params.get('sl') or ['auto'])[0]
+        translated = f"[{target}] {text}"
+        handler.send_json(200, [[[translated, text, None, None, 1]], None, 'en' if source == 'auto' else source])
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='fake-translate', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeSMTPServer:
+    """Minimal SMTP server with STARTTLS and AUTH, as used by send_report_email"""
+
+    def __init__(self, cert_path, key_path, host='127.0.0.1', port=0, profile=None):
+        self.profile = profile or FaultProfile()
+        self.tls_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.tls_context.load_cert_chain(cert_path, key_path)
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.connections = 0
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with server.lock:
+                    server.connections += 1
+                server.converse(self)
+
+        self.tcp = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.tcp.daemon_threads = True
+
+    @property
+    def port(self):
+        return self.tcp.server_address[1]
+
+    def converse(self, handler):
+        connection = handler.connection
+        reader = handler.rfile
+        tls = False
+
+        def send(line):
+            connection.sendall(line.encode('ascii') + b"\r\n")
+
+        send("220 fake-smtp ESMTP ready")
+        while True:
+            line = reader.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                if tls:
+                    send("250-fake-smtp")
+                    send("250 AUTH PLAIN LOGIN")
+                else:
+                    send("250-fake-smtp")
+                    send("250-STARTTLS")
+                    send("250 AUTH PLAIN LOGIN")
+            elif verb == 'STARTTLS':
+                send("220 Ready to start TLS")
+                connection = self.tls_context.wrap_socket(connection, server_side=True)
+                reader = connection.makefile('rb')
+                tls = True
+            elif verb == 'AUTH':
+                parts = command.split()
+                if len(parts) >= 2 and parts[1].upper() == 'LOGIN':
+                    send("334 " + base64.b64encode(b"Username:").decode())
+                    reader.readline()
+                    send("334 " + base64.b64encode(b"Password:").decode())
+                    reader.readline()
+                send("235 Authentication successful")
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                send("250 OK")
+            elif verb == 'DATA':
+                send("354 End data with <CR><LF>.<CR><LF>")
+                while True:
+                    data_line = reader.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                self.profile.delay()
+                if self.profile.should_fail():
+                    send("451 Injected temporary failure")
+                else:
+                    with self.lock:
+                        self.messages += 1
+                    send("250 Message accepted")
+            elif verb == 'QUIT':
+                send("221 Bye")
+                return
+            else:
+                send("502 Command not implemented")
+
+    def stats(self):
+        with self.lock:
+            stats = {'connections': self.connections, 'messages': self.messages}
+        stats.update(self.profile.stats())
+        return stats
+
+    def start(self):
+        threading.Thread(target=self.tcp.serve_forever, name='fake-smtp', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.tcp.shutdown()
+        self.tcp.server_close()
+
+
+class FakeTelegramServer:
+    """Bot API stand-in: answers the methods the bot calls and records sent messages.
+
+    Point the bot at it with TELEGRAM_API_BASE_URL=<server.url>."""
+
+    def __init__(self, host='127.0.0.1', port=0, profile=None):
+        self.profile = profile or FaultProfile()
+        self.lock = threading.Lock()
+        self.sent = {}  # chat_id -> [text, ...] in arrival order
+        self.sent_count = 0
+        self.message_id = 0
+        self.all_sent = threading.Condition(self.lock)
+        server = self
+
+        class Handler(_QuietHandler):
+            def do_GET(self):
+                server.call(self, parse_qs(urlparse(self.path).query))
+
+            def do_POST(self):
+                body = self.read_body()
+                if self.headers.get('Content-Type', '').startswith('application/json'):
+                    params = json.loads(body or b'{}')
+                else:
+                    params = {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+                server.call(self, params)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def call(self, handler, params):
+        method = urlparse(handler.path).path.rsplit('/', 1)[-1]
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'MedAether', 'username': 'medaether_bot',
+                      'can_join_groups': False, 'can_read_all_group_messages': False,
+                      'supports_inline_queries': False}
+        elif method == 'sendMessage':
+            self.profile.delay()
+            if self.profile.should_fail():
+                handler.send_json(429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                        'parameters': {'retry_after': 1}})
+                return
+            chat_id = int(params.get('chat_id'))
+            with self.lock:
+                self.message_id += 1
+                message_id = self.message_id
+                self.sent.setdefault(chat_id, []).append(params.get('text', ''))
+                self.sent_count += 1
+                self.all_sent.notify_all()
+            result = {'message_id': message_id, 'date': int(time.time()),
+                      'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')}
+        elif method in ('setWebhook', 'deleteWebhook', 'setMyCommands'):
+            result = True
+        else:
+            handler.send_json(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            return
+        handler.send_json(200, {'ok': True, 'result': result})
+
+    def wait_for_messages(self, count, timeout):
+        """Block until count messages were sent in total; returns whether they were"""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while self.sent_count < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.all_sent.wait(remaining)
+            return True
+
+    def reset(self):
+        with self.lock:
+            self.sent = {}
+            self.sent_count = 0
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='fake-telegram', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_telegram_update(update_id, user_id, text):
+    """A private-chat text message update as Telegram would post it"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private', 'first_name': f'User{user_id}'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}', 'language_code': 'en'},
+        'text': text
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for MedAether
+Boots app:app under gunicorn with the Dockerfile's worker settings against a
+local mongod and fake OpenAI, Google Translate and SMTP servers, drives a mix
+of user scenarios and records per-route latency percentiles as JSON.
+
+Usage:
+    python benchmarks/loadtest.py --users 16 --duration 60
+    python benchmarks/loadtest.py --compare benchmarks/results/previous.json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import requests
+
+from fake_services import (
+    FaultProfile, FakeOpenAIServer, FakeTranslateServer, FakeSMTPServer, generate_self_signed_cert
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+# Relative frequency of each scenario in the workload mix
+SCENARIO_WEIGHTS = {
+    'ai_chat': 4,
+    'digital_health_card': 3,
+    'profile_update': 2,
+    'community_report': 1,
+    'login': 1
+}
+
+SAMPLE_QUESTIONS = [
+    "I have fever, what should I do?",
+    "fever what to do",
+    "How can I sleep better?",
+    "I have a headache and feel nauseous",
+    "What foods are good for diabetes?",
+    "My child has a cough at night",
+    "Is it safe to exercise with asthma?"
+]
+
+SAMPLE_HISTORIES = [[], ['Seasonal allergies'], ['Hypertension', 'High cholesterol'], ['Type 2 diabetes']]
+
+
+def dockerfile_gunicorn_settings():
+    """Read workers, threads and timeout from the Dockerfile's gunicorn CMD"""
+    settings = {'workers': 2, 'threads': 4, 'timeout': 120}
+    with open(os.path.join(REPO_ROOT, 'Dockerfile')) as f:
+        match = re.search(r'^CMD\s+(\[.*\])\s*$', f.read(), re.MULTILINE)
+    if match:
+        args = json.loads(match.group(1))
+        for name in settings:
+            flag = f"--{name}"
+            if flag in args:
+                settings[name] = int(args[args.index(flag) + 1])
+    return settings
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Thread-safe latency samples per route label"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, label, seconds, ok=True):
+        with self.lock:
+            self.samples[label].append(seconds)
+            if not ok:
+                self.errors[label] += 1
+
+    def summary(self, elapsed):
+        routes = {}
+        with self.lock:
+            for label, values in sorted(self.samples.items()):
+                values = sorted(values)
+                routes[label] = {
+                    'count': len(values),
+                    'errors': self.errors[label],
+                    'rps': round(len(values) / elapsed, 2) if elapsed else 0,
+                    'mean_ms': round(sum(values) / len(values) * 1000, 2),
+                    'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+                    'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+                    'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                    'max_ms': round(values[-1] * 1000, 2)
+                }
+        return routes
+
+
+class VirtualUser:
+    """One simulated browser session"""
+
+    def __init__(self, index, base_url, recorder, rng):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.session = requests.Session()
+        self.email = f"loadtest-{index}@example.com"
+        self.password = 'loadtest123'
+
+    def timed(self, label, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=130, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.record(label, time.perf_counter() - started, ok)
+        return response
+
+    def signup(self):
+        self.session.post(self.base_url + '/signup', data={
+            'name': 'Load Test', 'email': self.email, 'password': self.password,
+            'age': str(self.rng.randint(18, 80)), 'gender': self.rng.choice(['male', 'female', 'other'])
+        }, timeout=30)
+
+    def login(self):
+        self.session.cookies.clear()
+        self.timed('POST /login', 'POST', '/login', data={'email': self.email, 'password': self.password})
+
+    def ai_chat(self):
+        data = {'message': self.rng.choice(SAMPLE_QUESTIONS), 'language': self.rng.choice(['en', 'en', 'en', 'es', 'hi'])}
+        started = time.perf_counter()
+        first_byte = None
+        ok = False
+        try:
+            with self.session.post(self.base_url + '/ai-chat/stream', data=data, stream=True, timeout=130) as response:
+                for chunk in response.iter_content(chunk_size=None):
+                    if first_byte is None and chunk:
+                        first_byte = time.perf_counter() - started
+                ok = response.status_code < 400
+        except requests.RequestException:
+            pass
+        self.recorder.record('POST /ai-chat/stream', time.perf_counter() - started, ok)
+        if first_byte is not None:
+            self.recorder.record('POST /ai-chat/stream (first byte)', first_byte, ok)
+
+    def ai_chat_job(self):
+        data = {'message': self.rng.choice(SAMPLE_QUESTIONS), 'language': 'en'}
+        started = time.perf_counter()
+        response = self.timed('POST /ai-chat', 'POST', '/ai-chat', data=data)
+        ok = False
+        if response is not None and response.status_code == 202:
+            result_url = response.json()['result_url']
+            while time.perf_counter() - started < 130:
+                time.sleep(0.25)
+                poll = self.timed('GET /ai-chat/jobs/<id>', 'GET', result_url)
+                if poll is not None and poll.json().get('status') in ('done', 'failed'):
+                    ok = poll.json()['status'] == 'done'
+                    break
+        self.recorder.record('ai-chat job (end to end)', time.perf_counter() - started, ok)
+
+    def digital_health_card(self):
+        self.timed('GET /digital-health-card', 'GET', '/digital-health-card')
+
+    def profile_update(self):
+        self.timed('POST /profile', 'POST', '/profile', data={
+            'name': 'Load Test', 'age': str(self.rng.randint(18, 80)), 'gender': 'other',
+            'medical_history': self.rng.choice(SAMPLE_HISTORIES), 'blood_group': 'O+'
+        })
+
+    def community_report(self):
+        self.timed('POST /community-reports', 'POST', '/community-reports', data={
+            'issue_title': 'Water quality concern',
+            'description': 'Unusual taste in tap water reported by several households.',
+            'location': self.rng.choice(['Downtown', 'Riverside', 'North Hills']),
+            'severity': self.rng.choice(['low', 'medium', 'high'])
+        })
+
+
+def run_workload(base_url, users, duration, seed, include_jobs):
+    """Drive the weighted scenario mix from concurrent virtual users"""
+    recorder = Recorder()
+    weights = dict(SCENARIO_WEIGHTS)
+    if include_jobs:
+        weights['ai_chat_job'] = weights['ai_chat']
+    scenarios, scenario_weights = zip(*weights.items())
+
+    virtual_users = [VirtualUser(i, base_url, recorder, random.Random(seed + i)) for i in range(users)]
+    for user in virtual_users:
+        user.signup()
+        user.login()
+
+    deadline = time.monotonic() + duration
+
+    def loop(user):
+        while time.monotonic() < deadline:
+            scenario = user.rng.choices(scenarios, scenario_weights)[0]
+            getattr(user, scenario)()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=loop, args=(user,), daemon=True) for user in virtual_users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.summary(time.monotonic() - started), time.monotonic() - started
+
+
+def start_gunicorn(port, settings, env):
+    command = [
+        sys.executable, '-m', 'gunicorn', '--bind', f"127.0.0.1:{port}",
+        '--workers', str(settings['workers']), '--threads', str(settings['threads']),
+        '--timeout', str(settings['timeout']), 'app:app'
+    ]
+    print(f"Starting: {' '.join(shlex.quote(part) for part in command)}")
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError("gunicorn did not become healthy within 30s")
+
+
+def compare(current, previous_path):
+    """Print p50/p95/p99 deltas against an earlier result file"""
+    with open(previous_path) as f:
+        previous = json.load(f)['routes']
+    print(f"\n{'route':<36} {'p50':>16} {'p95':>16} {'p99':>16} {'rps':>14}")
+    for label, stats in current.items():
+        before = previous.get(label)
+        if not before:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps'):
+            cells.append(f"{before[key]:>7}->{stats[key]:<7}")
+        print(f"{label:<36} " + ' '.join(f"{cell:>16}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MedAether end-to-end load test")
+    parser.add_argument('--users', type=int, default=16, help="Concurrent virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to drive load")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mongodb-uri', default=os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--db-name', default='medaether_loadtest')
+    parser.add_argument('--openai-latency', type=float, default=1.0)
+    parser.add_argument('--openai-error-rate', type=float, default=0.0)
+    parser.add_argument('--openai-tokens-per-second', type=float, default=50)
+    parser.add_argument('--translate-latency', type=float, default=0.2)
+    parser.add_argument('--translate-error-rate', type=float, default=0.0)
+    parser.add_argument('--smtp-latency', type=float, default=0.3)
+    parser.add_argument('--smtp-error-rate', type=float, default=0.0)
+    parser.add_argument('--include-jobs', action='store_true', help="Also exercise the job-queue /ai-chat path")
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/loadtest-<timestamp>.json)")
+    parser.add_argument('--compare', help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    MongoClient(args.mongodb_uri).drop_database(args.db_name)
+
+    cert_path, key_path = generate_self_signed_cert()
+    openai_server = FakeOpenAIServer(
+        profile=FaultProfile(args.openai_latency, args.openai_latency * 0.2, args.openai_error_rate, args.seed),
+        tokens_per_second=args.openai_tokens_per_second
+    ).start()
+    translate_server = FakeTranslateServer(
+        cert_path, key_path,
+        profile=FaultProfile(args.translate_latency, args.translate_latency * 0.2, args.translate_error_rate, args.seed)
+    ).start()
+    smtp_server = FakeSMTPServer(
+        cert_path, key_path,
+        profile=FaultProfile(args.smtp_latency, args.smtp_latency * 0.2, args.smtp_error_rate, args.seed)
+    ).start()
+
+    settings = dockerfile_gunicorn_settings()
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        'FLASK_ENV': 'development',
+        'SECRET_KEY': 'loadtest-secret',
+        'MONGODB_URI': args.mongodb_uri,
+        'MONGODB_DB_NAME': args.db_name,
+        'OPENAI_API_KEY': 'sk-loadtest',
+        'OPENAI_BASE_URL': openai_server.url,
+        'GOOGLE_TRANSLATE_SERVICE_URLS': translate_server.host,
+        'SSL_CERT_FILE': cert_path,
+        'SMTP_SERVER': '127.0.0.1',
+        'SMTP_PORT': str(smtp_server.port),
+        'EMAIL_USER': 'loadtest@example.com',
+        'EMAIL_PASSWORD': 'loadtest',
+        'RATELIMIT_ENABLED': 'False'
+    })
+
+    process = start_gunicorn(port, settings, env)
+    try:
+        routes, elapsed = run_workload(
+            f"http://127.0.0.1:{port}", args.users, args.duration, args.seed, args.include_jobs
+        )
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+        for server in (openai_server, translate_server, smtp_server):
+            server.stop()
+
+    result = {
+        'started_at': datetime.utcnow().isoformat(),
+        'elapsed_seconds': round(elapsed, 2),
+        'gunicorn': settings,
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'dependencies': {
+            'openai': openai_server.profile.stats(),
+            'translate': translate_server.profile.stats(),
+            'smtp': smtp_server.stats()
+        },
+        'routes': routes
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"\n{'route':<36} {'count':>7} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for label, stats in routes.items():
+        print(f"{label:<36} {stats['count']:>7} {stats['errors']:>5} {stats['rps']:>8} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        compare(routes, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+In-process caching utilities for MedAether
+Thread-safe LRU cache with TTL expiry, per-entry size cap and hit/miss counters
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+def _default_size(value):
+    """Approximate size of a cached value in bytes"""
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return len(repr(value))
+
+
+class LRUCache:
+    """Least-recently-used cache with time-to-live eviction"""
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, max_entry_size=None, size_func=_default_size):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_entry_size = max_entry_size
+        self.size_func = size_func
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Like get(), but neither counted as a hit or miss nor marked as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store a value; returns False if it exceeds the per-entry size cap"""
+        if self.max_entry_size is not None and self.size_func(value) > self.max_entry_size:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        ttl = self.ttl_seconds if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def delete(self, key):
+        """Remove a key if present"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return cache counters as a dict"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'rejected': self.rejected
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
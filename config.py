@@ -18,9 +18,44 @@ class Config:
     # AI Configuration
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
     OPENAI_MODEL = os.environ.get('OPENAI_MODEL') or 'gpt-3.5-turbo'
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL')  # None uses the official API
     HUGGINGFACE_API_TOKEN = os.environ.get('HUGGINGFACE_API_TOKEN')
     RASA_ENDPOINT_URL = os.environ.get('RASA_ENDPOINT_URL') or 'http://localhost:5005'
     
+    # AI Response Cache
+    AI_CACHE_ENABLED = os.environ.get('AI_CACHE_ENABLED', 'True').lower() == 'true'
+    AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES') or 2048)
+    AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL') or 6 * 3600)  # seconds
+    AI_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('AI_CACHE_MAX_ENTRY_BYTES') or 16 * 1024)
+    
+    # AI Consultation Workers
+    AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS') or 4)  # per web worker process
+    AI_JOB_TIMEOUT = int(os.environ.get('AI_JOB_TIMEOUT') or 120)  # seconds
+    AI_CHAT_STREAMING = os.environ.get('AI_CHAT_STREAMING', 'True').lower() == 'true'
+    
+    # AI Consultation Backend (shared by the web app and the Telegram bot)
+    AI_BACKEND = os.environ.get('AI_BACKEND') or 'auto'  # auto, openai, static or stub
+    AI_BACKEND_CONCURRENCY = int(os.environ.get('AI_BACKEND_CONCURRENCY') or 8)  # in-flight model calls per process
+    AI_BACKEND_TIMEOUT = float(os.environ.get('AI_BACKEND_TIMEOUT') or 30)  # seconds per model call
+    AI_BACKEND_QUEUE_TIMEOUT = float(os.environ.get('AI_BACKEND_QUEUE_TIMEOUT') or 10)  # seconds to wait for a free slot
+    AI_STUB_LATENCY = float(os.environ.get('AI_STUB_LATENCY') or 0.5)  # seconds, stub backend only
+    AI_COALESCE_ENABLED = os.environ.get('AI_COALESCE_ENABLED', 'True').lower() == 'true'  # share identical in-flight calls
+    AI_COALESCE_TIMEOUT = float(os.environ.get('AI_COALESCE_TIMEOUT') or 45)  # seconds a duplicate waits before the fallback
+    TRIAGE_ENABLED = os.environ.get('TRIAGE_ENABLED', 'True').lower() == 'true'  # answer red-flag symptoms without the AI
+    RETRIEVAL_ENABLED = os.environ.get('RETRIEVAL_ENABLED', 'True').lower() == 'true'  # answer common questions from the local index
+    RETRIEVAL_THRESHOLD = float(os.environ.get('RETRIEVAL_THRESHOLD') or 0.8)  # minimum confidence (0-1) for a local answer
+    RETRIEVAL_REFRESH_INTERVAL = int(os.environ.get('RETRIEVAL_REFRESH_INTERVAL') or 600)  # seconds between index rebuilds, 0 = never
+    RETRIEVAL_MAX_CURATED = int(os.environ.get('RETRIEVAL_MAX_CURATED') or 5000)  # curated chat answers indexed
+    AI_SLOW_CALL = float(os.environ.get('AI_SLOW_CALL') or 20)  # seconds; slower model calls count against the breaker
+    AI_HEDGE_ENABLED = os.environ.get('AI_HEDGE_ENABLED', 'False').lower() == 'true'  # second model call after the p95 latency
+    
+    # Circuit breakers for OpenAI and the translator
+    CIRCUIT_BREAKER_ENABLED = os.environ.get('CIRCUIT_BREAKER_ENABLED', 'True').lower() == 'true'
+    CIRCUIT_WINDOW = float(os.environ.get('CIRCUIT_WINDOW') or 60)  # seconds of calls each breaker looks at
+    CIRCUIT_MIN_CALLS = int(os.environ.get('CIRCUIT_MIN_CALLS') or 10)  # calls in the window before a breaker can open
+    CIRCUIT_FAILURE_RATE = float(os.environ.get('CIRCUIT_FAILURE_RATE') or 0.5)  # failed or slow share that opens it
+    CIRCUIT_COOLDOWN = float(os.environ.get('CIRCUIT_COOLDOWN') or 30)  # seconds open before a trial call
+    
     # Telegram Bot Configuration
     TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
     TELEGRAM_BOT_USERNAME = os.environ.get('TELEGRAM_BOT_USERNAME') or 'medaether_bot'
@@ -31,9 +66,39 @@ class Config:
     EMAIL_USER = os.environ.get('EMAIL_USER')
     EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD')
     EMAIL_RECIPIENTS = os.environ.get('EMAIL_RECIPIENTS') or 'healthauthorities@example.com'
+    SMTP_IDLE_TIMEOUT = int(os.environ.get('SMTP_IDLE_TIMEOUT') or 60)  # seconds before closing an idle connection
+    
+    # Email Outbox
+    EMAIL_SENDER_IN_PROCESS = os.environ.get('EMAIL_SENDER_IN_PROCESS', 'True').lower() == 'true'
+    EMAIL_OUTBOX_POLL_INTERVAL = float(os.environ.get('EMAIL_OUTBOX_POLL_INTERVAL') or 5)
+    EMAIL_OUTBOX_LEASE = int(os.environ.get('EMAIL_OUTBOX_LEASE') or 120)
+    EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS') or 8)
+    EMAIL_OUTBOX_BACKOFF_BASE = float(os.environ.get('EMAIL_OUTBOX_BACKOFF_BASE') or 30)
+    EMAIL_OUTBOX_BACKOFF_MAX = float(os.environ.get('EMAIL_OUTBOX_BACKOFF_MAX') or 3600)
+    
+    # Report Digests (0 sends every report individually)
+    EMAIL_DIGEST_WINDOW = int(os.environ.get('EMAIL_DIGEST_WINDOW') or 0)  # seconds
+    EMAIL_DIGEST_BYPASS_SEVERITIES = os.environ.get('EMAIL_DIGEST_BYPASS_SEVERITIES') or 'high,urgent'  # sent immediately
+    
+    # Outbreak Detection
+    OUTBREAK_WINDOW_MINUTES = int(os.environ.get('OUTBREAK_WINDOW_MINUTES') or 60)
+    OUTBREAK_BUCKET_SECONDS = int(os.environ.get('OUTBREAK_BUCKET_SECONDS') or 60)
+    OUTBREAK_EWMA_ALPHA = float(os.environ.get('OUTBREAK_EWMA_ALPHA') or 0.1)  # weight of the latest window in the baseline
+    OUTBREAK_THRESHOLD = float(os.environ.get('OUTBREAK_THRESHOLD') or 3.0)  # multiple of the baseline
+    OUTBREAK_MIN_REPORTS = int(os.environ.get('OUTBREAK_MIN_REPORTS') or 5)
+    OUTBREAK_COOLDOWN_MINUTES = int(os.environ.get('OUTBREAK_COOLDOWN_MINUTES') or 60)
+    OUTBREAK_MAX_LOCATIONS = int(os.environ.get('OUTBREAK_MAX_LOCATIONS') or 10000)
+    OUTBREAK_POLL_INTERVAL = float(os.environ.get('OUTBREAK_POLL_INTERVAL') or 2)
+    OUTBREAK_METRICS_PORT = int(os.environ.get('OUTBREAK_METRICS_PORT') or 0)  # 0 disables the metrics endpoint
     
     # Google Translate API
     GOOGLE_TRANSLATE_API_KEY = os.environ.get('GOOGLE_TRANSLATE_API_KEY')
+    GOOGLE_TRANSLATE_SERVICE_URLS = os.environ.get('GOOGLE_TRANSLATE_SERVICE_URLS')  # comma-separated hosts
+    TRANSLATION_MEMORY_MAX_ENTRIES = int(os.environ.get('TRANSLATION_MEMORY_MAX_ENTRIES') or 4096)
+    TRANSLATION_PREWARM = os.environ.get('TRANSLATION_PREWARM', 'True').lower() == 'true'
+    TRANSLATE_TIMEOUT = float(os.environ.get('TRANSLATE_TIMEOUT') or 5)  # seconds per translator call
+    TRANSLATE_SLOW_CALL = float(os.environ.get('TRANSLATE_SLOW_CALL') or 2)  # seconds; slower calls count against the breaker
+    TRANSLATE_HEDGE_ENABLED = os.environ.get('TRANSLATE_HEDGE_ENABLED', 'True').lower() == 'true'  # retry after the p95 latency
     
     # File Upload Configuration
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
@@ -46,8 +111,21 @@ class Config:
     PERMANENT_SESSION_LIFETIME = timedelta(seconds=int(os.environ.get('PERMANENT_SESSION_LIFETIME') or 86400))
     
     # Rate Limiting
-    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL') or 'memory://'
-    RATELIMIT_DEFAULT = os.environ.get('RATELIMIT_DEFAULT') or '100 per hour'
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'True').lower() == 'true'
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL') or MONGODB_URI  # shared by every worker
+    RATELIMIT_DEFAULT = os.environ.get('RATELIMIT_DEFAULT') or '2000 per day;300 per hour'  # per user, else per address
+    RATELIMIT_AI_CHAT = os.environ.get('RATELIMIT_AI_CHAT') or '30 per minute'  # per signed-in user
+    RATELIMIT_TRANSLATE = os.environ.get('RATELIMIT_TRANSLATE') or '30 per minute'  # per user, else per address
+    RATELIMIT_AI_JOBS = os.environ.get('RATELIMIT_AI_JOBS') or '180 per minute'  # job polling, once a second per question
+    
+    # Per-user token budgets shared by the web workers and the bot (MongoDB token_buckets)
+    TOKEN_BUDGET_ENABLED = os.environ.get('TOKEN_BUDGET_ENABLED', 'True').lower() == 'true'
+    AI_TOKENS_PER_HOUR = int(os.environ.get('AI_TOKENS_PER_HOUR') or 20000)  # a consultation costs about 800
+    AI_TOKEN_BURST = int(os.environ.get('AI_TOKEN_BURST') or 4000)
+    AI_BUDGET_MAX_WAIT = float(os.environ.get('AI_BUDGET_MAX_WAIT') or 20)  # seconds queued before the fallback advice
+    TRANSLATE_TOKENS_PER_HOUR = int(os.environ.get('TRANSLATE_TOKENS_PER_HOUR') or 20000)
+    TRANSLATE_TOKEN_BURST = int(os.environ.get('TRANSLATE_TOKEN_BURST') or 4000)
+    TRANSLATE_BUDGET_MAX_WAIT = float(os.environ.get('TRANSLATE_BUDGET_MAX_WAIT') or 2)  # seconds before answering untranslated
     
     # Logging Configuration
     LOG_LEVEL = os.environ.get('LOG_LEVEL') or 'INFO'
@@ -104,6 +182,10 @@ class TestingConfig(Config):
     
     # Disable CSRF for testing
     WTF_CSRF_ENABLED = False
+    
+    # Keep rate limits in process and skip token budgets for testing
+    RATELIMIT_STORAGE_URL = 'memory://'
+    TOKEN_BUDGET_ENABLED = False
 
 # Configuration mapping
 config = {
@@ -142,23 +224,38 @@ HEALTH_STATUS_CONFIG = {
 
 # Medical Conditions Categorization
 MEDICAL_CONDITIONS = {
+    # Serious conditions that require immediate medical attention
     'serious': [
         'diabetes', 'heart disease', 'cancer', 'kidney disease', 'liver disease',
         'stroke', 'heart attack', 'coronary artery disease', 'chronic kidney disease',
-        'cirrhosis', 'heart failure', 'chronic obstructive pulmonary disease',
-        'tuberculosis', 'hiv', 'aids'
+        'cirrhosis', 'heart failure', 'chronic obstructive pulmonary disease', 'copd',
+        'tuberculosis', 'tb', 'hiv', 'aids', 'leukemia', 'lymphoma', 'brain tumor',
+        'liver cancer', 'lung cancer', 'breast cancer', 'prostate cancer',
+        'chronic liver disease', 'end stage renal disease', 'cardiomyopathy',
+        'pulmonary embolism', 'deep vein thrombosis', 'aortic aneurysm'
     ],
+    # Moderate conditions requiring monitoring
     'moderate': [
         'hypertension', 'asthma', 'arthritis', 'thyroid', 'anxiety', 'depression',
         'high blood pressure', 'high cholesterol', 'osteoporosis', 'fibromyalgia',
-        'migraines', 'sleep apnea', 'acid reflux', 'irritable bowel syndrome'
+        'migraines', 'sleep apnea', 'acid reflux', 'irritable bowel syndrome', 'ibs',
+        'rheumatoid arthritis', 'osteoarthritis', 'hypothyroidism', 'hyperthyroidism',
+        'bipolar disorder', 'schizophrenia', 'epilepsy', 'seizures', 'chronic pain',
+        'psoriasis', 'eczema', 'crohn disease', 'ulcerative colitis', 'gallstones',
+        'kidney stones', 'chronic fatigue syndrome', 'lupus', 'multiple sclerosis',
+        'parkinson', 'alzheimer', 'dementia', 'glaucoma', 'cataracts'
     ],
+    # Mild conditions that don't significantly affect daily life
     'mild': [
         'allergies', 'seasonal allergies', 'mild asthma', 'occasional headaches',
-        'minor joint pain', 'occasional insomnia'
+        'minor joint pain', 'occasional insomnia', 'hay fever', 'sinusitis',
+        'minor back pain', 'vitamin deficiency', 'iron deficiency', 'anemia'
     ]
 }
 
+# Community Report Statuses
+REPORT_STATUSES = ['pending', 'in_progress', 'resolved']
+
 # Supported Languages
 SUPPORTED_LANGUAGES = {
     'en': 'English',
@@ -193,7 +290,25 @@ Please review and take appropriate action as necessary.
 
 Best regards,
 MedAether Team
-        """
+        """,
+        # Consolidated message for reports batched over EMAIL_DIGEST_WINDOW
+        'digest_subject': 'Community Health Digest: {count} {severity} report(s) in {location}',
+        'digest_body': """
+Dear Health Authorities,
+
+{count} community health report(s) with {severity} severity were submitted for
+{location} between {window_start} and {window_end} UTC:
+{reports}
+Please review and take appropriate action as necessary.
+
+Best regards,
+MedAether Team
+        """,
+        'digest_item': """
+{index}. {issue_title}
+   Submitted: {submitted_at} by User ID {user_id}
+   {description}
+"""
     },
     'welcome': {
         'subject': 'Welcome to MedAether!',
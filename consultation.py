@@ -0,0 +1,680 @@
+"""
+Consultation engine for MedAether
+Turns a health question into advice for both the web app and the Telegram bot:
+one set of prompts and token limits, a pluggable model backend (OpenAI, the
+static fallback advice, or a local stub for benchmarks) behind a per-backend
+concurrency limit and timeout, an optional circuit breaker, per-user token
+budgets, an optional response cache and translation.
+"""
+
+import asyncio
+import functools
+import hashlib
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+import metrics
+from resilience import CircuitOpen, DeadlineExceeded, create_breaker
+from singleflight import FollowerTimeout, SingleFlight
+from token_budget import estimate_chat_tokens
+
+try:
+    import openai
+except ImportError:
+    openai = None
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+AI_ERROR_MESSAGE = "Sorry, I'm experiencing technical difficulties. Please try again later or consult a healthcare professional directly."
+
+CONSULTATION_DURATION = metrics.REGISTRY.histogram(
+    'medaether_consultation_duration_seconds',
+    'Model backend call latency by backend and outcome (success, error, timeout, busy, open)',
+    ('backend', 'outcome')
+)
+
+# Filler words dropped when normalizing questions for the response cache.
+# Negations are deliberately kept since they change the meaning of a question.
+CACHE_STOPWORDS = frozenset([
+    'a', 'an', 'the', 'i', 'im', 'me', 'my', 'have', 'has', 'had', 'having', 'am', 'is', 'are',
+    'was', 'be', 'been', 'do', 'does', 'did', 'what', 'should', 'can', 'could', 'would', 'to',
+    'for', 'of', 'and', 'or', 'with', 'please', 'help', 'got', 'getting', 'some', 'any', 'it',
+    'this', 'that', 'so', 'very', 'really', 'how', 'about', 'tell', 'from', 'suffering'
+])
+
+
+def normalize_message(message):
+    """Normalize a question so that near-identical phrasings share a cache key"""
+    words = re.findall(r'\w+', (message or '').lower())
+    terms = sorted(set(word for word in words if word not in CACHE_STOPWORDS))
+    return ' '.join(terms) if terms else ' '.join(words)
+
+
+def profile_fingerprint(user, language='en'):
+    """Fingerprint of the profile fields that go into the AI prompt"""
+    if not user:
+        parts = ['anonymous', language]
+    else:
+        try:
+            age_band = f"{int(user.get('age')) // 10 * 10}s"
+        except (TypeError, ValueError):
+            age_band = 'unknown'
+        history = sorted(str(item).strip().lower() for item in user.get('medical_history') or [])
+        parts = [
+            age_band,
+            str(user.get('gender', '')).lower(),
+            '|'.join(history),
+            str(user.get('blood_group', '')).upper(),
+            language
+        ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
+def cache_key(message, language='en', user=None):
+    """Response cache key for a question asked by a profile in a language"""
+    return f"{profile_fingerprint(user, language)}:{normalize_message(message)}"
+
+
+def build_messages(message, user=None):
+    """Build the chat completion messages and token limit for a consultation"""
+    if user:
+        # Create user context for personalized advice
+        user_context = f"""
+        User Profile:
+        - Age: {user.get('age', 'Unknown')}
+        - Gender: {user.get('gender', 'Unknown')}
+        - Medical History: {', '.join(user.get('medical_history', [])) if user.get('medical_history') else 'No significant medical history'}
+        - Health Status: {user.get('health_status', 'Unknown')}
+        - Blood Group: {user.get('blood_group', 'Unknown')}
+        """
+
+        system_content = f"""You are MedAether AI, a medical assistant. Provide helpful health advice and information based on the user's profile.
+
+        {user_context}
+
+        Important guidelines:
+        - Consider the user's age, gender, and medical history when providing advice
+        - If the user has serious medical conditions (like diabetes, heart disease), mention their relevance to current symptoms
+        - Always remind users to consult healthcare professionals for serious conditions
+        - Keep responses concise, informative, and empathetic
+        - Do not provide specific drug dosages without proper medical consultation
+        - Include relevant precautions and when to seek immediate medical help
+        - Personalize your response based on their medical history
+        """
+        max_tokens = 600
+    else:
+        # Basic AI response without user context
+        system_content = """You are MedAether AI, a medical assistant. Provide helpful health advice and information.
+                        Always remind users to consult healthcare professionals for serious conditions.
+                        Keep responses concise, informative, and empathetic. Do not provide specific drug dosages without
+                        proper medical consultation. Include relevant precautions and when to seek immediate medical help."""
+        max_tokens = 500
+
+    messages = [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": message}
+    ]
+    return messages, max_tokens
+
+
+def fallback_response(user=None):
+    """Static advice used when no model is configured"""
+    if user and user.get('medical_history'):
+        conditions = ', '.join(user.get('medical_history', []))
+        return f"""I'm here to help with general health information. Based on your medical history ({conditions}), I recommend:
+
+        1. Monitor your symptoms carefully, especially considering your existing conditions
+        2. Stay hydrated and get adequate rest
+        3. Consult your healthcare professional for personalized advice
+        4. Seek immediate medical attention if symptoms worsen or interact with your existing conditions
+
+        Please note: This is general guidance only and not a substitute for professional medical consultation, especially given your medical history."""
+    return """I'm here to help with general health information. For your specific concern, I recommend:
+
+        1. Monitor your symptoms carefully
+        2. Stay hydrated and get adequate rest
+        3. Consult a healthcare professional for personalized advice
+        4. Seek immediate medical attention if symptoms worsen
+
+        Please note: This is general guidance only and not a substitute for professional medical consultation."""
+
+
+class BackendBusy(Exception):
+    """No backend slot became free within the queue timeout"""
+
+
+def _outcome(error):
+    if isinstance(error, CircuitOpen):
+        return 'open'
+    if isinstance(error, BackendBusy):
+        return 'busy'
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)) or 'Timeout' in type(error).__name__:
+        return 'timeout'
+    return 'error'
+
+
+class Backend:
+    """A model behind a concurrency limit; subclasses implement complete()"""
+
+    name = 'backend'
+
+    def __init__(self, max_concurrency=8, timeout=30, queue_timeout=10):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout  # seconds per call
+        self.queue_timeout = queue_timeout  # seconds to wait for a free slot
+        # Sync callers (web workers) and async callers (the bot) each get
+        # max_concurrency slots; a process normally uses only one of the two
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._async_slots = asyncio.Semaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the backend's slots for a blocking call"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise BackendBusy(f"{self.name} backend has {self.max_concurrency} calls in flight")
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit()
+            self._slots.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Hold one of the backend's slots for a coroutine"""
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise BackendBusy(f"{self.name} backend has {self.max_concurrency} calls in flight")
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit()
+            self._async_slots.release()
+
+    def complete(self, messages, max_tokens, user=None):
+        """Return the English reply for a consultation"""
+        raise NotImplementedError
+
+    async def acomplete(self, messages, max_tokens, user=None):
+        return self.complete(messages, max_tokens, user)
+
+    def stream(self, messages, max_tokens, user=None):
+        """Yield the English reply in chunks"""
+        yield self.complete(messages, max_tokens, user)
+
+    async def aclose(self):
+        pass
+
+
+class StaticBackend(Backend):
+    """The fixed fallback advice, used when no model is configured"""
+
+    name = 'static'
+
+    def complete(self, messages, max_tokens, user=None):
+        return fallback_response(user)
+
+
+class StubBackend(Backend):
+    """Canned reply after a fixed delay, for exercising the pipeline without a model"""
+
+    name = 'stub'
+    REPLY = ("Rest, stay hydrated and monitor your symptoms. Consult a healthcare professional "
+             "if they persist or worsen, and seek immediate medical help for severe symptoms.")
+
+    def __init__(self, latency=0.5, **limits):
+        super().__init__(**limits)
+        self.latency = latency
+
+    def complete(self, messages, max_tokens, user=None):
+        time.sleep(self.latency)
+        return self.REPLY
+
+    async def acomplete(self, messages, max_tokens, user=None):
+        await asyncio.sleep(self.latency)
+        return self.REPLY
+
+    def stream(self, messages, max_tokens, user=None):
+        words = self.REPLY.split(' ')
+        for index, word in enumerate(words):
+            time.sleep(self.latency / len(words))
+            yield word if index == 0 else ' ' + word
+
+
+class OpenAIBackend(Backend):
+    """OpenAI chat completions (or any OpenAI-compatible server)"""
+
+    name = 'openai'
+    temperature = 0.3
+
+    def __init__(self, api_key, model, base_url=None, **limits):
+        if openai is None:
+            raise RuntimeError("The openai package is not installed")
+        super().__init__(**limits)
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self._client = None
+        self._async_client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Blocking client, created on first use"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = openai.OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout)
+        return self._client
+
+    @property
+    def async_client(self):
+        """Async client with a connection pool sized to the concurrency limit, created on first use"""
+        if self._async_client is None:
+            http_client = None
+            if httpx is not None:
+                http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency,
+                        keepalive_expiry=60
+                    ),
+                    timeout=self.timeout
+                )
+            self._async_client = openai.AsyncOpenAI(
+                api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, http_client=http_client
+            )
+        return self._async_client
+
+    def _observe(self, started, outcome, usage=None):
+        metrics.OPENAI_REQUEST_DURATION.observe(time.perf_counter() - started, model=self.model, outcome=outcome)
+        metrics.record_openai_usage(self.model, usage)
+
+    def complete(self, messages, max_tokens, user=None):
+        started = time.perf_counter()
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=self.temperature
+            )
+        except Exception:
+            self._observe(started, 'error')
+            raise
+        self._observe(started, 'success', response.usage)
+        return response.choices[0].message.content
+
+    async def acomplete(self, messages, max_tokens, user=None):
+        started = time.perf_counter()
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=self.temperature
+            )
+        except BaseException:
+            # Includes cancellation by the engine's timeout
+            self._observe(started, 'error')
+            raise
+        self._observe(started, 'success', response.usage)
+        return response.choices[0].message.content
+
+    def stream(self, messages, max_tokens, user=None):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=self.temperature,
+                stream=True,
+                stream_options={'include_usage': True}
+            )
+            for chunk in stream:
+                # The final chunk carries token usage and no choices
+                if getattr(chunk, 'usage', None):
+                    metrics.record_openai_usage(self.model, chunk.usage)
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    yield token
+            outcome = 'success'
+        finally:
+            metrics.OPENAI_REQUEST_DURATION.observe(time.perf_counter() - started, model=self.model, outcome=outcome)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+
+
+def create_backend(settings):
+    """Backend named by AI_BACKEND; 'auto' uses OpenAI when a key is configured"""
+    name = (settings['AI_BACKEND'] or 'auto').lower()
+    if name == 'auto':
+        name = 'openai' if settings['OPENAI_API_KEY'] and openai is not None else 'static'
+    limits = {
+        'max_concurrency': settings['AI_BACKEND_CONCURRENCY'],
+        'timeout': settings['AI_BACKEND_TIMEOUT'],
+        'queue_timeout': settings['AI_BACKEND_QUEUE_TIMEOUT']
+    }
+    if name == 'openai':
+        return OpenAIBackend(settings['OPENAI_API_KEY'], settings['OPENAI_MODEL'],
+                             base_url=settings['OPENAI_BASE_URL'], **limits)
+    if name == 'stub':
+        return StubBackend(latency=settings['AI_STUB_LATENCY'], **limits)
+    if name == 'static':
+        return StaticBackend(**limits)
+    raise ValueError(f"Unknown AI_BACKEND: {name}")
+
+
+def create_backend_breaker(backend, settings):
+    """Circuit breaker for a backend, or None when breakers are disabled"""
+    return create_breaker(
+        backend.name,
+        settings,
+        settings['AI_BACKEND_QUEUE_TIMEOUT'] + settings['AI_BACKEND_TIMEOUT'],
+        slow_call=settings['AI_SLOW_CALL'],
+        hedge=settings['AI_HEDGE_ENABLED'],
+        # Room for a hedge and for attempts abandoned at the deadline
+        max_workers=2 * backend.max_concurrency,
+        ignore=(BackendBusy,)
+    )
+
+
+class ConsultationEngine:
+    """Cache lookup, local answer, backend call and translation for a consultation"""
+
+    def __init__(self, backend, translate=None, cache=None, executor=None, coalesce=True, follower_timeout=45,
+                 retriever=None, breaker=None, budget=None):
+        self.backend = backend
+        # resilience.CircuitBreaker for the backend; its deadline covers the slot wait and the call
+        self.breaker = breaker
+        # token_budget.TokenBudget charged for each question that needs the backend
+        self.budget = budget
+        self.translate = translate  # (text, language, persist=False) -> text, raising on failure
+        self.cache = cache
+        self.retriever = retriever  # retrieval.Retriever answering common questions locally
+        self.executor = executor  # thread pool for translation on the async path
+        # Identical questions in flight at the same time share one backend call
+        self.flights = SingleFlight('consultation') if coalesce else None
+        self.follower_timeout = follower_timeout
+        metrics.REGISTRY.gauge_callback(
+            'medaether_ai_backend_in_flight',
+            'Model backend calls currently holding a concurrency slot',
+            ('backend',),
+            lambda: {(self.backend.name,): self.backend.in_flight}
+        )
+
+    def translate_response(self, text, language):
+        """Translate an English response, falling back to English on failure"""
+        if language == 'en' or self.translate is None:
+            return text
+        try:
+            # The generic fallback is a prewarmed fixed string; model replies stay in the LRU only
+            return self.translate(text, language, persist=text == fallback_response())
+        except CircuitOpen:
+            return text  # Translator is unhealthy; already counted by the breaker
+        except Exception as e:
+            print(f"Translation failed, answering in English: {e}")
+            return text
+
+    def _local_answer(self, message, user):
+        """English answer from the local index; personalized questions always go to the model"""
+        if self.retriever is None or (user and user.get('medical_history')):
+            return None
+        return self.retriever.answer(message)
+
+    def _admit(self, budget_key, messages, max_tokens):
+        """Ask the breaker, then wait for the asker's token budget.
+
+        Returns the breaker's admission (True without a breaker), or False to
+        answer with the fallback."""
+        admission = self.breaker.allow() if self.breaker is not None else True
+        if not admission:
+            self._observe(time.perf_counter(), 'open')
+            return False
+        granted = False
+        try:
+            granted = (self.budget is None or budget_key is None or
+                       self.budget.acquire(budget_key, estimate_chat_tokens(messages, max_tokens)))
+        finally:
+            if not granted and self.breaker is not None:
+                self.breaker.release(admission)  # No call is made, so nothing is learned about the backend
+        return admission if granted else False
+
+    async def _aadmit(self, budget_key, messages, max_tokens):
+        admission = self.breaker.allow() if self.breaker is not None else True
+        if not admission:
+            self._observe(time.perf_counter(), 'open')
+            return False
+        granted = False
+        try:
+            granted = (self.budget is None or budget_key is None or await self.budget.aacquire(
+                budget_key, estimate_chat_tokens(messages, max_tokens), self.executor
+            ))
+        finally:
+            if not granted and self.breaker is not None:
+                self.breaker.release(admission)
+        return admission if granted else False
+
+    def _cached(self, key):
+        return self.cache.get(key) if self.cache is not None else None
+
+    def _remember(self, key, response):
+        if self.cache is not None and response is not None:
+            self.cache.set(key, response)
+
+    def _observe(self, started, outcome):
+        CONSULTATION_DURATION.observe(time.perf_counter() - started, backend=self.backend.name, outcome=outcome)
+
+    def advise(self, message, language='en', user=None, budget_key=None):
+        """Advice in the user's language, or None if the backend failed.
+
+        Questions that need the backend are charged to budget_key's token
+        budget; cache hits, local answers, requests sharing an identical
+        question already in flight and requests turned away by an open breaker
+        are free. Over budget the caller waits for a refill, then gets the
+        fallback advice."""
+        key = cache_key(message, language, user)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        local = self._local_answer(message, user)
+        if local is not None:
+            return self.translate_response(local, language)
+        if self.flights is None:
+            return self._generate(key, message, language, user, budget_key)
+        try:
+            response, _ = self.flights.do(
+                key, lambda: self._generate(key, message, language, user, budget_key), self.follower_timeout
+            )
+        except FollowerTimeout:
+            return self.translate_response(fallback_response(user), language)
+        return response
+
+    def _complete(self, messages, max_tokens, user):
+        with self.backend.slot():
+            return self.backend.complete(messages, max_tokens, user)
+
+    def _generate(self, key, message, language, user, budget_key=None):
+        messages, max_tokens = build_messages(message, user)
+        admission = self._admit(budget_key, messages, max_tokens)
+        if not admission:
+            # Fail fast while the backend is unhealthy or the asker is over budget; the fallback is not cached
+            return self.translate_response(fallback_response(user), language)
+        started = time.perf_counter()
+        try:
+            if self.breaker is not None:
+                response = self.breaker.run(functools.partial(self._complete, messages, max_tokens, user), admission)
+            else:
+                response = self._complete(messages, max_tokens, user)
+        except Exception as e:
+            self._observe(started, _outcome(e))
+            print(f"AI consultation error: {e}")
+            return None
+        self._observe(started, 'success')
+
+        response = self.translate_response(response, language)
+        self._remember(key, response)
+        return response
+
+    async def aadvise(self, message, language='en', user=None, budget_key=None):
+        """advise() for the event loop; blocking translation runs on the executor"""
+        key = cache_key(message, language, user)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        local = self._local_answer(message, user)
+        if local is not None:
+            return await self._atranslate(local, language)
+        if self.flights is None:
+            return await self._agenerate(key, message, language, user, budget_key)
+        try:
+            response, _ = await self.flights.ado(
+                key, lambda: self._agenerate(key, message, language, user, budget_key), self.follower_timeout
+            )
+        except FollowerTimeout:
+            return await self._atranslate(fallback_response(user), language)
+        return response
+
+    async def _atranslate(self, text, language):
+        if language == 'en':
+            return text
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(self.translate_response, text, language))
+
+    async def _acomplete(self, messages, max_tokens, user):
+        async with self.backend.aslot():
+            return await asyncio.wait_for(self.backend.acomplete(messages, max_tokens, user), self.backend.timeout)
+
+    async def _agenerate(self, key, message, language, user, budget_key=None):
+        messages, max_tokens = build_messages(message, user)
+        admission = await self._aadmit(budget_key, messages, max_tokens)
+        if not admission:
+            return await self._atranslate(fallback_response(user), language)
+        started = time.perf_counter()
+        try:
+            if self.breaker is not None:
+                response = await self.breaker.arun(functools.partial(self._acomplete, messages, max_tokens, user), admission)
+            else:
+                response = await self._acomplete(messages, max_tokens, user)
+        except Exception as e:
+            self._observe(started, _outcome(e))
+            print(f"AI consultation error: {e}")
+            return None
+        self._observe(started, 'success')
+
+        response = await self._atranslate(response, language)
+        self._remember(key, response)
+        return response
+
+    def stream(self, message, language='en', user=None, budget_key=None):
+        """Yield the advice in chunks as they arrive from the backend.
+
+        Chunks are relayed as-is for English. Other languages are translated as a
+        whole once the backend finishes, so they arrive as a single chunk. A
+        request identical to one already in flight gets that request's full
+        reply as a single chunk and is not charged to budget_key's token budget.
+        While the circuit breaker is open the fallback advice is the only chunk,
+        as it is when the budget runs out; a stream still running at the
+        breaker's deadline is cut off.
+        Backend errors propagate to the caller."""
+        key = cache_key(message, language, user)
+        cached = self._cached(key)
+        if cached is not None:
+            yield cached
+            return
+        local = self._local_answer(message, user)
+        if local is not None:
+            yield self.translate_response(local, language)
+            return
+        flight = None
+        if self.flights is not None:
+            flight, leader = self.flights.begin(key)
+            if not leader:
+                try:
+                    response = self.flights.wait(flight, self.follower_timeout)
+                except FollowerTimeout:
+                    response = self.translate_response(fallback_response(user), language)
+                if response is None:
+                    raise RuntimeError("AI consultation failed")
+                yield response
+                return
+
+        def finish(response):
+            nonlocal flight
+            if flight is not None:
+                self.flights.finish(key, flight, response)
+                flight = None
+
+        try:
+            messages, max_tokens = build_messages(message, user)
+            # Only the leader asks the breaker and pays from its budget; a follower never holds the half-open trial
+            admission = self._admit(budget_key, messages, max_tokens)
+            if not admission:
+                response = self.translate_response(fallback_response(user), language)
+                finish(response)
+                yield response
+                return
+
+            started = time.perf_counter()
+            outcome = 'error'
+            parts = []
+            response = None
+            failed = False
+            deadline = self.breaker.deadline if self.breaker is not None else None
+            try:
+                with self.backend.slot():
+                    for chunk in self.backend.stream(messages, max_tokens, user):
+                        if deadline is not None and time.perf_counter() - started > deadline:
+                            raise DeadlineExceeded(f"{self.backend.name} stream exceeded {deadline}s")
+                        parts.append(chunk)
+                        if language == 'en':
+                            yield chunk
+                outcome = 'success'
+                response = ''.join(parts)
+                if language != 'en':
+                    response = self.translate_response(response, language)
+                    yield response
+            except Exception as e:
+                if outcome == 'error':
+                    outcome = _outcome(e)
+                    failed = outcome in ('error', 'timeout')
+                raise
+            finally:
+                self._observe(started, outcome)
+                if self.breaker is not None:
+                    # A client that hangs up or a full backend says nothing about the backend's health
+                    if outcome == 'success' or failed:
+                        self.breaker.record(not failed, time.perf_counter() - started, outcome, admission)
+                    else:
+                        self.breaker.release(admission)
+                # Followers of an abandoned or failed stream see None, like a failed advise()
+                finish(response)
+            self._remember(key, response)
+        finally:
+            # Whatever fails before the stream starts, followers must not wait out their timeout
+            finish(None)
+
+    async def aclose(self):
+        """Close the backend's async connection pool"""
+        await self.backend.aclose()
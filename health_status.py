@@ -0,0 +1,63 @@
+"""
+Health status calculation for MedAether
+Matches medical history against config.MEDICAL_CONDITIONS using patterns
+compiled once at import time
+"""
+
+import re
+from config import MEDICAL_CONDITIONS
+
+# Status implied by each condition category, most severe first
+CATEGORY_STATUS = (
+    ('serious', 'red'),
+    ('moderate', 'yellow'),
+    ('mild', 'yellow')  # Even mild conditions warrant yellow status
+)
+
+
+def compile_condition_pattern(conditions):
+    """Compile condition names into a single prefix-trie alternation.
+
+    Sharing common prefixes keeps the work at each position of the history
+    bounded by the longest condition name rather than the number of names."""
+    trie = {}
+    for condition in conditions:
+        node = trie
+        for char in condition.lower():
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            pattern = '(?:' + pattern + ')?'
+        return pattern
+
+    return re.compile(build(trie))
+
+
+CONDITION_PATTERNS = [
+    (status, compile_condition_pattern(MEDICAL_CONDITIONS[category]))
+    for category, status in CATEGORY_STATUS
+]
+
+
+def calculate_health_status(user):
+    """Calculate user's health status based on medical history and conditions"""
+    medical_history = user.get('medical_history', [])
+
+    if not medical_history:
+        return 'green'
+
+    # Entries are joined with newlines so no condition can match across two of them
+    history_text = '\n'.join(hist.lower() for hist in medical_history)
+
+    for status, pattern in CONDITION_PATTERNS:
+        if pattern.search(history_text):
+            return status
+
+    # If medical history exists but no specific conditions matched, assume yellow
+    return 'yellow'
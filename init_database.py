@@ -7,6 +7,7 @@ Creates collections, indexes, and sample data
 import os
 import sys
 from pymongo import MongoClient, ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash
 from config import get_config, DEFAULT_HEALTH_PROBLEMS, DEFAULT_HEALTH_PLANS
@@ -21,8 +22,16 @@ def create_indexes(db):
     db.users.create_index([("health_status", ASCENDING)])
     
     # Chat history indexes
-    db.chat_history.create_index([("user_id", ASCENDING), ("timestamp", DESCENDING)])
+    db.chat_history.create_index([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)])
+    # The index above covers every query the older (user_id, timestamp) index served
+    if "user_id_1_timestamp_-1" in db.chat_history.index_information():
+        db.chat_history.drop_index("user_id_1_timestamp_-1")
     db.chat_history.create_index([("timestamp", DESCENDING)])
+    # Curated answers loaded into the local answer index
+    db.chat_history.create_index(
+        [("language", ASCENDING), ("curated_at", DESCENDING)],
+        partialFilterExpression={"curated": True}
+    )
     
     # Community reports indexes
     db.reports.create_index([("user_id", ASCENDING), ("submitted_at", DESCENDING)])
@@ -31,6 +40,30 @@ def create_indexes(db):
     db.reports.create_index([("status", ASCENDING)])
     db.reports.create_index([("submitted_at", DESCENDING)])
     
+    # Report rollup indexes (one counter per day, location, severity and status)
+    db.report_rollups.create_index(
+        [("day", ASCENDING), ("location_key", ASCENDING), ("severity", ASCENDING), ("status", ASCENDING)],
+        unique=True
+    )
+    
+    # Outbreak alert indexes
+    db.outbreak_alerts.create_index([("location_key", ASCENDING), ("detected_at", DESCENDING)])
+    db.outbreak_alerts.create_index([("status", ASCENDING), ("detected_at", DESCENDING)])
+    
+    # Email outbox indexes
+    db.email_outbox.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+    db.email_outbox.create_index([("report_id", ASCENDING)])
+    db.email_outbox.create_index([("kind", ASCENDING), ("digest_key", ASCENDING), ("window_start", ASCENDING), ("status", ASCENDING)])
+    # One pending digest per location, severity and window, even with concurrent reports
+    db.email_outbox.create_index(
+        [("digest_key", ASCENDING), ("window_start", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"kind": "community_digest", "status": "pending"}
+    )
+    
+    # Token buckets for per-user budgets; idle buckets are full again long before they expire
+    db.token_buckets.create_index([("updated_at", ASCENDING)], expireAfterSeconds=86400)
+    
     # Telegram users indexes
     db.telegram_users.create_index([("telegram_id", ASCENDING)], unique=True)
     db.telegram_users.create_index([("last_interaction", DESCENDING)])
@@ -39,6 +72,22 @@ def create_indexes(db):
     db.telegram_consultations.create_index([("telegram_id", ASCENDING), ("timestamp", DESCENDING)])
     db.telegram_consultations.create_index([("timestamp", DESCENDING)])
     
+    # Translation memory indexes
+    db.translation_memory.create_index([("source_hash", ASCENDING), ("target_language", ASCENDING)], unique=True)
+    # Only fixed strings are kept; older versions also stored user text and AI answers
+    db.translation_memory.delete_many({"fixed": {"$ne": True}})
+    
+    # AI consultation jobs indexes: finished jobs expire a day after they finish; jobs
+    # orphaned by a restarted worker never finish and expire a week after creation,
+    # far longer than AI_JOB_TIMEOUT, so no job is removed while it can still run
+    db.ai_jobs.create_index([("owner", ASCENDING), ("created_at", DESCENDING)])
+    db.ai_jobs.create_index([("finished_at", ASCENDING)], expireAfterSeconds=86400)
+    try:
+        db.ai_jobs.create_index([("created_at", ASCENDING)], expireAfterSeconds=7 * 86400)
+    except OperationFailure:
+        # Older databases have this index with a one-day expiry
+        db.command('collMod', 'ai_jobs', index={'keyPattern': {'created_at': 1}, 'expireAfterSeconds': 7 * 86400})
+    
     print("✓ Database indexes created successfully")
 
 def create_sample_data(db):
@@ -158,7 +207,8 @@ def create_collections(db):
     # Create collections if they don't exist
     collections = [
         'users', 'chat_history', 'reports', 'health_problems', 'health_plans',
-        'telegram_users', 'telegram_consultations', 'health_metrics'
+        'telegram_users', 'telegram_consultations', 'health_metrics', 'ai_jobs', 'translation_memory', 'maintenance_jobs', 'email_outbox', 'report_rollups',
+        'outbreak_alerts', 'token_buckets'
     ]
     
     existing_collections = db.list_collection_names()
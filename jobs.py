@@ -0,0 +1,69 @@
+"""
+Background job queue for MedAether
+Runs slow work on a local thread pool and records job state in MongoDB so
+that any web worker can serve the result
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+
+class JobQueue:
+    """Submit callables to a bounded worker pool and poll their results"""
+
+    def __init__(self, collection, max_workers=4, timeout_seconds=120, name='jobs'):
+        self.collection = collection
+        self.timeout_seconds = timeout_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    def submit(self, func, *args, owner=None, **kwargs):
+        """Record a pending job, schedule it and return its id as a string"""
+        job = {
+            'owner': owner,
+            'status': 'pending',
+            'created_at': datetime.utcnow()
+        }
+        job_id = self.collection.insert_one(job).inserted_id
+        self.executor.submit(self._run, job_id, func, args, kwargs)
+        return str(job_id)
+
+    def _run(self, job_id, func, args, kwargs):
+        """Execute a job and store its result or error"""
+        self.collection.update_one(
+            {'_id': job_id},
+            {'$set': {'status': 'running', 'started_at': datetime.utcnow()}}
+        )
+        try:
+            result = func(*args, **kwargs)
+            update = {'status': 'done', 'result': result}
+        except Exception as e:
+            print(f"Background job {job_id} failed: {e}")
+            update = {'status': 'failed', 'error': str(e)}
+        update['finished_at'] = datetime.utcnow()
+        self.collection.update_one({'_id': job_id}, {'$set': update})
+
+    def get(self, job_id, owner=None):
+        """Return the job document, or None if it does not exist for this owner"""
+        try:
+            query = {'_id': ObjectId(job_id)}
+        except (InvalidId, TypeError):
+            return None
+        if owner is not None:
+            query['owner'] = owner
+        job = self.collection.find_one(query)
+        if job is None:
+            return None
+
+        # Jobs orphaned by a restarted worker never finish; report them as failed
+        if job['status'] in ('pending', 'running'):
+            deadline = job['created_at'] + timedelta(seconds=self.timeout_seconds)
+            if datetime.utcnow() > deadline:
+                job['status'] = 'failed'
+                job['error'] = 'Job timed out'
+        return job
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for running ones"""
+        self.executor.shutdown(wait=wait)
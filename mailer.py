@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Email outbox for MedAether
+Community reports are written to the email_outbox collection together with
+the report itself, either individually or batched into a per-location digest.
+A background sender drains the outbox over one long-lived SMTP session,
+retrying failures with exponential backoff.
+
+Run standalone with: python mailer.py
+"""
+
+import calendar
+import functools
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from pymongo import ReturnDocument, ASCENDING
+from pymongo.errors import DuplicateKeyError
+from config import EMAIL_TEMPLATES
+from report_rollups import location_key
+import metrics
+
+OUTBOX_EVENTS = metrics.REGISTRY.counter(
+    'medaether_email_outbox_events_total',
+    'Email outbox deliveries by event (sent, retry, failed, connect)',
+    ('event',)
+)
+
+_transaction_support = {}
+
+
+def supports_transactions(client):
+    """Whether the deployment is a replica set or sharded cluster"""
+    key = id(client)
+    if key not in _transaction_support:
+        try:
+            hello = client.admin.command('ismaster')
+            _transaction_support[key] = bool(hello.get('setName')) or hello.get('msg') == 'isdbgrid'
+        except Exception:
+            _transaction_support[key] = False
+    return _transaction_support[key]
+
+
+def _report_payload(report_data):
+    return {key: value for key, value in report_data.items() if key != '_id'}
+
+
+def digest_key(report_data):
+    """Group key for digests: normalised location and severity"""
+    return f"{location_key(report_data['location'])}|{report_data['severity']}"
+
+
+def save_report_with_outbox(client, db, report_data, digest_window=0, bypass_severities=()):
+    """Insert a report and its outbox entry atomically where the server allows it.
+
+    With a digest window, reports are appended to the pending digest for
+    their location and severity, which becomes due when the window closes;
+    severities in bypass_severities are still sent on their own right away."""
+    def insert_both(session=None):
+        report_id = db.reports.insert_one(report_data, session=session).inserted_id
+        now = datetime.utcnow()
+
+        if digest_window and report_data['severity'] not in bypass_severities:
+            # now is naive UTC; timegm reads it as UTC whatever the host's timezone
+            window = calendar.timegm(now.utctimetuple()) // digest_window * digest_window
+            window_start = datetime(1970, 1, 1) + timedelta(seconds=window)
+            window_end = window_start + timedelta(seconds=digest_window)
+            # Filtering on status means a digest already being sent is left
+            # alone and a late report opens a new one for the same window
+            append = functools.partial(
+                db.email_outbox.update_one,
+                {
+                    'kind': 'community_digest',
+                    'digest_key': digest_key(report_data),
+                    'window_start': window_start,
+                    'status': 'pending'
+                },
+                {
+                    '$push': {'report_ids': report_id, 'reports': _report_payload(report_data)},
+                    '$setOnInsert': {
+                        'window_end': window_end,
+                        'attempts': 0,
+                        'created_at': now,
+                        'next_attempt_at': window_end
+                    }
+                },
+                upsert=True,
+                session=session
+            )
+            try:
+                append()
+            except DuplicateKeyError:
+                if session is not None:
+                    raise  # The transaction is aborted; it is retried as a whole below
+                # A concurrent report opened the same pending digest first; append to it
+                append()
+            return report_id
+
+        db.email_outbox.insert_one({
+            'kind': 'community_report',
+            'report_id': report_id,
+            'payload': _report_payload(report_data),
+            'status': 'pending',
+            'attempts': 0,
+            'created_at': now,
+            'next_attempt_at': now
+        }, session=session)
+        return report_id
+
+    if supports_transactions(client):
+        with client.start_session() as session:
+            try:
+                return session.with_transaction(insert_both)
+            except DuplicateKeyError:
+                # A concurrent report opened the same pending digest; the retry appends to it
+                return session.with_transaction(insert_both)
+
+    # Standalone servers have no transactions; the outbox entry follows the report
+    return insert_both()
+
+
+def build_report_message(report_data, settings):
+    """Build the email sent to health authorities for one report"""
+    template = EMAIL_TEMPLATES['community_report']
+    msg = MIMEMultipart()
+    msg['From'] = settings['EMAIL_USER']
+    msg['To'] = settings['HEALTH_DEPARTMENT_EMAIL']
+    msg['Subject'] = template['subject'].format(**report_data)
+    msg.attach(MIMEText(template['body'].format(**report_data), 'plain'))
+    return msg
+
+
+def build_digest_message(entry, settings):
+    """Build one consolidated email for a digest of reports"""
+    template = EMAIL_TEMPLATES['community_report']
+    reports = sorted(entry['reports'], key=lambda report: report['submitted_at'])
+    first = reports[0]
+    fields = {
+        'count': len(reports),
+        'location': first['location'].strip(),
+        'severity': first['severity'],
+        'window_start': entry['window_start'].strftime('%Y-%m-%d %H:%M'),
+        'window_end': entry['window_end'].strftime('%Y-%m-%d %H:%M'),
+        'reports': ''.join(
+            template['digest_item'].format(index=index, **report)
+            for index, report in enumerate(reports, 1)
+        )
+    }
+    msg = MIMEMultipart()
+    msg['From'] = settings['EMAIL_USER']
+    msg['To'] = settings['HEALTH_DEPARTMENT_EMAIL']
+    msg['Subject'] = template['digest_subject'].format(**fields)
+    msg.attach(MIMEText(template['digest_body'].format(**fields), 'plain'))
+    return msg
+
+
+class SMTPSession:
+    """A reusable, reconnecting authenticated SMTP connection"""
+
+    def __init__(self, settings, idle_timeout=60):
+        self.settings = settings
+        self.idle_timeout = idle_timeout
+        self.server = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.settings['SMTP_SERVER'], self.settings['SMTP_PORT'], timeout=30)
+        server.starttls()
+        server.login(self.settings['EMAIL_USER'], self.settings['EMAIL_PASSWORD'])
+        OUTBOX_EVENTS.inc(event='connect')
+        return server
+
+    def send(self, msg):
+        """Send a message, reconnecting once if the server dropped the session"""
+        started = time.perf_counter()
+        try:
+            for attempt in range(2):
+                if self.server is None:
+                    self.server = self._connect()
+                try:
+                    self.server.sendmail(msg['From'], [msg['To']], msg.as_string())
+                    break
+                except smtplib.SMTPServerDisconnected:
+                    self.server = None
+                    if attempt:
+                        raise
+        except Exception:
+            metrics.SMTP_SEND_DURATION.observe(time.perf_counter() - started, outcome='error')
+            raise
+        metrics.SMTP_SEND_DURATION.observe(time.perf_counter() - started, outcome='success')
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self):
+        """Release the connection after idle_timeout seconds without sends"""
+        if self.server is not None and time.monotonic() - self.last_used > self.idle_timeout:
+            self.close()
+
+    def close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            pass
+        self.server = None
+
+
+class OutboxSender:
+    """Background thread that drains the email outbox"""
+
+    def __init__(self, db, settings):
+        self.db = db
+        self.settings = settings
+        self.session = SMTPSession(settings, idle_timeout=settings['SMTP_IDLE_TIMEOUT'])
+        self.poll_interval = settings['EMAIL_OUTBOX_POLL_INTERVAL']
+        self.lease_seconds = settings['EMAIL_OUTBOX_LEASE']
+        self.max_attempts = settings['EMAIL_OUTBOX_MAX_ATTEMPTS']
+        self.backoff_base = settings['EMAIL_OUTBOX_BACKOFF_BASE']
+        self.backoff_max = settings['EMAIL_OUTBOX_BACKOFF_MAX']
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def claim(self):
+        """Lease the next due entry so that concurrent senders never share one"""
+        now = datetime.utcnow()
+        return self.db.email_outbox.find_one_and_update(
+            {'$or': [
+                {'status': 'pending', 'next_attempt_at': {'$lte': now}},
+                {'status': 'sending', 'locked_until': {'$lt': now}}
+            ]},
+            {'$set': {'status': 'sending', 'locked_until': now + timedelta(seconds=self.lease_seconds)}},
+            sort=[('next_attempt_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def backoff(self, attempts):
+        """Exponential backoff with jitter, capped at backoff_max"""
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        return delay * random.uniform(0.8, 1.2)
+
+    def deliver(self, entry):
+        """Send one outbox entry and record the outcome"""
+        try:
+            if entry['kind'] == 'community_digest':
+                msg = build_digest_message(entry, self.settings)
+            else:
+                msg = build_report_message(entry['payload'], self.settings)
+            self.session.send(msg)
+        except Exception as e:
+            attempts = entry.get('attempts', 0) + 1
+            if attempts >= self.max_attempts:
+                update = {'status': 'failed', 'attempts': attempts, 'last_error': str(e)}
+                OUTBOX_EVENTS.inc(event='failed')
+            else:
+                retry_at = datetime.utcnow() + timedelta(seconds=self.backoff(attempts))
+                update = {'status': 'pending', 'attempts': attempts, 'next_attempt_at': retry_at, 'last_error': str(e)}
+                OUTBOX_EVENTS.inc(event='retry')
+            print(f"Failed to send email for outbox entry {entry['_id']} (attempt {attempts}): {e}")
+            self.session.close()
+        else:
+            update = {'status': 'sent', 'sent_at': datetime.utcnow()}
+            OUTBOX_EVENTS.inc(event='sent')
+        update['locked_until'] = None
+        try:
+            self.db.email_outbox.update_one({'_id': entry['_id']}, {'$set': update})
+        except DuplicateKeyError:
+            # A late report opened a new pending digest for this window while this one was sending
+            self.merge_digest(entry, update)
+
+    def merge_digest(self, entry, update):
+        """Move a failed digest's reports into the pending digest for its window and drop it"""
+        merged = self.db.email_outbox.update_one(
+            {
+                'kind': 'community_digest',
+                'digest_key': entry['digest_key'],
+                'window_start': entry['window_start'],
+                'status': 'pending'
+            },
+            {
+                '$push': {
+                    'report_ids': {'$each': entry['report_ids'], '$position': 0},
+                    'reports': {'$each': entry['reports'], '$position': 0}
+                },
+                # Keep the failed digest's backoff and attempt count
+                '$max': {'attempts': update['attempts'], 'next_attempt_at': update['next_attempt_at']},
+                '$set': {'last_error': update['last_error']}
+            }
+        )
+        if merged.matched_count:
+            self.db.email_outbox.delete_one({'_id': entry['_id']})
+        else:
+            # The other digest was claimed in the meantime, so this one no longer clashes
+            self.db.email_outbox.update_one({'_id': entry['_id']}, {'$set': update})
+
+    def drain(self):
+        """Deliver every due entry; returns how many were processed"""
+        processed = 0
+        while not self._stop.is_set():
+            entry = self.claim()
+            if entry is None:
+                break
+            self.deliver(entry)
+            processed += 1
+        return processed
+
+    def run(self):
+        """Sender loop: drain, then wait for a wake-up or the poll interval"""
+        while not self._stop.is_set():
+            try:
+                if not self.drain():
+                    self.session.close_if_idle()
+            except Exception as e:
+                print(f"Email outbox sender error: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+        self.session.close()
+
+    def wake(self):
+        """Ask the sender to look at the outbox now instead of at the next poll"""
+        self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='email-outbox', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main():
+    from pymongo import MongoClient
+    from config import get_config
+
+    config_class = get_config()
+    settings = {name: getattr(config_class, name) for name in dir(config_class) if name.isupper()}
+    if not (settings['EMAIL_USER'] and settings['EMAIL_PASSWORD']):
+        print("✗ EMAIL_USER and EMAIL_PASSWORD must be set to send report emails")
+        return
+
+    client = MongoClient(settings['MONGODB_URI'])
+    sender = OutboxSender(client[settings['MONGODB_DB_NAME']], settings)
+    print("✓ Email outbox sender started")
+    try:
+        sender.run()
+    except KeyboardInterrupt:
+        sender.session.close()
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
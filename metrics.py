@@ -0,0 +1,299 @@
+"""
+Metrics for MedAether
+A small thread-safe registry of counters and histograms rendered in the
+Prometheus text exposition format, plus the instruments shared by the web
+app and the Telegram bot
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from pymongo import monitoring
+except ImportError:
+    monitoring = None
+
+# Latency buckets in seconds, from fast Mongo reads up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """Monotonically increasing value per label set"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted((key, ([*series[0]], series[1], series[2])) for key, series in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames + ('le',), key + ('+Inf',))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class GaugeCallback:
+    """Gauge whose samples are read from a callback at render time"""
+
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self):
+        try:
+            samples = self.callback()
+        except Exception as e:
+            print(f"Metrics callback {self.name} failed: {e}")
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in sorted(samples.items())]
+
+
+class MetricsRegistry:
+    """Collection of named metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, labelnames, callback):
+        """Register a gauge; callback returns {label_values_tuple: value}"""
+        with self._lock:
+            metric = GaugeCallback(name, documentation, labelnames, callback)
+            self._metrics[name] = metric
+            return metric
+
+    def render(self):
+        """Return every metric in Prometheus text format"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# HTTP requests (web app)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    'medaether_http_request_duration_seconds',
+    'Flask request latency by endpoint, method and status code',
+    ('endpoint', 'method', 'status')
+)
+
+# MongoDB commands
+MONGO_COMMAND_DURATION = REGISTRY.histogram(
+    'medaether_mongo_command_duration_seconds',
+    'MongoDB command latency by collection and command',
+    ('collection', 'command')
+)
+MONGO_COMMAND_FAILURES = REGISTRY.counter(
+    'medaether_mongo_command_failures_total',
+    'Failed MongoDB commands by collection and command',
+    ('collection', 'command')
+)
+
+# OpenAI
+OPENAI_REQUEST_DURATION = REGISTRY.histogram(
+    'medaether_openai_request_duration_seconds',
+    'OpenAI chat completion latency by model and outcome',
+    ('model', 'outcome')
+)
+OPENAI_TOKENS = REGISTRY.counter(
+    'medaether_openai_tokens_total',
+    'OpenAI tokens used, from response.usage',
+    ('model', 'type')
+)
+
+# Google Translate
+TRANSLATE_DURATION = REGISTRY.histogram(
+    'medaether_translate_duration_seconds',
+    'Translator call latency by target language',
+    ('language',)
+)
+TRANSLATE_FAILURES = REGISTRY.counter(
+    'medaether_translate_failures_total',
+    'Failed translator calls by target language',
+    ('language',)
+)
+
+# SMTP
+SMTP_SEND_DURATION = REGISTRY.histogram(
+    'medaether_smtp_send_duration_seconds',
+    'Time to connect, authenticate and send a report email by outcome',
+    ('outcome',)
+)
+
+# Telegram bot
+TELEGRAM_HANDLER_DURATION = REGISTRY.histogram(
+    'medaether_telegram_handler_duration_seconds',
+    'Telegram bot handler latency by handler',
+    ('handler',)
+)
+
+
+def record_openai_usage(model, usage):
+    """Add token counts from an OpenAI response.usage object"""
+    if usage is None:
+        return
+    OPENAI_TOKENS.inc(getattr(usage, 'prompt_tokens', 0) or 0, model=model, type='prompt')
+    OPENAI_TOKENS.inc(getattr(usage, 'completion_tokens', 0) or 0, model=model, type='completion')
+
+
+def register_cache(name, cache):
+    """Expose an LRUCache's counters as gauges"""
+    REGISTRY.gauge_callback(
+        f"medaether_{name}_cache",
+        f"{name.replace('_', ' ').capitalize()} cache counters",
+        ('stat',),
+        lambda: {(stat,): value for stat, value in cache.stats().items()}
+    )
+
+
+if monitoring is not None:
+    class MongoCommandMetrics(monitoring.CommandListener):
+        """pymongo listener that records command latency per collection"""
+
+        def __init__(self):
+            self._collections = {}
+
+        def started(self, event):
+            collection = event.command.get(event.command_name)
+            if not isinstance(collection, str):
+                collection = ''
+            self._collections[(event.connection_id, event.request_id)] = collection
+
+        def succeeded(self, event):
+            collection = self._collections.pop((event.connection_id, event.request_id), '')
+            MONGO_COMMAND_DURATION.observe(
+                event.duration_micros / 1e6, collection=collection, command=event.command_name
+            )
+
+        def failed(self, event):
+            collection = self._collections.pop((event.connection_id, event.request_id), '')
+            MONGO_COMMAND_DURATION.observe(
+                event.duration_micros / 1e6, collection=collection, command=event.command_name
+            )
+            MONGO_COMMAND_FAILURES.inc(collection=collection, command=event.command_name)
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """Serve /metrics on a background thread (for processes without a web app)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
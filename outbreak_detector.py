@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Outbreak detector for MedAether
+Consumes newly inserted community reports (through a change stream, or by
+tailing the collection when the server is not a replica set), keeps a
+sliding-window count and an EWMA baseline per location in memory, and
+writes an outbreak_alerts record when a location surges above its baseline.
+
+Run standalone with: python outbreak_detector.py
+"""
+
+import calendar
+import math
+import sys
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import MongoClient, ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from config import get_config
+from report_rollups import location_key
+import metrics
+
+JOB_NAME = 'outbreak_detector'
+
+REPORT_FIELDS = {'_id': 1, 'location': 1, 'location_key': 1, 'severity': 1, 'submitted_at': 1}
+EPOCH = datetime(1970, 1, 1)  # naive UTC, like the datetimes stored in MongoDB
+
+OUTBREAK_REPORTS = metrics.REGISTRY.counter(
+    'medaether_outbreak_reports_total',
+    'Reports consumed by the outbreak detector by source',
+    ('source',)
+)
+OUTBREAK_ALERTS = metrics.REGISTRY.counter(
+    'medaether_outbreak_alerts_total',
+    'Outbreak alerts raised'
+)
+
+
+class LocationWindow:
+    """Per-location bucket counts over a sliding window, plus an EWMA baseline.
+
+    The baseline is fed with buckets as they leave the window, so it
+    describes the period before the current window and is not inflated by
+    the surge it is compared against. It is bias-corrected for its zero
+    start (weight is the total weight of the buckets seen so far)."""
+
+    __slots__ = ('location', 'buckets', 'total', 'ewma', 'weight', 'history', 'expired_through', 'last_alert_bucket')
+
+    def __init__(self, location, bucket):
+        self.location = location
+        self.buckets = deque()
+        self.total = 0
+        self.ewma = 0.0
+        self.weight = 0.0
+        self.history = 0
+        self.expired_through = bucket - 1
+        self.last_alert_bucket = None
+
+    @property
+    def baseline(self):
+        """Expected reports per bucket"""
+        return self.ewma / self.weight if self.weight else 0.0
+
+    def _skip_empty(self, buckets, decay):
+        factor = decay ** buckets
+        self.history += buckets
+        self.ewma *= factor
+        self.weight = 1 - factor * (1 - self.weight)
+
+    def advance(self, bucket, window_buckets, decay):
+        """Slide the window so that it ends at bucket"""
+        cutoff = bucket - window_buckets
+        while self.buckets and self.buckets[0][0] <= cutoff:
+            index, count = self.buckets.popleft()
+            if index - self.expired_through > 1:
+                self._skip_empty(index - self.expired_through - 1, decay)
+            self.ewma = (1 - decay) * count + decay * self.ewma
+            self.weight = (1 - decay) + decay * self.weight
+            self.history += 1
+            self.expired_through = index
+            self.total -= count
+        if cutoff > self.expired_through:
+            self._skip_empty(cutoff - self.expired_through, decay)
+            self.expired_through = cutoff
+
+    def add(self, bucket):
+        if self.buckets and self.buckets[-1][0] == bucket:
+            self.buckets[-1][1] += 1
+        else:
+            self.buckets.append([bucket, 1])
+        self.total += 1
+
+
+class OutbreakDetector:
+    """Sliding-window surge detection with bounded per-location state"""
+
+    def __init__(self, window_seconds=3600, bucket_seconds=60, alpha=0.1, threshold=3.0,
+                 min_reports=5, cooldown_seconds=3600, max_locations=10000):
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = max(1, window_seconds // bucket_seconds)
+        # alpha weighs a whole window of history; spread it over the window's buckets
+        self.decay = (1 - alpha) ** (1 / self.window_buckets)
+        self.threshold = threshold
+        self.min_reports = min_reports
+        self.cooldown_buckets = math.ceil(cooldown_seconds / bucket_seconds)
+        self.max_locations = max_locations
+        self.locations = OrderedDict()
+        self.latest_bucket = 0
+
+    def observe(self, key, location, submitted_at):
+        """Count one report; returns an alert dict when its location surges"""
+        # Late reports are counted in the current bucket rather than reordered
+        # submitted_at is naive UTC from MongoDB; timegm reads it as UTC whatever the host's timezone
+        bucket = max(calendar.timegm(submitted_at.utctimetuple()) // self.bucket_seconds, self.latest_bucket)
+        self.latest_bucket = bucket
+
+        state = self.locations.get(key)
+        if state is None:
+            state = self.locations[key] = LocationWindow(location.strip(), bucket)
+            if len(self.locations) > self.max_locations:
+                self.locations.popitem(last=False)
+        else:
+            self.locations.move_to_end(key)
+
+        state.advance(bucket, self.window_buckets, self.decay)
+        state.add(bucket)
+        return self._check(key, state, bucket)
+
+    def _check(self, key, state, bucket):
+        # A location needs a full window of history before its baseline means anything
+        if state.history < self.window_buckets:
+            return None
+        expected = state.baseline * self.window_buckets
+        if state.total < self.min_reports or state.total < self.threshold * max(expected, 1.0):
+            return None
+        if state.last_alert_bucket is not None and bucket - state.last_alert_bucket < self.cooldown_buckets:
+            return None
+        state.last_alert_bucket = bucket
+
+        window_end = EPOCH + timedelta(seconds=(bucket + 1) * self.bucket_seconds)
+        window_start = window_end - timedelta(seconds=self.window_buckets * self.bucket_seconds)
+        return {
+            'location': state.location,
+            'location_key': key,
+            'window_start': window_start,
+            'window_end': window_end,
+            'report_count': state.total,
+            'expected_count': round(expected, 2),
+            'ratio': round(state.total / expected, 2) if expected else None
+        }
+
+
+class OutbreakMonitor:
+    """Feeds new reports into an OutbreakDetector and stores its alerts"""
+
+    def __init__(self, db, detector, poll_interval=2, checkpoint_interval=10, poll_overlap=30):
+        self.db = db
+        self.detector = detector
+        self.poll_interval = poll_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.poll_overlap = poll_overlap  # seconds of _ids re-read by each poll
+        self._last_checkpoint = 0.0
+
+    def handle(self, report, source):
+        OUTBREAK_REPORTS.inc(source=source)
+        key = report.get('location_key') or location_key(report['location'])
+        alert = self.detector.observe(key, report['location'], report['submitted_at'])
+        if alert is None:
+            return
+        alert.update({'detected_at': datetime.utcnow(), 'status': 'open', 'trigger_report_id': report['_id']})
+        self.db.outbreak_alerts.insert_one(alert)
+        OUTBREAK_ALERTS.inc()
+        print(f"⚠ Possible outbreak in {alert['location']}: "
+              f"{alert['report_count']} reports vs {alert['expected_count']} expected")
+
+    def load_checkpoint(self):
+        return self.db.maintenance_jobs.find_one({'_id': JOB_NAME}) or {}
+
+    def save_checkpoint(self, **fields):
+        now = time.monotonic()
+        if now - self._last_checkpoint < self.checkpoint_interval:
+            return
+        self._last_checkpoint = now
+        fields['updated_at'] = datetime.utcnow()
+        self.db.maintenance_jobs.update_one({'_id': JOB_NAME}, {'$set': fields}, upsert=True)
+
+    def watch(self):
+        """Consume inserts from a change stream, resuming from the saved token"""
+        pipeline = [
+            {'$match': {'operationType': 'insert'}},
+            {'$project': {f'fullDocument.{field}': 1 for field in REPORT_FIELDS}}
+        ]
+        token = self.load_checkpoint().get('resume_token')
+        with self.db.reports.watch(pipeline, resume_after=token) as stream:
+            print("✓ Watching reports through a change stream")
+            for change in stream:
+                self.handle(change['fullDocument'], 'change_stream')
+                self.save_checkpoint(resume_token=stream.resume_token)
+
+    def poll(self):
+        """Tail the reports collection by _id (for servers without change streams).
+
+        _ids are made by the web workers and the bot, so a report can be
+        committed after one with a higher _id has been read. Each poll re-reads
+        the last poll_overlap seconds of _ids and skips reports already counted."""
+        last_id = self.load_checkpoint().get('last_report_id')
+        if last_id is None:
+            # Start from the newest report; history is never re-read
+            newest = self.db.reports.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+            last_id = newest['_id'] if newest else None
+        print("✓ Polling reports for new inserts")
+        seen = set()  # _ids read within the overlap window
+        resumed = False
+        while True:
+            if last_id is None:
+                query = {}
+            elif not resumed:
+                # Reports counted before a restart are not known, so the first poll is exact
+                query = {'_id': {'$gt': last_id}}
+            else:
+                overlap_start = last_id.generation_time - timedelta(seconds=self.poll_overlap)
+                query = {'_id': {'$gt': ObjectId.from_datetime(overlap_start)}}
+            resumed = True
+            found = False
+            for report in self.db.reports.find(query, REPORT_FIELDS).sort('_id', ASCENDING):
+                if report['_id'] in seen:
+                    continue
+                seen.add(report['_id'])
+                self.handle(report, 'poll')
+                last_id = report['_id'] if last_id is None else max(last_id, report['_id'])
+                found = True
+            if last_id is not None:
+                horizon = last_id.generation_time - timedelta(seconds=self.poll_overlap)
+                seen = {report_id for report_id in seen if report_id.generation_time >= horizon}
+            if found:
+                self.save_checkpoint(last_report_id=last_id)
+            time.sleep(self.poll_interval)
+
+    def run(self):
+        try:
+            self.watch()
+        except OperationFailure as e:
+            # Code 40573: change streams need a replica set or sharded cluster
+            if e.code != 40573:
+                raise
+            self.poll()
+
+
+def main():
+    config = get_config()
+    try:
+        client = MongoClient(config.MONGODB_URI, event_listeners=[metrics.MongoCommandMetrics()])
+        db = client[config.MONGODB_DB_NAME]
+        client.admin.command('ismaster')
+        print(f"✓ Connected to MongoDB: {config.MONGODB_DB_NAME}")
+    except Exception as e:
+        print(f"✗ Failed to connect to MongoDB: {e}")
+        sys.exit(1)
+
+    if config.OUTBREAK_METRICS_PORT:
+        metrics.start_metrics_server(config.OUTBREAK_METRICS_PORT)
+
+    detector = OutbreakDetector(
+        window_seconds=config.OUTBREAK_WINDOW_MINUTES * 60,
+        bucket_seconds=config.OUTBREAK_BUCKET_SECONDS,
+        alpha=config.OUTBREAK_EWMA_ALPHA,
+        threshold=config.OUTBREAK_THRESHOLD,
+        min_reports=config.OUTBREAK_MIN_REPORTS,
+        cooldown_seconds=config.OUTBREAK_COOLDOWN_MINUTES * 60,
+        max_locations=config.OUTBREAK_MAX_LOCATIONS
+    )
+    monitor = OutbreakMonitor(db, detector, poll_interval=config.OUTBREAK_POLL_INTERVAL)
+    while True:
+        try:
+            monitor.run()
+        except KeyboardInterrupt:
+            break
+        except PyMongoError as e:
+            print(f"Outbreak detector lost its MongoDB cursor, restarting: {e}")
+            time.sleep(monitor.poll_interval)
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
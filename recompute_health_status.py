@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Bulk health status recomputation for MedAether
+Streams the users collection, recomputes health_status in chunks and writes
+back only the rows that changed. Progress is checkpointed so an interrupted
+run can be resumed.
+"""
+
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from config import get_config
+from health_status import calculate_health_status
+
+JOB_NAME = 'recompute_health_status'
+
+
+def compute_changes(rows):
+    """Return (user_id, medical_history read, new_status) for every row whose status changed"""
+    changes = []
+    for user_id, medical_history, current_status in rows:
+        new_status = calculate_health_status({'medical_history': medical_history or []})
+        if new_status != current_status:
+            changes.append((user_id, medical_history, new_status))
+    return changes
+
+
+def iter_chunks(db, chunk_size, resume_after=None):
+    """Stream users in _id order with only the fields the calculation needs"""
+    query = {'_id': {'$gt': resume_after}} if resume_after is not None else {}
+    cursor = db.users.find(
+        query,
+        {'_id': 1, 'medical_history': 1, 'health_status': 1}
+    ).sort('_id', ASCENDING).batch_size(chunk_size)
+
+    chunk = []
+    for user in cursor:
+        chunk.append((user['_id'], user.get('medical_history'), user.get('health_status')))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def apply_changes(db, changes, dry_run=False):
+    """Write changed statuses with a single unordered bulk_write.
+
+    Each update only applies while medical_history still holds the value it
+    was computed from, so a profile edited during the run keeps its new status."""
+    if not changes or dry_run:
+        return len(changes)
+    now = datetime.utcnow()
+    requests = [
+        UpdateOne(
+            {'_id': user_id, 'medical_history': medical_history},
+            {'$set': {'health_status': status, 'health_status_updated': now}}
+        )
+        for user_id, medical_history, status in changes
+    ]
+    result = db.users.bulk_write(requests, ordered=False)
+    return result.modified_count
+
+
+def load_checkpoint(db):
+    """Return the saved checkpoint document, if any"""
+    return db.maintenance_jobs.find_one({'_id': JOB_NAME})
+
+
+def save_checkpoint(db, last_id, processed, updated, finished=False):
+    """Record progress so that --resume can continue after last_id"""
+    db.maintenance_jobs.update_one(
+        {'_id': JOB_NAME},
+        {'$set': {
+            'last_id': last_id,
+            'processed': processed,
+            'updated': updated,
+            'finished': finished,
+            'updated_at': datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+
+def recompute(db, chunk_size=1000, processes=1, resume=False, dry_run=False):
+    """Recompute every user's health status and return (processed, updated)"""
+    resume_after = None
+    processed = updated = 0
+    if resume:
+        checkpoint = load_checkpoint(db)
+        if checkpoint and not checkpoint.get('finished'):
+            resume_after = checkpoint['last_id']
+            processed = checkpoint.get('processed', 0)
+            updated = checkpoint.get('updated', 0)
+            print(f"ℹ Resuming after user {resume_after} ({processed} already processed)")
+        else:
+            print("ℹ No unfinished run to resume, starting from the beginning")
+
+    total = db.users.estimated_document_count()
+    started = time.monotonic()
+    executor = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+
+    def report(last_id):
+        if not dry_run:
+            save_checkpoint(db, last_id, processed, updated)
+        elapsed = time.monotonic() - started
+        rate = processed / elapsed if elapsed else 0
+        print(f"• {processed}/{total} users processed, {updated} updated ({rate:.0f} users/s)")
+
+    try:
+        if executor is None:
+            for chunk in iter_chunks(db, chunk_size, resume_after):
+                updated += apply_changes(db, compute_changes(chunk), dry_run)
+                processed += len(chunk)
+                report(chunk[-1][0])
+        else:
+            # Keep a bounded number of chunks in flight and apply results in order,
+            # so the checkpoint never moves past a chunk that has not been written
+            pending = deque()
+            for chunk in iter_chunks(db, chunk_size, resume_after):
+                pending.append((chunk[-1][0], len(chunk), executor.submit(compute_changes, chunk)))
+                while len(pending) >= processes * 2:
+                    last_id, size, future = pending.popleft()
+                    updated += apply_changes(db, future.result(), dry_run)
+                    processed += size
+                    report(last_id)
+            while pending:
+                last_id, size, future = pending.popleft()
+                updated += apply_changes(db, future.result(), dry_run)
+                processed += size
+                report(last_id)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if not dry_run:
+        db.maintenance_jobs.update_one({'_id': JOB_NAME}, {'$set': {'finished': True}})
+    return processed, updated
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recompute stored health status for all users")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Users per chunk and bulk write")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes used to compute status")
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Compute changes without writing them")
+    args = parser.parse_args()
+
+    config = get_config()
+    try:
+        client = MongoClient(config.MONGODB_URI)
+        db = client[config.MONGODB_DB_NAME]
+        client.admin.command('ismaster')
+        print(f"✓ Connected to MongoDB: {config.MONGODB_DB_NAME}")
+    except Exception as e:
+        print(f"✗ Failed to connect to MongoDB: {e}")
+        sys.exit(1)
+
+    try:
+        processed, updated = recompute(
+            db,
+            chunk_size=args.chunk_size,
+            processes=args.processes,
+            resume=args.resume,
+            dry_run=args.dry_run
+        )
+        action = "would be updated" if args.dry_run else "updated"
+        print(f"✓ Recomputed {processed} users, {updated} {action}")
+    except KeyboardInterrupt:
+        print("\nℹ Interrupted, run again with --resume to continue")
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
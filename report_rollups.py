@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Community report rollups for MedAether
+Keeps one counter document per (day, location, severity, status) in the
+report_rollups collection. Counters are updated incrementally as reports are
+submitted and change status, and can be rebuilt from the reports collection
+with a $merge aggregation (run on a schedule to repair any drift).
+"""
+
+import sys
+from datetime import datetime, timedelta
+from pymongo import MongoClient
+from config import get_config
+
+ROLLUP_FIELDS = ('day', 'location_key', 'severity', 'status')
+
+
+def location_key(location):
+    """Normalised location used for grouping (case and whitespace insensitive)"""
+    return ' '.join(location.split()).lower()
+
+
+def day_of(moment):
+    return moment.strftime('%Y-%m-%d')
+
+
+def _rollup_filter(report, status):
+    return {
+        'day': day_of(report['submitted_at']),
+        'location_key': report.get('location_key') or location_key(report['location']),
+        'severity': report['severity'],
+        'status': status
+    }
+
+
+def _increment(db, report, status, amount, session=None):
+    now = datetime.utcnow()
+    db.report_rollups.update_one(
+        _rollup_filter(report, status),
+        {
+            '$inc': {'count': amount},
+            '$set': {'updated_at': now},
+            '$setOnInsert': {'location': report['location'].strip()}
+        },
+        upsert=True,
+        session=session
+    )
+
+
+def record_report(db, report, session=None):
+    """Count a newly inserted report"""
+    _increment(db, report, report['status'], 1, session=session)
+
+
+def record_status_change(db, report, new_status, session=None):
+    """Move a report's count from its previous status to new_status"""
+    _increment(db, report, report['status'], -1, session=session)
+    _increment(db, report, new_status, 1, session=session)
+
+
+def rebuild(db, days=None):
+    """Recompute rollups from reports with $merge; returns the number of stale rollups removed.
+
+    With days, only the last `days` days are rebuilt. Rollups written by
+    incremental updates while the rebuild runs are kept."""
+    # MongoDB stores milliseconds; truncate so the marker compares equal
+    now = datetime.utcnow()
+    started = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    pipeline = []
+    stale = {'rebuilt_at': {'$ne': started}, 'updated_at': {'$lt': started}}
+    if days:
+        since = (started - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        pipeline.append({'$match': {'submitted_at': {'$gte': since}}})
+        stale['day'] = {'$gte': day_of(since)}
+
+    pipeline.extend([
+        {'$group': {
+            '_id': {
+                'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$submitted_at'}},
+                'location_key': {'$ifNull': ['$location_key', {'$toLower': {'$trim': {'input': '$location'}}}]},
+                'severity': '$severity',
+                'status': '$status'
+            },
+            'location': {'$first': {'$trim': {'input': '$location'}}},
+            'count': {'$sum': 1}
+        }},
+        {'$project': {
+            '_id': 0,
+            'day': '$_id.day',
+            'location_key': '$_id.location_key',
+            'severity': '$_id.severity',
+            'status': '$_id.status',
+            'location': 1,
+            'count': 1,
+            'updated_at': started,
+            'rebuilt_at': started
+        }},
+        {'$merge': {
+            'into': 'report_rollups',
+            'on': list(ROLLUP_FIELDS),
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }}
+    ])
+    db.reports.aggregate(pipeline)
+
+    # Groups that no longer have any reports
+    return db.report_rollups.delete_many(stale).deleted_count
+
+
+def query_rollups(db, days=30, location=None, severity=None, status=None):
+    """Heatmap (per location and severity) and daily time series for the last `days` days.
+
+    Reads only rollup documents, so the cost depends on the number of
+    locations and days, not on the number of reports."""
+    since = day_of(datetime.utcnow() - timedelta(days=days - 1))
+    match = {'day': {'$gte': since}, 'count': {'$gt': 0}}
+    if location:
+        match['location_key'] = location_key(location)
+    if severity:
+        match['severity'] = severity
+    if status:
+        match['status'] = status
+
+    result = next(db.report_rollups.aggregate([
+        {'$match': match},
+        {'$facet': {
+            'heatmap': [
+                {'$group': {
+                    '_id': {'location_key': '$location_key', 'severity': '$severity'},
+                    'location': {'$first': '$location'},
+                    'count': {'$sum': '$count'}
+                }},
+                {'$sort': {'count': -1}}
+            ],
+            'timeseries': [
+                {'$group': {'_id': '$day', 'count': {'$sum': '$count'}}},
+                {'$sort': {'_id': 1}}
+            ]
+        }}
+    ]), {'heatmap': [], 'timeseries': []})
+
+    return {
+        'since': since,
+        'heatmap': [
+            {'location': row['location'], 'severity': row['_id']['severity'], 'count': row['count']}
+            for row in result['heatmap']
+        ],
+        'timeseries': [{'day': row['_id'], 'count': row['count']} for row in result['timeseries']]
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild community report rollups from the reports collection")
+    parser.add_argument("--days", type=int, default=None, help="Only rebuild the last N days")
+    args = parser.parse_args()
+
+    config = get_config()
+    try:
+        client = MongoClient(config.MONGODB_URI)
+        db = client[config.MONGODB_DB_NAME]
+        client.admin.command('ismaster')
+        print(f"✓ Connected to MongoDB: {config.MONGODB_DB_NAME}")
+    except Exception as e:
+        print(f"✗ Failed to connect to MongoDB: {e}")
+        sys.exit(1)
+
+    try:
+        removed = rebuild(db, days=args.days)
+        print(f"✓ Report rollups rebuilt ({removed} stale rollups removed)")
+    except Exception as e:
+        print(f"✗ Rollup rebuild failed: {e}")
+        sys.exit(1)
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
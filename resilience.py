@@ -0,0 +1,278 @@
+"""
+Circuit breakers for MedAether's remote dependencies
+Each breaker wraps calls to one dependency (the model backend, the translator)
+with an explicit deadline, optional hedged second attempts after the recent
+p95 latency, and a rolling window of outcomes that opens the circuit when too
+many calls fail or run slow, so callers fail fast to their fallback instead of
+waiting out client timeouts.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent import futures
+import metrics
+
+DEPENDENCY_CALLS = metrics.REGISTRY.counter(
+    'medaether_dependency_calls_total',
+    'Calls through a circuit breaker by dependency and outcome (success, error, timeout, rejected)',
+    ('dependency', 'outcome')
+)
+HEDGED_CALLS = metrics.REGISTRY.counter(
+    'medaether_dependency_hedged_calls_total',
+    'Hedged second attempts by dependency and the attempt that answered first (primary, hedge, none)',
+    ('dependency', 'winner')
+)
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+# allow() returns TRIAL to the one caller admitted while half open, True to the others
+TRIAL = 'trial'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Every breaker by dependency name, for the state gauge
+BREAKERS = {}
+metrics.REGISTRY.gauge_callback(
+    'medaether_circuit_state',
+    'Circuit breaker state by dependency (0 closed, 1 half open, 2 open)',
+    ('dependency',),
+    lambda: {(name,): STATE_VALUES[breaker.state] for name, breaker in list(BREAKERS.items())}
+)
+
+
+class CircuitOpen(RuntimeError):
+    """The dependency's breaker is open; use the fallback"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """No attempt finished within the call's deadline"""
+
+
+class CircuitBreaker:
+    """Deadline, hedging and rolling-window circuit breaker for one dependency.
+
+    A call counts as failed when it raises (except for the exception types in
+    ignore, such as local overload) or misses its deadline, and as slow when it
+    succeeds after more than slow_call seconds. Once the window holds min_calls
+    calls and the failed or slow share reaches failure_rate the breaker opens;
+    after cooldown seconds a single trial call decides whether it closes again.
+
+    Blocking calls run on the breaker's own thread pool so the caller can stop
+    waiting at the deadline. An abandoned attempt keeps its pool thread until
+    the client's own timeout, so max_workers bounds how many can pile up."""
+
+    def __init__(self, name, deadline, slow_call=None, hedge=False, window=60, min_calls=10,
+                 failure_rate=0.5, cooldown=30, max_workers=16, ignore=()):
+        self.name = name
+        self.deadline = deadline
+        self.slow_call = slow_call if slow_call is not None else deadline
+        self.hedge = hedge
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.max_workers = max_workers
+        self.ignore = tuple(ignore)
+        self.state = CLOSED
+        self._calls = deque()  # (finished_at, failed_or_slow, latency or None)
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        self._executor = None
+        BREAKERS[name] = self
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=f"{self.name}-call"
+                    )
+        return self._executor
+
+    def _prune(self, now):
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    def allow(self):
+        """Admission for a call: TRIAL or True if it may go ahead, False (counted as rejected) if not"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._trial = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return TRIAL
+        DEPENDENCY_CALLS.inc(dependency=self.name, outcome='rejected')
+        return False
+
+    def record(self, ok, latency, outcome=None, admission=True):
+        """Add a finished call to the window and open or close the circuit.
+
+        While half open only the trial's own outcome decides the circuit; calls
+        admitted before it opened are just counted."""
+        now = time.monotonic()
+        failed = not ok or latency > self.slow_call
+        DEPENDENCY_CALLS.inc(dependency=self.name, outcome=outcome or ('success' if ok else 'error'))
+        with self._lock:
+            self._calls.append((now, failed, latency if ok else None))
+            self._prune(now)
+            if self.state == HALF_OPEN:
+                if admission != TRIAL:
+                    return
+                if failed:
+                    self.state, self._opened_at = OPEN, now
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                self._trial = False
+            elif self.state == CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, call_failed, _ in self._calls if call_failed)
+                if failures / len(self._calls) >= self.failure_rate:
+                    self.state, self._opened_at = OPEN, now
+                    print(f"Circuit for {self.name} opened: {failures}/{len(self._calls)} calls failed or slow")
+
+    def release(self, admission):
+        """Give back an admission that ended without a verdict; only the trial's own frees the trial"""
+        if admission != TRIAL:
+            return
+        with self._lock:
+            self._trial = False
+
+    def hedge_delay(self):
+        """p95 latency of recent successful calls, or None when hedging is off or data is thin"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            self._prune(time.monotonic())
+            latencies = sorted(latency for _, _, latency in self._calls if latency is not None)
+        if len(latencies) < self.min_calls:
+            return None
+        delay = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        return delay if delay < self.deadline else None
+
+    def _finish(self, admission, started, error, hedged, winner):
+        """Record an attempt set's outcome and return the exception to raise, if any"""
+        latency = time.monotonic() - started
+        if hedged:
+            HEDGED_CALLS.inc(dependency=self.name, winner=winner or 'none')
+        if error is None:
+            self.record(True, latency, admission=admission)
+            return None
+        if isinstance(error, self.ignore):
+            self.release(admission)
+            return error
+        outcome = 'timeout' if isinstance(error, (TimeoutError, futures.TimeoutError)) else 'error'
+        self.record(False, latency, outcome, admission)
+        return error
+
+    def call(self, func):
+        """Run func() within the deadline, hedging once after the p95 delay if enabled"""
+        admission = self.allow()
+        if not admission:
+            raise CircuitOpen(f"{self.name} circuit is open")
+        return self.run(func, admission)
+
+    def run(self, func, admission=True):
+        """call() for a caller that already got its admission from allow()"""
+        started = time.monotonic()
+        delay = self.hedge_delay()
+        hedge_at = started + delay if delay is not None else None
+        deadline_at = started + self.deadline
+        roles = {self._pool().submit(func): 'primary'}
+        pending = set(roles)
+        error = DeadlineExceeded(f"{self.name} call exceeded {self.deadline}s")
+        decided = False
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    break
+                wake = deadline_at if hedge_at is None else min(deadline_at, hedge_at)
+                done, pending = futures.wait(pending, timeout=wake - now, return_when=futures.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        decided = True
+                        self._finish(admission, started, None, len(roles) > 1, roles[attempt])
+                        return attempt.result()
+                    error = attempt.exception()
+                if pending and hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    hedge = self._pool().submit(func)
+                    roles[hedge] = 'hedge'
+                    pending.add(hedge)
+            if pending:
+                error = DeadlineExceeded(f"{self.name} call exceeded {self.deadline}s")
+            decided = True
+            raise self._finish(admission, started, error, len(roles) > 1, None)
+        finally:
+            for attempt in pending:
+                attempt.cancel()
+            if not decided:
+                # Interrupted or cancelled before a verdict; give back a half-open trial
+                self.release(admission)
+
+    async def acall(self, coroutine_function):
+        """call() for the event loop; losing and late attempts are cancelled"""
+        admission = self.allow()
+        if not admission:
+            raise CircuitOpen(f"{self.name} circuit is open")
+        return await self.arun(coroutine_function, admission)
+
+    async def arun(self, coroutine_function, admission=True):
+        """acall() for a caller that already got its admission from allow()"""
+        started = time.monotonic()
+        delay = self.hedge_delay()
+        hedge_at = started + delay if delay is not None else None
+        deadline_at = started + self.deadline
+        roles = {asyncio.ensure_future(coroutine_function()): 'primary'}
+        pending = set(roles)
+        error = DeadlineExceeded(f"{self.name} call exceeded {self.deadline}s")
+        decided = False
+        try:
+            while pending:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    break
+                wake = deadline_at if hedge_at is None else min(deadline_at, hedge_at)
+                done, pending = await asyncio.wait(pending, timeout=wake - now, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None:
+                        decided = True
+                        self._finish(admission, started, None, len(roles) > 1, roles[attempt])
+                        return attempt.result()
+                    error = attempt.exception()
+                if pending and hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedge_at = None
+                    hedge = asyncio.ensure_future(coroutine_function())
+                    roles[hedge] = 'hedge'
+                    pending.add(hedge)
+            if pending:
+                error = DeadlineExceeded(f"{self.name} call exceeded {self.deadline}s")
+            decided = True
+            raise self._finish(admission, started, error, len(roles) > 1, None)
+        finally:
+            for attempt in pending:
+                attempt.cancel()
+            if not decided:
+                # Interrupted or cancelled before a verdict; give back a half-open trial
+                self.release(admission)
+
+
+def create_breaker(name, settings, deadline, slow_call=None, hedge=False, **options):
+    """Breaker using the shared CIRCUIT_* settings, or None when breakers are disabled"""
+    if not settings['CIRCUIT_BREAKER_ENABLED']:
+        return None
+    return CircuitBreaker(
+        name,
+        deadline,
+        slow_call=slow_call,
+        hedge=hedge,
+        window=settings['CIRCUIT_WINDOW'],
+        min_calls=settings['CIRCUIT_MIN_CALLS'],
+        failure_rate=settings['CIRCUIT_FAILURE_RATE'],
+        cooldown=settings['CIRCUIT_COOLDOWN'],
+        **options
+    )
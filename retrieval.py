@@ -0,0 +1,276 @@
+"""
+Local answers for common health questions
+An in-memory BM25 index over the health problem and plan catalog and over
+curated past answers from chat_history. Questions that match an entry with
+enough confidence are answered from it; everything else goes to the model.
+"""
+
+import heapq
+import math
+import re
+import threading
+import metrics
+from config import DEFAULT_HEALTH_PROBLEMS, DEFAULT_HEALTH_PLANS
+from consultation import CACHE_STOPWORDS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RETRIEVAL_LOOKUPS = metrics.REGISTRY.counter(
+    'medaether_retrieval_lookups_total',
+    'Questions checked against the local answer index by result (hit, miss)',
+    ('result',)
+)
+RETRIEVAL_CONFIDENCE = metrics.REGISTRY.histogram(
+    'medaether_retrieval_confidence',
+    'Confidence of the best local match for each question',
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+)
+
+# Words that say what kind of help is wanted rather than what the problem is
+RETRIEVAL_STOPWORDS = CACHE_STOPWORDS | frozenset([
+    'treat', 'treatment', 'cure', 'remedy', 'medicine', 'home', 'relief', 'relieve', 'best',
+    'good', 'way', 'quick', 'quickly', 'natural', 'need', 'want', 'know', 'feel', 'feeling',
+    'take', 'get', 'rid', 'doctor', 'hi', 'hello', 'thank', 'thanks', 'advice', 'suggest',
+    'tip', 'plan', 'in', 'on', 'at', 'when', 'why', 'which', 'you', 'your', 'will', 'there'
+])
+
+CATALOG_NOTE = "This is general guidance only. Please consult a healthcare professional if your symptoms persist or worsen."
+
+# Candidates by BM25 score whose confidence is checked
+CANDIDATES = 5
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 6 and word.endswith('ing'):
+        return word[:-3]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    """Lowercased, lightly stemmed terms of a text without filler words"""
+    terms = (_stem(word) for word in re.findall(r'[a-z0-9]+', (text or '').lower()))
+    return [term for term in terms if term not in RETRIEVAL_STOPWORDS]
+
+
+def problem_document(problem):
+    """Index entry for a quick health solution"""
+    return {
+        'source': 'health_problem',
+        'title': problem['name'],
+        'text': ' '.join([problem['name'], problem['name'], problem.get('description', ''),
+                          problem.get('medicine', ''), problem.get('home_remedy', '')]),
+        'answer': f"""{problem['name']}: {problem.get('description', '')}
+
+        • Medicine: {problem.get('medicine', '')}
+        • Home remedy: {problem.get('home_remedy', '')}
+        • Precautions: {problem.get('precautions', '')}
+
+        {CATALOG_NOTE}""",
+        'strict': False
+    }
+
+
+def plan_document(plan):
+    """Index entry for a health plan"""
+    return {
+        'source': 'health_plan',
+        'title': plan['name'],
+        'text': ' '.join([plan['name'], plan['name'], plan.get('description', ''),
+                          plan.get('diet', ''), plan.get('exercise', '')]),
+        'answer': f"""{plan['name']}: {plan.get('description', '')}
+
+        • Diet: {plan.get('diet', '')}
+        • Exercise: {plan.get('exercise', '')}
+        • Lifestyle: {plan.get('lifestyle', '')}
+
+        {CATALOG_NOTE}""",
+        'strict': False
+    }
+
+
+def build_documents(problems=DEFAULT_HEALTH_PROBLEMS, plans=DEFAULT_HEALTH_PLANS, curated=()):
+    """Index entries for the catalog and any curated answers"""
+    return (
+        [problem_document(problem) for problem in problems] +
+        [plan_document(plan) for plan in plans] +
+        [curated_document(chat) for chat in curated]
+    )
+
+
+def curated_document(chat):
+    """Index entry for a curated past answer; the whole question has to match"""
+    return {
+        'source': 'curated',
+        'title': chat['user_message'],
+        'text': chat['user_message'],
+        'answer': chat['ai_response'],
+        'strict': True
+    }
+
+
+class BM25Index:
+    """Immutable BM25 index with per-term postings.
+
+    With NumPy each term's postings are a pair of arrays (document ids and
+    precomputed BM25 weights), so scoring a question is one vectorized add per
+    query term; without it the same weights are summed in a dict.
+
+    Confidence measures how much of the question a document covers: the IDF
+    mass of the question's terms found in the document over the IDF mass of
+    all of them, with unknown terms weighing as much as the rarest term. A
+    catalog entry also needs a word of its name in the question, and a curated
+    answer needs its whole question covered as well."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.documents = documents
+        tokenized = [tokenize(document['text']) for document in documents]
+        self.document_terms = [set(terms) for terms in tokenized]
+        self.title_terms = [set(tokenize(document['title'])) for document in documents]
+        count = len(documents)
+        average_length = (sum(len(terms) for terms in tokenized) / count) if count else 1.0
+
+        frequencies = {}
+        for doc_id, terms in enumerate(tokenized):
+            for term in terms:
+                postings = frequencies.setdefault(term, {})
+                postings[doc_id] = postings.get(doc_id, 0) + 1
+
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in frequencies.items()
+        }
+        self.unknown_idf = math.log(1 + (count + 0.5) / 0.5)
+        self.postings = {}
+        for term, postings in frequencies.items():
+            doc_ids = list(postings)
+            weights = [
+                self.idf[term] * postings[doc_id] * (k1 + 1) / (
+                    postings[doc_id] + k1 * (1 - b + b * len(tokenized[doc_id]) / average_length)
+                )
+                for doc_id in doc_ids
+            ]
+            if np is not None:
+                self.postings[term] = (np.array(doc_ids, dtype=np.int32), np.array(weights, dtype=np.float32))
+            else:
+                self.postings[term] = list(zip(doc_ids, weights))
+
+    def __len__(self):
+        return len(self.documents)
+
+    def scores(self, terms):
+        """Top BM25 candidates for a set of query terms as [(score, doc_id)]"""
+        matched = [self.postings[term] for term in terms if term in self.postings]
+        if not matched:
+            return []
+        if np is not None:
+            totals = np.zeros(len(self.documents), dtype=np.float32)
+            for doc_ids, weights in matched:
+                totals[doc_ids] += weights
+            top = np.argpartition(-totals, min(CANDIDATES, len(totals)) - 1)[:CANDIDATES]
+            return [(float(totals[doc_id]), int(doc_id)) for doc_id in top if totals[doc_id] > 0]
+        totals = {}
+        for postings in matched:
+            for doc_id, weight in postings:
+                totals[doc_id] = totals.get(doc_id, 0.0) + weight
+        return heapq.nlargest(CANDIDATES, ((score, doc_id) for doc_id, score in totals.items()))
+
+    def _coverage(self, terms, found):
+        total = sum(self.idf.get(term, self.unknown_idf) for term in terms)
+        covered = sum(self.idf.get(term, self.unknown_idf) for term in terms if term in found)
+        return covered / total if total else 0.0
+
+    def confidence(self, terms, doc_id):
+        """Share of the question (and of the entry's title) that the entry covers"""
+        title = self.title_terms[doc_id]
+        question = self._coverage(terms, self.document_terms[doc_id])
+        if self.documents[doc_id]['strict']:
+            return min(question, self._coverage(title, terms))
+        return question if title & terms else 0.0
+
+    def best(self, question):
+        """(document, confidence) of the most confident match, or (None, 0.0)"""
+        terms = set(tokenize(question))
+        best_document, best_confidence, best_score = None, 0.0, 0.0
+        for score, doc_id in self.scores(terms):
+            confidence = self.confidence(terms, doc_id)
+            if (confidence, score) > (best_confidence, best_score):
+                best_document, best_confidence, best_score = self.documents[doc_id], confidence, score
+        return best_document, best_confidence
+
+
+class Retriever:
+    """Answers questions from the local index when a match is confident enough"""
+
+    def __init__(self, db=None, threshold=0.8, curated_limit=5000):
+        self.db = db
+        self.threshold = threshold
+        self.curated_limit = curated_limit
+        self.index = BM25Index([])
+        self.lookups = 0
+        self.hits = 0
+        self._stop = threading.Event()
+        metrics.REGISTRY.gauge_callback(
+            'medaether_retrieval',
+            'Local answer index size, confidence threshold and hit rate',
+            ('stat',),
+            lambda: {
+                ('documents',): len(self.index),
+                ('threshold',): self.threshold,
+                ('hit_rate',): self.hits / self.lookups if self.lookups else 0.0
+            }
+        )
+
+    def load_documents(self):
+        """Catalog entries (seeded collections, else the defaults) and curated answers"""
+        problems, plans, curated = [], [], []
+        if self.db is not None:
+            problems = list(self.db.health_problems.find({}, {'_id': 0}))
+            plans = list(self.db.health_plans.find({}, {'_id': 0}))
+            # Answers are translated per request, so only English ones are indexed
+            curated = list(self.db.chat_history.find(
+                {'curated': True, 'language': 'en'},
+                {'user_message': 1, 'ai_response': 1}
+            ).sort('curated_at', -1).limit(self.curated_limit))
+        return build_documents(problems or DEFAULT_HEALTH_PROBLEMS, plans or DEFAULT_HEALTH_PLANS, curated)
+
+    def rebuild(self):
+        """Build a fresh index and swap it in"""
+        try:
+            documents = self.load_documents()
+        except Exception as e:
+            print(f"Retrieval index load error: {e}")
+            if len(self.index):
+                return self  # Keep serving the previous index
+            documents = build_documents()
+        self.index = BM25Index(documents)
+        return self
+
+    def refresh_in_background(self, interval):
+        """Rebuild the index every interval seconds to pick up newly curated answers"""
+        def run():
+            while not self._stop.wait(interval):
+                self.rebuild()
+
+        threading.Thread(target=run, name='retrieval-refresh', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def answer(self, question):
+        """English answer from the index, or None below the confidence threshold"""
+        document, confidence = self.index.best(question)
+        RETRIEVAL_CONFIDENCE.observe(confidence)
+        self.lookups += 1
+        if document is None or confidence < self.threshold:
+            RETRIEVAL_LOOKUPS.inc(result='miss')
+            return None
+        self.hits += 1
+        RETRIEVAL_LOOKUPS.inc(result='hit')
+        return document['answer']
@@ -0,0 +1,101 @@
+"""
+In-flight request coalescing for MedAether
+Concurrent calls with the same key share one execution: the first caller
+(the leader) does the work and every caller that arrives while it runs (a
+follower) waits for its result instead of repeating it. Works across threads
+(do) and across coroutines on one event loop (ado).
+"""
+
+import asyncio
+import threading
+import metrics
+
+SINGLEFLIGHT_CALLS = metrics.REGISTRY.counter(
+    'medaether_singleflight_calls_total',
+    'Coalesced calls by flight name and role (leader, follower, timeout)',
+    ('name', 'role')
+)
+
+
+class FollowerTimeout(Exception):
+    """A follower gave up waiting for the leader's result"""
+
+
+class Flight:
+    """One in-progress call and the outcome its followers wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key"""
+
+    def __init__(self, name='default'):
+        self.name = name
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._tasks = {}  # asyncio tasks; only touched from the event loop
+
+    def begin(self, key):
+        """Return (flight, is_leader); the leader must call finish()"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                SINGLEFLIGHT_CALLS.inc(name=self.name, role='follower')
+                return flight, False
+            flight = self._flights[key] = Flight()
+        SINGLEFLIGHT_CALLS.inc(name=self.name, role='leader')
+        return flight, True
+
+    def finish(self, key, flight, result=None, error=None):
+        """Publish the leader's outcome and release its followers"""
+        flight.result = result
+        flight.error = error
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
+
+    def wait(self, flight, timeout=None):
+        """Block until the leader finishes; raises FollowerTimeout or the leader's error"""
+        if not flight.done.wait(timeout):
+            SINGLEFLIGHT_CALLS.inc(name=self.name, role='timeout')
+            raise FollowerTimeout(f"{self.name} leader did not finish within {timeout}s")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def do(self, key, func, timeout=None):
+        """Run func() once for concurrent callers with the same key; returns (result, shared)"""
+        flight, leader = self.begin(key)
+        if not leader:
+            return self.wait(flight, timeout), True
+        try:
+            result = func()
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result)
+        return result, False
+
+    async def ado(self, key, coroutine_function, timeout=None):
+        """do() for coroutines: the first caller's coroutine runs as a task that later callers await.
+
+        The task is shielded, so a follower timing out or the leader being
+        cancelled does not cancel the work the other callers are waiting on."""
+        task = self._tasks.get(key)
+        if task is None:
+            SINGLEFLIGHT_CALLS.inc(name=self.name, role='leader')
+            task = self._tasks[key] = asyncio.ensure_future(coroutine_function())
+            task.add_done_callback(lambda done: self._tasks.pop(key) if self._tasks.get(key) is done else None)
+            return await asyncio.shield(task), False
+
+        SINGLEFLIGHT_CALLS.inc(name=self.name, role='follower')
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout), True
+        except asyncio.TimeoutError:
+            SINGLEFLIGHT_CALLS.inc(name=self.name, role='timeout')
+            raise FollowerTimeout(f"{self.name} leader did not finish within {timeout}s")
@@ -1,9 +1,9 @@
+import functools
 import logging
 import os
 import sys
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-import openai
 from googletrans import Translator
 import asyncio
 from pymongo import MongoClient
@@ -11,6 +11,16 @@ from datetime import datetime
 
 # Add parent directory to path to import from main app
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import get_config, SUPPORTED_LANGUAGES
+from cache import LRUCache
+from consultation import ConsultationEngine, create_backend, create_backend_breaker, fallback_response
+from translation_memory import TranslationMemory, create_translator_breaker
+from triage import EMERGENCY_GUIDANCE, EmergencyResponder, detect
+from retrieval import Retriever
+from token_budget import create_budget
+import metrics
+from update_processor import PerUserUpdateProcessor
+from repository import BotRepository
 
 # Configure logging
 logging.basicConfig(
@@ -20,18 +30,109 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Configuration
+config_class = get_config()
+settings = {name: getattr(config_class, name) for name in dir(config_class) if name.isupper()}
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
-OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 MONGODB_URI = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017/')
+TELEGRAM_API_BASE_URL = (os.environ.get('TELEGRAM_API_BASE_URL') or 'https://api.telegram.org').rstrip('/')
+BOT_MODE = os.environ.get('BOT_MODE') or 'polling'  # 'polling' or 'webhook'
+BOT_METRICS_PORT = int(os.environ.get('BOT_METRICS_PORT') or 0)  # 0 disables the metrics endpoint
+BOT_CONCURRENT_UPDATES = int(os.environ.get('BOT_CONCURRENT_UPDATES') or 64)
+BOT_DB_THREADS = int(os.environ.get('BOT_DB_THREADS') or 8)  # threads for MongoDB and translation calls
+BOT_WRITE_FLUSH_MS = int(os.environ.get('BOT_WRITE_FLUSH_MS') or 500)
+BOT_WRITE_FLUSH_OPS = int(os.environ.get('BOT_WRITE_FLUSH_OPS') or 500)
+BOT_WRITE_BUFFER_MAX = int(os.environ.get('BOT_WRITE_BUFFER_MAX') or 20000)  # writes held while MongoDB is down
+BOT_PROFILE_CACHE_SIZE = int(os.environ.get('BOT_PROFILE_CACHE_SIZE') or 10000)
+BOT_PROFILE_CACHE_TTL = int(os.environ.get('BOT_PROFILE_CACHE_TTL') or 600)  # seconds
+
+# Services, created by init_services() only in the process that handles updates
+# (the webhook receiver never needs them)
+translator = None
+client = db = None
+repository = None
+translation_memory = None
+ai_response_cache = None
+retriever = None
+ai_backend = None
+consultation_engine = None
+emergency_responder = None
+
+def init_services():
+    """Connect to MongoDB and build the repository, translation memory and consultation engine"""
+    global translator, client, db, repository, translation_memory, ai_response_cache, retriever
+    global ai_backend, consultation_engine, emergency_responder
+    if consultation_engine is not None:
+        return
+
+    translator = Translator()
+
+    # MongoDB connection
+    client = MongoClient(MONGODB_URI, event_listeners=[metrics.MongoCommandMetrics()])
+    db = client.medaether
+    repository = BotRepository(
+        db,
+        max_workers=BOT_DB_THREADS,
+        flush_interval=BOT_WRITE_FLUSH_MS / 1000,
+        flush_ops=BOT_WRITE_FLUSH_OPS,
+        max_buffered=BOT_WRITE_BUFFER_MAX,
+        profile_cache_size=BOT_PROFILE_CACHE_SIZE,
+        profile_cache_ttl=BOT_PROFILE_CACHE_TTL
+    )
+    metrics.register_cache('telegram_profile', repository.profiles)
+
+    # Translation memory shared with the web app
+    translation_memory = TranslationMemory(db.translation_memory, translator, breaker=create_translator_breaker(settings))
+    try:
+        translation_memory.ensure_indexes()
+    except Exception as e:
+        logger.error(f"Failed to create translation memory indexes: {e}")
+    metrics.register_cache('translation_memory', translation_memory.cache)
+
+    # Consultation engine shared with the web app: same prompts, model (OPENAI_MODEL),
+    # concurrency limit and timeout; its OpenAI connection pool lives as long as the bot.
+    # Common questions are answered from the same local index as the web app
+    ai_response_cache = None
+    if settings['AI_CACHE_ENABLED']:
+        ai_response_cache = LRUCache(
+            max_entries=settings['AI_CACHE_MAX_ENTRIES'],
+            ttl_seconds=settings['AI_CACHE_TTL'],
+            max_entry_size=settings['AI_CACHE_MAX_ENTRY_BYTES']
+        )
+        metrics.register_cache('ai_response', ai_response_cache)
+    retriever = None
+    if settings['RETRIEVAL_ENABLED']:
+        retriever = Retriever(
+            db,
+            threshold=settings['RETRIEVAL_THRESHOLD'],
+            curated_limit=settings['RETRIEVAL_MAX_CURATED']
+        ).rebuild()
+        if settings['RETRIEVAL_REFRESH_INTERVAL'] > 0:
+            retriever.refresh_in_background(settings['RETRIEVAL_REFRESH_INTERVAL'])
+    ai_backend = create_backend(settings)
+    consultation_engine = ConsultationEngine(
+        ai_backend,
+        translate=translation_memory.translate,
+        cache=ai_response_cache,
+        executor=repository.executor,
+        coalesce=settings['AI_COALESCE_ENABLED'],
+        follower_timeout=settings['AI_COALESCE_TIMEOUT'],
+        retriever=retriever,
+        breaker=create_backend_breaker(ai_backend, settings),
+        # Same token_buckets collection as the web app; Telegram users have their own keys
+        budget=create_budget(db, 'ai', settings, 'AI')
+    )
 
-# Initialize services
-translator = Translator()
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
+    # Emergency guidance for red-flag messages, pre-translated for every language
+    emergency_responder = EmergencyResponder(translation_memory)
 
-# MongoDB connection
-client = MongoClient(MONGODB_URI)
-db = client.medaether
+async def translate_text(text, language):
+    """Translate a fixed reply through the translation memory without blocking the event loop"""
+    return await repository.run(translation_memory.translate, text, language, persist=True)
+
+# Fixed strings sent to users, pre-translated at startup
+LANGUAGE_UPDATED_TEXT = "✅ Language updated successfully!"
+CONSULTATION_ERROR_TEXT = "😔 Sorry, I'm experiencing technical difficulties. Please try again in a moment."
+DISCLAIMER_TEXT = "\n\n⚠️ *Important:* This is general health information only. Always consult healthcare professionals for medical diagnosis and treatment."
 
 # Bot commands and keyboards
 main_keyboard = ReplyKeyboardMarkup([
@@ -48,27 +149,20 @@ language_keyboard = ReplyKeyboardMarkup([
     [KeyboardButton("🔙 Back to Main Menu")]
 ], resize_keyboard=True)
 
+def timed_handler(handler):
+    """Record handler latency in the metrics registry"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with metrics.TELEGRAM_HANDLER_DURATION.time(handler=handler.__name__):
+            return await handler(update, context)
+    return wrapper
+
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
     user = update.effective_user
     
-    # Save user to database
-    user_data = {
-        'telegram_id': user.id,
-        'username': user.username,
-        'first_name': user.first_name,
-        'last_name': user.last_name,
-        'language_code': user.language_code,
-        'created_at': datetime.utcnow(),
-        'last_interaction': datetime.utcnow()
-    }
-    
     # Update or insert user
-    db.telegram_users.update_one(
-        {'telegram_id': user.id},
-        {'$set': user_data},
-        upsert=True
-    )
+    await repository.save_user(user)
     
     welcome_message = f"""
 🩺 *Welcome to MedAether!* 🩺
@@ -130,29 +224,7 @@ For technical support, contact: support@medaether.com
 
 async def emergency_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /emergency command"""
-    emergency_text = """
-🚨 *EMERGENCY CONTACTS* 🚨
-
-*Immediate Emergency:*
-📞 911 - Police/Fire/Medical Emergency
-
-*Medical Emergency:*
-🏥 Emergency Room - Go to nearest hospital
-☎️ Poison Control: 1-800-222-1222
-
-*Mental Health Crisis:*
-🧠 National Suicide Prevention Lifeline: 988
-💬 Crisis Text Line: Text HOME to 741741
-
-*Important Notes:*
-⚠️ If you're experiencing chest pain, difficulty breathing, severe bleeding, or any life-threatening symptoms, call 911 immediately!
-
-⚠️ This bot cannot replace emergency medical services. For urgent medical situations, always contact professional emergency services.
-
-🏥 For non-emergency medical advice, you can continue chatting with me or visit your local healthcare provider.
-"""
-    
-    await update.message.reply_text(emergency_text, parse_mode='Markdown')
+    await update.message.reply_text(EMERGENCY_GUIDANCE, parse_mode='Markdown')
 
 async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /language command"""
@@ -168,10 +240,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_text = update.message.text
     
     # Update last interaction
-    db.telegram_users.update_one(
-        {'telegram_id': user.id},
-        {'$set': {'last_interaction': datetime.utcnow()}}
-    )
+    repository.touch_user(user.id)
     
     # Handle menu button presses
     if message_text == "🔍 Quick Health Solutions":
@@ -197,7 +266,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "🏠 Back to main menu!",
             reply_markup=main_keyboard
         )
-    else:
+    elif not await send_red_flag_guidance(update, context):
         # Treat as health consultation request
         await handle_health_consultation(update, context)
 
@@ -307,7 +376,7 @@ I'm ready to help with your health concerns!
 async def send_health_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send user's health status"""
     user = update.effective_user
-    telegram_user = db.telegram_users.find_one({'telegram_id': user.id})
+    telegram_user = await repository.get_profile(user.id)
     
     if not telegram_user:
         await update.message.reply_text(
@@ -420,35 +489,58 @@ async def handle_language_selection(update: Update, context: ContextTypes.DEFAUL
     selected_language = language_map.get(message_text)
     if selected_language:
         # Update user's language preference
-        db.telegram_users.update_one(
-            {'telegram_id': user.id},
-            {'$set': {'preferred_language': selected_language}}
-        )
+        await repository.set_language(user.id, selected_language)
         
-        confirmation_text = "✅ Language updated successfully!"
+        confirmation_text = LANGUAGE_UPDATED_TEXT
         if selected_language != 'en':
             try:
-                confirmation_text = translator.translate(confirmation_text, dest=selected_language).text
-            except:
-                pass
+                confirmation_text = await translate_text(confirmation_text, selected_language)
+            except Exception as e:
+                logger.warning(f"Translation failed, replying in English: {e}")
         
         await update.message.reply_text(
             confirmation_text,
             reply_markup=main_keyboard
         )
 
+async def send_red_flag_guidance(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Answer red-flag symptoms with emergency guidance; False if the message has none"""
+    if not settings['TRIAGE_ENABLED']:
+        return False
+    category = detect(update.message.text)
+    if category is None:
+        return False
+    
+    user = update.effective_user
+    telegram_user = await repository.get_profile(user.id)
+    preferred_language = telegram_user.get('preferred_language', 'en') if telegram_user else 'en'
+    
+    # Translations may not keep the Markdown intact, so they are sent as plain text
+    markdown = preferred_language == 'en'
+    guidance = emergency_responder.respond(category, preferred_language, markdown=markdown)
+    repository.record_consultation({
+        'telegram_id': user.id,
+        'user_message': update.message.text,
+        'ai_response': guidance,
+        'language': preferred_language,
+        'triage': category,
+        'timestamp': datetime.utcnow()
+    })
+    await update.message.reply_text(guidance, parse_mode='Markdown' if markdown else None)
+    return True
+
 async def handle_health_consultation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle health consultation requests"""
     user = update.effective_user
     message_text = update.message.text
     
     # Get user's preferred language
-    telegram_user = db.telegram_users.find_one({'telegram_id': user.id})
+    telegram_user = await repository.get_profile(user.id)
     preferred_language = telegram_user.get('preferred_language', 'en') if telegram_user else 'en'
     
     try:
         # Get AI response
-        ai_response = await get_ai_medical_advice(message_text, preferred_language)
+        ai_response = await get_ai_medical_advice(message_text, preferred_language, user.id)
         
         # Save consultation to database
         consultation_data = {
@@ -458,13 +550,7 @@ async def handle_health_consultation(update: Update, context: ContextTypes.DEFAU
             'language': preferred_language,
             'timestamp': datetime.utcnow()
         }
-        db.telegram_consultations.insert_one(consultation_data)
-        
-        # Update consultation count
-        db.telegram_users.update_one(
-            {'telegram_id': user.id},
-            {'$inc': {'consultation_count': 1}}
-        )
+        repository.record_consultation(consultation_data)
         
         # Send response
         await update.message.reply_text(
@@ -474,13 +560,13 @@ async def handle_health_consultation(update: Update, context: ContextTypes.DEFAU
         
     except Exception as e:
         logger.error(f"Error in health consultation: {e}")
-        error_message = "😔 Sorry, I'm experiencing technical difficulties. Please try again in a moment."
+        error_message = CONSULTATION_ERROR_TEXT
         
         if preferred_language != 'en':
             try:
-                error_message = translator.translate(error_message, dest=preferred_language).text
-            except:
-                pass
+                error_message = await translate_text(error_message, preferred_language)
+            except Exception as e:
+                logger.warning(f"Translation failed, replying in English: {e}")
         
         await update.message.reply_text(error_message)
 
@@ -494,53 +580,22 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "You can also type your question here, and I'll be happy to help! 😊"
     )
 
-async def get_ai_medical_advice(message, language='en'):
-    """Get medical advice from AI"""
-    try:
-        if OPENAI_API_KEY:
-            from openai import AsyncOpenAI
-            client = AsyncOpenAI(api_key=OPENAI_API_KEY)
-            
-            response = await client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": """You are a medical AI assistant for MedAether, a public health chatbot. 
-                        Provide helpful, accurate health advice and information. Always remind users to consult 
-                        healthcare professionals for serious conditions. Keep responses concise but informative. 
-                        Do not provide specific drug dosages without proper medical consultation. 
-                        Focus on general health guidance, symptom information, and when to seek professional help."""
-                    },
-                    {"role": "user", "content": message}
-                ],
-                max_tokens=400
-            )
-            ai_response = response.choices[0].message.content
-        else:
-            # Fallback response
-            ai_response = """I'm here to help with general health information. For your safety, please consult a qualified healthcare professional for personalized medical advice, especially for serious symptoms."""
-        
-        # Translate if needed
-        if language != 'en':
-            try:
-                ai_response = translator.translate(ai_response, dest=language).text
-            except Exception as e:
-                logger.warning(f"Translation failed: {e}")
-        
-        # Add disclaimer
-        disclaimer = "\n\n⚠️ *Important:* This is general health information only. Always consult healthcare professionals for medical diagnosis and treatment."
-        if language != 'en':
-            try:
-                disclaimer = translator.translate(disclaimer, dest=language).text
-            except:
-                pass
-        
-        return ai_response + disclaimer
-        
-    except Exception as e:
-        logger.error(f"AI consultation error: {e}")
-        return "Sorry, I'm experiencing technical difficulties. Please try again later or contact a healthcare professional."
+async def get_ai_medical_advice(message, language='en', telegram_id=None):
+    """Get medical advice from the consultation engine, with the disclaimer appended"""
+    budget_key = f"telegram:{telegram_id}" if telegram_id is not None else None
+    ai_response = await consultation_engine.aadvise(message, language, budget_key=budget_key)
+    if ai_response is None:
+        raise RuntimeError("AI consultation failed")
+    
+    # Add disclaimer
+    disclaimer = DISCLAIMER_TEXT
+    if language != 'en':
+        try:
+            disclaimer = await translate_text(disclaimer, language)
+        except Exception as e:
+            logger.warning(f"Translation failed, replying in English: {e}")
+    
+    return ai_response + disclaimer
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
@@ -551,31 +606,75 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "😔 Something went wrong. Please try again or contact support if the issue persists."
         )
 
+async def start_services(application):
+    """Start background work that needs the running event loop"""
+    repository.start()
+    # Every process (each webhook worker too) loads its own emergency table
+    emergency_responder.prewarm_in_background(SUPPORTED_LANGUAGES.keys())
+
+async def shutdown_services(application):
+    """Close the model connection pool and flush buffered writes"""
+    await consultation_engine.aclose()
+    await repository.close()
+
+def build_application():
+    """Create the Application with every handler registered"""
+    # Updates from different users are handled concurrently
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+        .concurrent_updates(PerUserUpdateProcessor(BOT_CONCURRENT_UPDATES))
+        .post_init(start_services)
+        .post_shutdown(shutdown_services)
+        .build()
+    )
+    
+    # Add handlers
+    application.add_handler(CommandHandler("start", timed_handler(start_command)))
+    application.add_handler(CommandHandler("help", timed_handler(help_command)))
+    application.add_handler(CommandHandler("emergency", timed_handler(emergency_command)))
+    application.add_handler(CommandHandler("language", timed_handler(language_command)))
+    
+    # Message handlers
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler(handle_message)))
+    application.add_handler(MessageHandler(filters.VOICE, timed_handler(handle_voice)))
+    
+    # Error handler
+    application.add_error_handler(error_handler)
+    return application
+
+def prewarm_translations():
+    """Pre-translate fixed replies for every supported language"""
+    translation_memory.prewarm_in_background(
+        [LANGUAGE_UPDATED_TEXT, CONSULTATION_ERROR_TEXT, fallback_response(), DISCLAIMER_TEXT],
+        SUPPORTED_LANGUAGES.keys()
+    )
+
 def main():
-    """Start the Telegram bot"""
+    """Start the Telegram bot (long polling by default, webhook with --webhook)"""
     if not TELEGRAM_BOT_TOKEN:
         logger.error("TELEGRAM_BOT_TOKEN not found in environment variables")
         return
     
-    # Create application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    if BOT_MODE == 'webhook' or '--webhook' in sys.argv[1:]:
+        from webhook import run_webhook
+        run_webhook()
+        return
     
-    # Add handlers
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("emergency", emergency_command))
-    application.add_handler(CommandHandler("language", language_command))
+    init_services()
+    application = build_application()
     
-    # Message handlers
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-    application.add_handler(MessageHandler(filters.VOICE, handle_voice))
+    # Expose Prometheus metrics
+    if BOT_METRICS_PORT:
+        metrics.start_metrics_server(BOT_METRICS_PORT)
+        logger.info(f"Metrics available on port {BOT_METRICS_PORT}")
     
-    # Error handler
-    application.add_error_handler(error_handler)
+    prewarm_translations()
     
     # Start bot
     logger.info("Starting MedAether Telegram Bot...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,109 @@
+"""
+Data access for the MedAether Telegram bot
+pymongo is blocking, so every call runs on a dedicated thread pool and is
+awaited from the handlers; the event loop never waits on MongoDB. Hot-path
+tracking writes go through a coalescing WriteBuffer, and user profiles are
+served from an in-process LRU kept current by every write the bot makes.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pymongo import ReturnDocument
+from cache import LRUCache
+from write_buffer import WriteBuffer
+
+# Fields the handlers read from telegram_users
+PROFILE_FIELDS = {
+    '_id': 0, 'telegram_id': 1, 'first_name': 1, 'preferred_language': 1,
+    'health_status': 1, 'last_interaction': 1, 'consultation_count': 1
+}
+
+
+class BotRepository:
+    """Async wrapper around the bot's MongoDB collections"""
+
+    def __init__(self, db, max_workers=8, flush_interval=0.5, flush_ops=500, max_buffered=20000,
+                 profile_cache_size=10000, profile_cache_ttl=600):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bot-db')
+        self.buffer = WriteBuffer(db, self.run, flush_interval=flush_interval, max_ops=flush_ops,
+                                  max_buffered=max_buffered)
+        self.profiles = LRUCache(max_entries=profile_cache_size, ttl_seconds=profile_cache_ttl)
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking call on the repository's thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def save_user(self, telegram_user):
+        """Create or refresh a user from /start and cache their profile"""
+        now = datetime.utcnow()
+        profile = await self.run(
+            self.db.telegram_users.find_one_and_update,
+            {'telegram_id': telegram_user.id},
+            {'$set': {
+                'telegram_id': telegram_user.id,
+                'username': telegram_user.username,
+                'first_name': telegram_user.first_name,
+                'last_name': telegram_user.last_name,
+                'language_code': telegram_user.language_code,
+                'created_at': now,
+                'last_interaction': now
+            }},
+            projection=PROFILE_FIELDS,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.profiles.set(telegram_user.id, profile)
+        return profile
+
+    async def get_profile(self, telegram_id):
+        """A user's profile fields, from the cache when possible; None if unknown"""
+        profile = self.profiles.get(telegram_id)
+        if profile is None:
+            profile = await self.run(self.db.telegram_users.find_one, {'telegram_id': telegram_id}, PROFILE_FIELDS)
+            if profile is not None:
+                self.profiles.set(telegram_id, profile)
+        return profile
+
+    def _update_cached(self, telegram_id, update):
+        """Apply a write to the cached profile so it matches the database"""
+        profile = self.profiles.peek(telegram_id)  # Not a read, so it must not count towards the hit rate
+        if profile is not None:
+            update(profile)
+
+    def touch_user(self, telegram_id):
+        """Record the time of the user's latest message (buffered)"""
+        now = datetime.utcnow()
+        self.buffer.set('telegram_users', (('telegram_id', telegram_id),), last_interaction=now)
+        self._update_cached(telegram_id, lambda profile: profile.update(last_interaction=now))
+
+    async def set_language(self, telegram_id, language):
+        """Save the preferred language (write-through to the profile cache)"""
+        await self.run(
+            self.db.telegram_users.update_one,
+            {'telegram_id': telegram_id},
+            {'$set': {'preferred_language': language}}
+        )
+        self._update_cached(telegram_id, lambda profile: profile.update(preferred_language=language))
+
+    def record_consultation(self, consultation):
+        """Store a consultation and bump the user's consultation count (buffered)"""
+        telegram_id = consultation['telegram_id']
+        self.buffer.insert('telegram_consultations', consultation)
+        self.buffer.inc('telegram_users', (('telegram_id', telegram_id),), consultation_count=1)
+        self._update_cached(
+            telegram_id,
+            lambda profile: profile.update(consultation_count=profile.get('consultation_count', 0) + 1)
+        )
+
+    def start(self):
+        """Start background flushing; call from the running event loop"""
+        self.buffer.start()
+
+    async def close(self):
+        """Flush buffered writes, then stop the thread pool"""
+        await self.buffer.close()
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
@@ -0,0 +1,71 @@
+"""
+Concurrent update processing for the MedAether Telegram bot
+Updates from different chats run concurrently while updates from the same
+Telegram user are still handled one at a time, in arrival order
+"""
+
+import asyncio
+import sys
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Process up to max_concurrent_updates at once, serialised per user"""
+
+    def __init__(self, max_concurrent_updates):
+        # The base class takes a slot before do_process_update runs, so an
+        # update waiting for its user's turn would hold one. Its semaphore is
+        # built while max_concurrent_updates still reads as unbounded, and the
+        # real slot is taken here once the user's lock is held.
+        super().__init__(max_concurrent_updates)
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._running = 0
+        # telegram_id -> [lock, number of updates holding or waiting for it]
+        self._user_locks = {}
+
+    @property
+    def max_concurrent_updates(self):
+        return getattr(self, '_limit', sys.maxsize)
+
+    @property
+    def current_concurrent_updates(self):
+        return self._running
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            self._running += 1
+            try:
+                await coroutine
+            finally:
+                self._running -= 1
+
+    @staticmethod
+    def _user_id(update):
+        user = getattr(update, 'effective_user', None)
+        return user.id if user is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        user_id = self._user_id(update)
+        if user_id is None:
+            await self._run(coroutine)
+            return
+
+        entry = self._user_locks.get(user_id)
+        if entry is None:
+            entry = self._user_locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, preserving message order
+            async with entry[0]:
+                await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._user_locks[user_id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
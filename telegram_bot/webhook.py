@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Webhook mode for the MedAether Telegram bot
+An HTTP receiver accepts updates pushed by Telegram and hands each one to one
+of N worker processes, chosen by telegram_id, so every update from a user
+reaches the same worker and is processed there in order.
+
+Run with: python telegram_bot/webhook.py  (or BOT_MODE=webhook python telegram_bot/bot.py)
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
+TELEGRAM_API_BASE_URL = (os.environ.get('TELEGRAM_API_BASE_URL') or 'https://api.telegram.org').rstrip('/')
+BOT_WEBHOOK_HOST = os.environ.get('BOT_WEBHOOK_HOST') or '0.0.0.0'
+BOT_WEBHOOK_PORT = int(os.environ.get('BOT_WEBHOOK_PORT') or os.environ.get('PORT') or 8443)
+BOT_WEBHOOK_PATH = os.environ.get('BOT_WEBHOOK_PATH') or '/telegram/webhook'
+BOT_WEBHOOK_URL = os.environ.get('BOT_WEBHOOK_URL')  # public URL registered with Telegram; unset skips setWebhook
+BOT_WEBHOOK_SECRET = os.environ.get('BOT_WEBHOOK_SECRET')  # required; Telegram sends it with every update
+BOT_WEBHOOK_WORKERS = int(os.environ.get('BOT_WEBHOOK_WORKERS') or os.cpu_count() or 2)
+BOT_WEBHOOK_QUEUE_SIZE = int(os.environ.get('BOT_WEBHOOK_QUEUE_SIZE') or 10000)  # per worker
+BOT_METRICS_PORT = int(os.environ.get('BOT_METRICS_PORT') or 0)  # receiver; worker i uses port + 1 + i
+
+WEBHOOK_UPDATES = metrics.REGISTRY.counter(
+    'medaether_bot_webhook_updates_total',
+    'Updates received by the webhook, by worker shard',
+    ('worker',)
+)
+
+
+def update_user_id(data):
+    """The Telegram user (or chat) an update belongs to, if any"""
+    for key, value in data.items():
+        if key == 'update_id' or not isinstance(value, dict):
+            continue
+        for field in ('from', 'user', 'chat'):
+            if isinstance(value.get(field), dict) and 'id' in value[field]:
+                return value[field]['id']
+    return None
+
+
+def shard_for(data, workers):
+    """Worker index for an update; updates from the same user always share a worker"""
+    user_id = update_user_id(data)
+    return (user_id if user_id is not None else data.get('update_id', 0)) % workers
+
+
+def worker_main(index, updates, ready):
+    """Entry point of a worker process: feed queued updates into an Application"""
+    logging.basicConfig(
+        format=f'%(asctime)s - worker {index} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    import bot
+
+    bot.init_services()
+    if BOT_METRICS_PORT:
+        metrics.start_metrics_server(BOT_METRICS_PORT + 1 + index)
+    if index == 0:
+        bot.prewarm_translations()
+    asyncio.run(_run_worker(bot, updates, ready))
+
+
+async def _run_worker(bot, updates, ready):
+    from telegram import Update
+
+    application = bot.build_application()
+    loop = asyncio.get_running_loop()
+    async with application:
+        # post_init/post_shutdown only run automatically under run_polling/run_webhook
+        await bot.start_services(application)
+        await application.start()
+        ready.set()
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+        await application.stop()
+        await bot.shutdown_services(application)
+
+
+def telegram_api(method, **params):
+    """Call a Bot API method from the receiver (which has no Application)"""
+    request = urllib.request.Request(
+        f"{TELEGRAM_API_BASE_URL}/bot{TELEGRAM_BOT_TOKEN}/{method}",
+        data=urllib.parse.urlencode(params).encode('utf-8')
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+class WebhookReceiver:
+    """HTTP endpoint for Telegram plus the worker processes it dispatches to"""
+
+    def __init__(self, workers=BOT_WEBHOOK_WORKERS, host=BOT_WEBHOOK_HOST, port=BOT_WEBHOOK_PORT,
+                 path=BOT_WEBHOOK_PATH, secret=BOT_WEBHOOK_SECRET, queue_size=BOT_WEBHOOK_QUEUE_SIZE):
+        # spawn: the bot module holds a MongoClient, which must not be forked
+        if not secret:
+            raise ValueError("A webhook secret is required to authenticate updates from Telegram")
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = workers
+        self.path = path
+        self.secret = secret
+        self.queues = [self.context.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.ready = [self.context.Event() for _ in range(workers)]
+        self.processes = [None] * workers
+        self._stopping = threading.Event()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != receiver.path:
+                    self.send_error(404)
+                    return
+                token = self.headers.get('X-Telegram-Bot-Api-Secret-Token') or ''
+                if not hmac.compare_digest(token.encode('utf-8'), receiver.secret.encode('utf-8')):
+                    self.send_error(403)
+                    return
+                try:
+                    data = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+                except ValueError:
+                    self.send_error(400)
+                    return
+                receiver.dispatch(data)
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_GET(self):
+                # Ready once every worker has started its Application
+                status = 200 if all(event.is_set() for event in receiver.ready) else 503
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    def dispatch(self, data):
+        index = shard_for(data, self.workers)
+        # Blocks when the worker is saturated, so Telegram sees backpressure and retries
+        self.queues[index].put(data)
+        WEBHOOK_UPDATES.inc(worker=str(index))
+
+    def _start_worker(self, index):
+        self.ready[index].clear()
+        process = self.context.Process(
+            target=worker_main,
+            args=(index, self.queues[index], self.ready[index]),
+            name=f'bot-worker-{index}'
+        )
+        process.start()
+        self.processes[index] = process
+
+    def _supervise(self):
+        """Restart workers that exit unexpectedly"""
+        while not self._stopping.wait(1):
+            for index, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.error(f"Bot worker {index} exited with code {process.exitcode}; restarting")
+                    self._start_worker(index)
+
+    def start(self):
+        for index in range(self.workers):
+            self._start_worker(index)
+        threading.Thread(target=self._supervise, name='bot-worker-supervisor', daemon=True).start()
+        threading.Thread(target=self.httpd.serve_forever, name='bot-webhook', daemon=True).start()
+        return self
+
+    def stop(self, timeout=30):
+        """Stop accepting updates, let workers drain their queues, then exit"""
+        self._stopping.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for updates in self.queues:
+            updates.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+def run_webhook():
+    """Run the receiver until SIGINT/SIGTERM"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    if not TELEGRAM_BOT_TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN not found in environment variables")
+        return
+    if not BOT_WEBHOOK_SECRET:
+        logger.error("BOT_WEBHOOK_SECRET not found in environment variables; webhook mode requires it")
+        return
+
+    if BOT_METRICS_PORT:
+        metrics.start_metrics_server(BOT_METRICS_PORT)
+
+    receiver = WebhookReceiver().start()
+    logger.info(f"Webhook listening on {BOT_WEBHOOK_HOST}:{BOT_WEBHOOK_PORT}{BOT_WEBHOOK_PATH} "
+                f"with {BOT_WEBHOOK_WORKERS} workers")
+
+    if BOT_WEBHOOK_URL:
+        result = telegram_api(
+            'setWebhook', url=BOT_WEBHOOK_URL, max_connections=100, secret_token=BOT_WEBHOOK_SECRET
+        )
+        logger.info(f"setWebhook: {result.get('description', result.get('ok'))}")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        pass
+    logger.info("Stopping webhook receiver...")
+    receiver.stop()
+
+
+if __name__ == '__main__':
+    run_webhook()
@@ -0,0 +1,211 @@
+"""
+Write-behind buffer for the MedAether Telegram bot
+Coalesces per-user $set/$inc updates and batches inserts, flushing them with
+bulk_write/insert_many every flush_interval seconds or max_ops operations.
+Flushes are safe to retry: inserts carry their _id from the start and each
+$inc is applied at most once, so a partly applied batch is never doubled.
+"""
+
+import asyncio
+import logging
+import uuid
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WRITE_BUFFER_OPS = metrics.REGISTRY.counter(
+    'medaether_bot_write_buffer_ops_total',
+    'Writes accepted by the bot write buffer (buffered), MongoDB round trips used to flush them (written) '
+    'and writes discarded because the buffer was full (dropped)',
+    ('stage',)
+)
+
+DUPLICATE_KEY = 11000
+
+# Ids of the last $inc batches applied to a document, so a retried batch is skipped
+APPLIED_FIELD = 'buffered_writes'
+APPLIED_HISTORY = 16
+
+
+class WriteBuffer:
+    """Coalescing write buffer; mutated only from the event loop"""
+
+    def __init__(self, db, run, flush_interval=0.5, max_ops=500, max_buffered=20000):
+        self.db = db
+        self.run = run  # coroutine function running a blocking call off the loop
+        self.flush_interval = flush_interval
+        self.max_ops = max_ops
+        self.max_buffered = max_buffered  # writes held while MongoDB is failing
+        self.retries = []  # [(collection, key, update, batch id)] from failed flushes
+        self._reset()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._stopping = None
+
+    def _reset(self):
+        self.sets = {}      # (collection, filter key) -> {field: value}
+        self.incs = {}      # (collection, filter key) -> {field: delta}
+        self.inserts = {}   # collection -> [documents]
+        self.pending = len(self.retries)
+
+    def _accepted(self):
+        self.pending += 1
+        WRITE_BUFFER_OPS.inc(stage='buffered')
+        if self.pending >= self.max_ops and not self._flush_lock.locked():
+            asyncio.get_running_loop().create_task(self.flush())
+
+    def _full(self):
+        if self.pending < self.max_buffered:
+            return False
+        WRITE_BUFFER_OPS.inc(stage='dropped')
+        return True
+
+    def set(self, collection, key, **fields):
+        """$set fields on the document matching key; later values replace earlier ones"""
+        if (collection, key) not in self.sets and self._full():
+            return
+        self.sets.setdefault((collection, key), {}).update(fields)
+        self._accepted()
+
+    def inc(self, collection, key, **deltas):
+        """$inc fields on the document matching key; deltas are summed"""
+        if (collection, key) not in self.incs and self._full():
+            return
+        target = self.incs.setdefault((collection, key), {})
+        for field, delta in deltas.items():
+            target[field] = target.get(field, 0) + delta
+        self._accepted()
+
+    def insert(self, collection, document):
+        if self._full():
+            return
+        # A fixed _id makes a retried insert a duplicate-key error instead of a second copy
+        document.setdefault('_id', ObjectId())
+        self.inserts.setdefault(collection, []).append(document)
+        self._accepted()
+
+    def _operations(self, sets, incs):
+        """Retried operations first, then this flush's coalesced updates"""
+        batch = uuid.uuid4().hex
+        operations = []
+        for collection, key, update, batch_id in self.retries:
+            # Newer buffered values win over a retried $set; bulk writes are unordered
+            newer = sets.get((collection, key), {})
+            update = dict(update)
+            if '$set' in update:
+                update['$set'] = {field: value for field, value in update['$set'].items() if field not in newer}
+                if not update['$set']:
+                    del update['$set']
+            if update:
+                operations.append((collection, key, update, batch_id))
+        for target in list(sets) + [target for target in incs if target not in sets]:
+            collection, key = target
+            update = {}
+            if target in sets:
+                update['$set'] = sets[target]
+            if target in incs:
+                update['$inc'] = incs[target]
+            operations.append((collection, key, update, batch if target in incs else None))
+        return operations
+
+    async def flush(self):
+        """Write everything buffered so far; flushes run one at a time, in order"""
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            operations = self._operations(self.sets, self.incs)
+            inserts = self.inserts
+            self.retries = []
+            self._reset()
+            try:
+                failed_operations, failed_inserts = await self.run(self._write, operations, inserts)
+            except Exception as e:
+                logger.error(f"Write buffer flush failed, keeping writes for the next flush: {e}")
+                failed_operations, failed_inserts = operations, inserts
+            self._restore(failed_operations, failed_inserts)
+
+    def _write(self, operations, inserts):
+        """Write every batch; returns the operations and documents to retry"""
+        by_collection = {}
+        for operation in operations:
+            by_collection.setdefault(operation[0], []).append(operation)
+        failed_operations = []
+        for collection, batch in by_collection.items():
+            requests = []
+            for _, key, update, batch_id in batch:
+                query = dict(key)
+                if batch_id is not None:
+                    # Skip documents this $inc batch already reached
+                    query[APPLIED_FIELD] = {'$ne': batch_id}
+                    update = dict(update, **{'$push': {APPLIED_FIELD: {'$each': [batch_id], '$slice': -APPLIED_HISTORY}}})
+                requests.append(UpdateOne(query, update))
+            try:
+                self.db[collection].bulk_write(requests, ordered=False)
+            except BulkWriteError as e:
+                failed_operations.extend(batch[index] for index in self._failed_indexes(e))
+            except Exception as e:
+                logger.error(f"Write buffer flush to {collection} failed: {e}")
+                failed_operations.extend(batch)
+            WRITE_BUFFER_OPS.inc(stage='written')
+
+        failed_inserts = {}
+        for collection, documents in inserts.items():
+            try:
+                self.db[collection].insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                failed = [documents[index] for index in self._failed_indexes(e)]
+                if failed:
+                    failed_inserts[collection] = failed
+            except Exception as e:
+                logger.error(f"Write buffer insert into {collection} failed: {e}")
+                failed_inserts[collection] = documents
+            WRITE_BUFFER_OPS.inc(stage='written')
+        return failed_operations, failed_inserts
+
+    @staticmethod
+    def _failed_indexes(error):
+        """Indexes of writes to retry; a duplicate key means an earlier attempt got through"""
+        return [
+            write_error['index'] for write_error in error.details.get('writeErrors', [])
+            if write_error.get('code') != DUPLICATE_KEY
+        ]
+
+    def _restore(self, operations, inserts):
+        """Queue failed writes for the next flush, dropping the oldest beyond max_buffered"""
+        room = max(0, self.max_buffered - self.pending)
+        documents = [(collection, document) for collection, batch in inserts.items() for document in batch]
+        dropped = max(0, len(operations) + len(documents) - room)
+        if dropped:
+            WRITE_BUFFER_OPS.inc(dropped, stage='dropped')
+            logger.error(f"Write buffer full, dropping {dropped} writes")
+            # Drop inserts before updates; tracking counters are worth more than extra rows
+            drop_documents = min(dropped, len(documents))
+            documents = documents[drop_documents:]
+            operations = operations[dropped - drop_documents:]
+        self.retries = operations + self.retries
+        for collection, document in reversed(documents):
+            self.inserts.setdefault(collection, []).insert(0, document)
+        self.pending += len(operations) + len(documents)
+
+    async def _flush_periodically(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self):
+        """Start the periodic flush task on the running loop"""
+        self._stopping = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._flush_periodically())
+
+    async def close(self):
+        """Stop the periodic task, letting an in-progress flush finish, and write whatever is left"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+        await self.flush()
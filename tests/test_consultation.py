@@ -0,0 +1,30 @@
+"""Coalesced consultations always release their flight"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/')
+
+import consultation
+
+
+class BrokenBudget:
+    def acquire(self, key, cost):
+        raise RuntimeError('token bucket store unavailable')
+
+
+class StreamFlightTest(unittest.TestCase):
+    def test_flight_finishes_when_admission_raises(self):
+        engine = consultation.ConsultationEngine(consultation.StubBackend(latency=0), budget=BrokenBudget())
+
+        with self.assertRaises(RuntimeError):
+            list(engine.stream('sore throat and a mild fever', budget_key='user-1'))
+
+        self.assertEqual(engine.flights._flights, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
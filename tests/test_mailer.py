@@ -0,0 +1,125 @@
+"""Email outbox retries against the unique pending-digest index"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/')
+
+from pymongo.errors import DuplicateKeyError
+import mailer
+
+
+class FakeOutbox:
+    """email_outbox with the partial unique index on pending digests"""
+
+    def __init__(self, documents):
+        self.documents = {document['_id']: document for document in documents}
+
+    def _matches(self, document, query):
+        return all(document.get(field) == value for field, value in query.items())
+
+    def _check_unique(self, changed):
+        if changed.get('kind') != 'community_digest' or changed.get('status') != 'pending':
+            return
+        for document in self.documents.values():
+            if (document['_id'] != changed['_id'] and document.get('kind') == 'community_digest'
+                    and document.get('status') == 'pending'
+                    and document['digest_key'] == changed['digest_key']
+                    and document['window_start'] == changed['window_start']):
+                raise DuplicateKeyError('E11000 duplicate key error')
+
+    def update_one(self, query, update):
+        for document in self.documents.values():
+            if not self._matches(document, query):
+                continue
+            changed = dict(document)
+            changed.update(update.get('$set', {}))
+            for field, value in update.get('$max', {}).items():
+                changed[field] = max(changed.get(field, value), value)
+            for field, push in update.get('$push', {}).items():
+                changed[field] = push['$each'] + changed.get(field, [])
+            self._check_unique(changed)
+            document.update(changed)
+            return SimpleNamespace(matched_count=1)
+        return SimpleNamespace(matched_count=0)
+
+    def delete_one(self, query):
+        for key, document in list(self.documents.items()):
+            if self._matches(document, query):
+                del self.documents[key]
+                return
+
+
+class FailingSession:
+    def send(self, msg):
+        raise OSError('SMTP unavailable')
+
+    def close(self):
+        pass
+
+
+def digest(_id, status, report_ids, attempts=0, next_attempt_at=None):
+    window_start = datetime(2026, 1, 1, 12, 0)
+    return {
+        '_id': _id,
+        'kind': 'community_digest',
+        'digest_key': 'springfield|high',
+        'window_start': window_start,
+        'window_end': window_start + timedelta(minutes=15),
+        'status': status,
+        'attempts': attempts,
+        'next_attempt_at': next_attempt_at or window_start,
+        'report_ids': report_ids,
+        'reports': [
+            {'location': 'Springfield', 'severity': 'high', 'submitted_at': window_start, 'user_id': 'u1',
+             'issue_title': f"Report {report_id}", 'description': 'Fever cluster'}
+            for report_id in report_ids
+        ]
+    }
+
+
+class DigestRetryTest(unittest.TestCase):
+    def make_sender(self, outbox):
+        sender = mailer.OutboxSender.__new__(mailer.OutboxSender)
+        sender.db = SimpleNamespace(email_outbox=outbox)
+        sender.settings = {'EMAIL_USER': 'bot@example.com', 'HEALTH_DEPARTMENT_EMAIL': 'health@example.com'}
+        sender.session = FailingSession()
+        sender.max_attempts = 5
+        sender.backoff_base = 60
+        sender.backoff_max = 3600
+        return sender
+
+    def test_failed_digest_merges_into_digest_opened_by_late_report(self):
+        sending = digest('sending', 'sending', ['r1', 'r2'], attempts=1)
+        late = digest('late', 'pending', ['r3'])
+        outbox = FakeOutbox([sending, late])
+
+        self.make_sender(outbox).deliver(sending)
+
+        self.assertEqual(list(outbox.documents), ['late'])
+        merged = outbox.documents['late']
+        self.assertEqual(merged['report_ids'], ['r1', 'r2', 'r3'])
+        self.assertEqual(len(merged['reports']), 3)
+        self.assertEqual(merged['attempts'], 2)
+        self.assertGreater(merged['next_attempt_at'], datetime.utcnow())
+        self.assertIn('SMTP unavailable', merged['last_error'])
+
+    def test_failed_digest_without_a_late_report_is_retried(self):
+        sending = digest('sending', 'sending', ['r1'])
+        outbox = FakeOutbox([sending])
+
+        self.make_sender(outbox).deliver(sending)
+
+        entry = outbox.documents['sending']
+        self.assertEqual(entry['status'], 'pending')
+        self.assertEqual(entry['attempts'], 1)
+        self.assertIsNone(entry['locked_until'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Polling fallback of the outbreak monitor"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/')
+
+from bson.objectid import ObjectId
+import outbreak_detector
+
+
+class StopPolling(Exception):
+    pass
+
+
+class FakeReports:
+    """reports collection whose inserts arrive in batches, one per poll"""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.documents = []
+
+    def find_one(self, query, projection, sort):
+        return None
+
+    def find(self, query, projection):
+        if not self.batches:
+            raise StopPolling()
+        self.documents.extend(self.batches.pop(0))
+        after = query.get('_id', {}).get('$gt')
+        found = sorted((document for document in self.documents if after is None or document['_id'] > after),
+                       key=lambda document: document['_id'])
+        return SimpleNamespace(sort=lambda *args: found)
+
+
+def report(seconds):
+    created = datetime(2026, 3, 1, 9, 0, tzinfo=timezone.utc) + timedelta(seconds=seconds)
+    return {'_id': ObjectId.from_datetime(created), 'location': 'Springfield', 'location_key': 'springfield',
+            'submitted_at': created.replace(tzinfo=None)}
+
+
+class PollTest(unittest.TestCase):
+    def test_late_committed_report_with_lower_id_is_counted_once(self):
+        early, late_commit, newer = report(0), report(5), report(10)
+        # The report created at 5s is committed only after the one created at 10s was read
+        reports = FakeReports([[early, newer], [late_commit], []])
+        db = SimpleNamespace(reports=reports, maintenance_jobs=mock.Mock(find_one=mock.Mock(return_value=None)))
+        monitor = outbreak_detector.OutbreakMonitor(db, mock.Mock(), poll_interval=0)
+        counted = []
+        monitor.handle = lambda document, source: counted.append(document['_id'])
+
+        with self.assertRaises(StopPolling):
+            monitor.poll()
+
+        self.assertEqual(sorted(counted), sorted([early['_id'], newer['_id'], late_commit['_id']]))
+
+
+if __name__ == '__main__':
+    unittest.main()
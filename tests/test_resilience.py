@@ -0,0 +1,42 @@
+"""Circuit breaker half-open trial ownership"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resilience import CLOSED, HALF_OPEN, OPEN, TRIAL, CircuitBreaker
+
+
+class HalfOpenTrialTest(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('test-dependency', deadline=1, min_calls=1, cooldown=0)
+        # Admitted while closed, before the circuit opened
+        self.earlier = self.breaker.allow()
+        self.breaker.state, self.breaker._opened_at = OPEN, 0
+
+    def test_non_trial_release_keeps_the_trial(self):
+        trial = self.breaker.allow()
+        self.assertEqual(trial, TRIAL)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+        self.breaker.release(self.earlier)
+
+        self.assertFalse(self.breaker.allow())
+        self.breaker.release(trial)
+        self.assertEqual(self.breaker.allow(), TRIAL)
+
+    def test_only_the_trial_decides_the_circuit(self):
+        trial = self.breaker.allow()
+
+        self.breaker.record(True, 0.01, admission=self.earlier)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record(True, 0.01, admission=trial)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
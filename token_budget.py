@@ -0,0 +1,139 @@
+"""
+Per-user token budgets for MedAether
+Token buckets kept in MongoDB and updated atomically, so every web worker and
+the Telegram bot draw from the same budget for a user. Model and translator
+calls are charged by their estimated token cost; a caller over budget waits
+for the bucket to refill for a bounded time and then gets a degraded answer.
+"""
+
+import asyncio
+import functools
+import time
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import metrics
+
+BUDGET_REQUESTS = metrics.REGISTRY.counter(
+    'medaether_token_budget_requests_total',
+    'Token budget checks by bucket and result (granted, queued, degraded)',
+    ('bucket', 'result')
+)
+BUDGET_WAIT = metrics.REGISTRY.histogram(
+    'medaether_token_budget_wait_seconds',
+    'Time spent waiting for a token bucket to refill before a call went ahead',
+    ('bucket',)
+)
+
+
+def estimate_tokens(text):
+    """Rough token count of a text (about four characters per token)"""
+    return len(text or '') // 4 + 1
+
+
+def estimate_chat_tokens(messages, max_tokens):
+    """Estimated cost of a chat completion: the prompt plus the reply limit"""
+    return sum(estimate_tokens(message['content']) for message in messages) + max_tokens
+
+
+class TokenBudget:
+    """Token buckets per (bucket, key) in a MongoDB collection.
+
+    Each take() refills the bucket for the time since its last update and
+    consumes the cost in one find_one_and_update with an update pipeline, using
+    the server clock, so concurrent processes never double-spend. Costs above
+    the capacity are capped so a large request can still go through on a full
+    bucket. If MongoDB is unavailable the call is allowed."""
+
+    def __init__(self, collection, name, capacity, per_hour, max_wait=0):
+        self.collection = collection
+        self.name = name
+        self.capacity = capacity
+        self.rate = per_hour / 3600.0  # tokens per second
+        self.max_wait = max_wait
+
+    def take(self, key, cost):
+        """Consume cost tokens; returns (granted, seconds until they would be available)"""
+        cost = min(cost, self.capacity)
+        try:
+            bucket = self._update(key, cost)
+        except DuplicateKeyError:
+            # Another process created the bucket at the same moment; it exists now
+            bucket = self._update(key, cost)
+        except Exception as e:
+            print(f"Token budget check failed, allowing the call: {e}")
+            return True, 0.0
+        if bucket['granted']:
+            return True, 0.0
+        return False, (cost - bucket['tokens']) / self.rate if self.rate > 0 else float('inf')
+
+    def _update(self, key, cost):
+        now_ms = {'$toLong': '$$NOW'}
+        return self.collection.find_one_and_update(
+            {'_id': f"{self.name}:{key}"},
+            [
+                {'$set': {
+                    'tokens': {'$min': [self.capacity, {'$add': [
+                        {'$ifNull': ['$tokens', self.capacity]},
+                        {'$multiply': [
+                            {'$max': [0, {'$subtract': [now_ms, {'$ifNull': ['$refilled_ms', now_ms]}]}]},
+                            self.rate / 1000.0
+                        ]}
+                    ]}]},
+                    'refilled_ms': now_ms,
+                    'updated_at': '$$NOW'
+                }},
+                {'$set': {'granted': {'$gte': ['$tokens', cost]}}},
+                {'$set': {'tokens': {'$cond': ['$granted', {'$subtract': ['$tokens', cost]}, '$tokens']}}}
+            ],
+            projection={'tokens': 1, 'granted': 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def acquire(self, key, cost):
+        """Take cost tokens, waiting up to max_wait for a refill; False means degrade"""
+        started = time.monotonic()
+        granted, wait = self.take(key, cost)
+        queued = not granted
+        while not granted:
+            if time.monotonic() + wait - started > self.max_wait:
+                BUDGET_REQUESTS.inc(bucket=self.name, result='degraded')
+                return False
+            time.sleep(wait)
+            granted, wait = self.take(key, cost)
+        self._granted(started, queued)
+        return True
+
+    async def aacquire(self, key, cost, executor=None):
+        """acquire() for the event loop; MongoDB calls run on the executor"""
+        loop = asyncio.get_running_loop()
+        take = functools.partial(self.take, key, cost)
+        started = time.monotonic()
+        granted, wait = await loop.run_in_executor(executor, take)
+        queued = not granted
+        while not granted:
+            if time.monotonic() + wait - started > self.max_wait:
+                BUDGET_REQUESTS.inc(bucket=self.name, result='degraded')
+                return False
+            await asyncio.sleep(wait)
+            granted, wait = await loop.run_in_executor(executor, take)
+        self._granted(started, queued)
+        return True
+
+    def _granted(self, started, queued):
+        BUDGET_REQUESTS.inc(bucket=self.name, result='queued' if queued else 'granted')
+        if queued:
+            BUDGET_WAIT.observe(time.monotonic() - started, bucket=self.name)
+
+
+def create_budget(db, name, settings, prefix):
+    """Budget named name from the <prefix>_TOKEN_* settings, or None when budgets are disabled"""
+    if not settings['TOKEN_BUDGET_ENABLED']:
+        return None
+    return TokenBudget(
+        db.token_buckets,
+        name,
+        capacity=settings[f'{prefix}_TOKEN_BURST'],
+        per_hour=settings[f'{prefix}_TOKENS_PER_HOUR'],
+        max_wait=settings[f'{prefix}_BUDGET_MAX_WAIT']
+    )
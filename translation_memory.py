@@ -0,0 +1,150 @@
+"""
+Translation memory for MedAether
+Persists translations of the app's fixed strings in MongoDB keyed by (source
+hash, target language), shared by the web app and the Telegram bot, with an
+in-process LRU in front. Ad-hoc translations (user text, AI answers) may hold
+health data and stay in the LRU only.
+Translator calls can go through a circuit breaker that bounds their latency.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+from datetime import datetime
+from pymongo import ASCENDING
+from cache import LRUCache
+import metrics
+from resilience import CircuitOpen, create_breaker
+
+# Codes used by the app that the translation backend spells differently
+LANGUAGE_ALIASES = {
+    'zh': 'zh-cn'
+}
+
+
+def create_translator_breaker(settings):
+    """Circuit breaker for translator calls, or None when breakers are disabled"""
+    return create_breaker(
+        'googletrans',
+        settings,
+        settings['TRANSLATE_TIMEOUT'],
+        slow_call=settings['TRANSLATE_SLOW_CALL'],
+        hedge=settings['TRANSLATE_HEDGE_ENABLED']
+    )
+
+
+def source_hash(text):
+    """Stable hash of a source string"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    """Look up translations in memory, then MongoDB, then the translator"""
+
+    def __init__(self, collection, translator, max_entries=4096, source_language='en', breaker=None):
+        self.collection = collection
+        self.translator = translator
+        self.breaker = breaker  # resilience.CircuitBreaker for the translator
+        self.source_language = source_language
+        self.cache = LRUCache(max_entries=max_entries, ttl_seconds=None)
+
+    def ensure_indexes(self):
+        """Create the unique lookup index"""
+        self.collection.create_index(
+            [("source_hash", ASCENDING), ("target_language", ASCENDING)],
+            unique=True
+        )
+
+    def lookup(self, text, dest, persist=False):
+        """Return a known translation without calling the translator.
+
+        Only persisted (fixed) strings can be in MongoDB, so other text is
+        looked up in the LRU alone."""
+        key = (source_hash(text), dest)
+        translated = self.cache.get(key)
+        if translated is not None or not persist:
+            return translated
+
+        doc = self.collection.find_one(
+            {'source_hash': key[0], 'target_language': dest},
+            {'translated_text': 1}
+        )
+        if doc is None:
+            return None
+        self.cache.set(key, doc['translated_text'])
+        return doc['translated_text']
+
+    def translate(self, text, dest, persist=False):
+        """Translate text, raising if the translator is unavailable or fails.
+
+        Only fixed strings of the app should be persisted (and looked up in
+        MongoDB); anything else is kept in this process's LRU."""
+        if not text or dest == self.source_language:
+            return text
+
+        translated = self.lookup(text, dest, persist)
+        if translated is not None:
+            return translated
+
+        if self.translator is None:
+            raise RuntimeError("Translator is not configured")
+        call = functools.partial(self._translate_remote, text, LANGUAGE_ALIASES.get(dest, dest))
+        started = time.perf_counter()
+        try:
+            translated = self.breaker.call(call) if self.breaker is not None else call()
+        except CircuitOpen:
+            raise  # Rejected without calling the translator
+        except Exception:
+            metrics.TRANSLATE_FAILURES.inc(language=dest)
+            metrics.TRANSLATE_DURATION.observe(time.perf_counter() - started, language=dest)
+            raise
+        metrics.TRANSLATE_DURATION.observe(time.perf_counter() - started, language=dest)
+        self.store(text, dest, translated, persist)
+        return translated
+
+    def _translate_remote(self, text, dest):
+        return self.translator.translate(text, dest=dest).text
+
+    def store(self, text, dest, translated, persist=False):
+        """Save a translation to the LRU, and to MongoDB when persist is set"""
+        key = (source_hash(text), dest)
+        self.cache.set(key, translated)
+        if not persist:
+            return
+        try:
+            self.collection.update_one(
+                {'source_hash': key[0], 'target_language': dest},
+                {'$setOnInsert': {
+                    'source_text': text,
+                    'translated_text': translated,
+                    'fixed': True,
+                    'created_at': datetime.utcnow()
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Failed to persist translation: {e}")
+
+    def prewarm(self, texts, languages):
+        """Make sure every fixed string is stored for every language"""
+        for dest in languages:
+            if dest == self.source_language:
+                continue
+            for text in texts:
+                try:
+                    self.translate(text, dest, persist=True)
+                except Exception as e:
+                    print(f"Translation prewarm failed for '{dest}': {e}")
+                    break
+
+    def prewarm_in_background(self, texts, languages):
+        """Run prewarm on a daemon thread so startup is not delayed"""
+        thread = threading.Thread(
+            target=self.prewarm,
+            args=(list(texts), list(languages)),
+            name='translation-prewarm',
+            daemon=True
+        )
+        thread.start()
+        return thread
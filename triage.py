@@ -0,0 +1,323 @@
+"""
+Red-flag triage for MedAether
+Spots emergency symptoms ("chest pain", "can't breathe", "suicidal", ...) in
+any supported language with one precompiled pattern, so the web app and the
+Telegram bot can answer with emergency guidance at once instead of going
+through the AI model and the translator.
+"""
+
+import re
+import threading
+import unicodedata
+import metrics
+
+TRIAGE_MATCHES = metrics.REGISTRY.counter(
+    'medaether_triage_matches_total',
+    'Messages answered with emergency guidance, by red-flag category',
+    ('category',)
+)
+
+# Phrases per category and language, written as a user would type them.
+# Matching ignores case, accents, apostrophes and hyphens (see fold()).
+RED_FLAGS = {
+    'chest_pain': {
+        'en': ["chest pain", "chest pains", "pain in my chest", "pain in the chest", "chest tightness",
+               "tight chest", "crushing chest", "pressure in my chest", "having a heart attack"],
+        'es': ["dolor en el pecho", "dolor de pecho", "dolor toracico", "opresion en el pecho",
+               "ataque al corazon", "ataque cardiaco", "infarto"],
+        'fr': ["douleur thoracique", "douleur a la poitrine", "douleur dans la poitrine",
+               "mal a la poitrine", "crise cardiaque", "infarctus"],
+        'de': ["brustschmerz", "brustschmerzen", "schmerzen in der brust", "engegefuhl in der brust",
+               "herzinfarkt"],
+        'pt': ["dor no peito", "dor toracica", "aperto no peito", "ataque cardiaco", "infarto"],
+        'ru': ["боль в груди", "боли в груди", "болит грудь", "сердечный приступ", "инфаркт"],
+        'ar': ["ألم في الصدر", "الم في الصدر", "ألم بالصدر", "نوبة قلبية", "ذبحة صدرية"],
+        'hi': ["सीने में दर्द", "छाती में दर्द", "दिल का दौरा", "seene mein dard", "seene me dard",
+               "chhati mein dard", "chhati me dard"],
+        'zh': ["胸痛", "胸口痛", "胸口疼", "心脏病发作", "心梗"],
+        'ja': ["胸の痛み", "胸が痛い", "心臓発作", "心筋梗塞"],
+    },
+    'breathing': {
+        'en': ["can't breathe", "cannot breathe", "can not breathe", "unable to breathe", "difficulty breathing",
+               "trouble breathing", "struggling to breathe", "hard to breathe", "gasping for air", "choking",
+               "severe shortness of breath", "blue lips", "lips turning blue"],
+        'es': ["no puedo respirar", "dificultad para respirar", "me falta el aire", "me ahogo",
+               "me estoy ahogando"],
+        'fr': ["je ne peux pas respirer", "je n'arrive pas a respirer", "difficulte a respirer",
+               "j'etouffe", "je suffoque"],
+        'de': ["ich kann nicht atmen", "bekomme keine luft", "kriege keine luft", "atemnot", "ich ersticke"],
+        'pt': ["nao consigo respirar", "dificuldade para respirar", "falta de ar", "estou sufocando"],
+        'ru': ["не могу дышать", "трудно дышать", "затрудненное дыхание", "задыхаюсь", "удушье"],
+        'ar': ["لا أستطيع التنفس", "لا استطيع التنفس", "صعوبة في التنفس", "ضيق تنفس شديد", "اختناق"],
+        'hi': ["सांस नहीं ले पा", "साँस नहीं ले पा", "सांस लेने में तकलीफ", "सांस लेने में दिक्कत",
+               "saans nahi le pa", "saans lene mein taklif"],
+        'zh': ["呼吸困难", "喘不过气", "无法呼吸", "不能呼吸", "窒息"],
+        'ja': ["息ができない", "呼吸ができない", "呼吸困難", "息苦しい"],
+    },
+    'stroke': {
+        'en': ["having a stroke", "face drooping", "face is drooping", "slurred speech",
+               "slurring my words", "slurring words", "sudden numbness", "sudden weakness on one side",
+               "can't move one side", "worst headache of my life"],
+        'es': ["derrame cerebral", "accidente cerebrovascular", "cara caida", "entumecimiento repentino"],
+        'fr': ["avc", "accident vasculaire cerebral", "visage affaisse", "engourdissement soudain"],
+        'de': ["schlaganfall", "verwaschene sprache", "hangender mundwinkel", "plotzliche lahmung"],
+        'pt': ["derrame cerebral", "tendo um derrame", "teve um derrame", "avc", "acidente vascular cerebral", "fala arrastada", "boca torta"],
+        'ru': ["инсульт", "онемение лица", "невнятная речь"],
+        'ar': ["سكتة دماغية", "جلطة دماغية"],
+        'hi': ["लकवा", "ब्रेन स्ट्रोक", "lakwa"],
+        'zh': ["中风", "脑卒中", "口齿不清", "半身麻木", "口角歪斜"],
+        'ja': ["脳卒中", "脳梗塞", "ろれつが回らない"],
+    },
+    'severe_bleeding': {
+        'en': ["severe bleeding", "heavy bleeding", "bleeding heavily", "bleeding a lot", "won't stop bleeding",
+               "bleeding won't stop", "can't stop the bleeding", "vomiting blood", "throwing up blood",
+               "coughing up blood"],
+        'es': ["sangrado abundante", "hemorragia", "no para de sangrar", "vomito sangre", "vomitando sangre",
+               "toso sangre"],
+        'fr': ["saignement abondant", "hemorragie", "ne s'arrete pas de saigner", "vomi du sang",
+               "crache du sang"],
+        'de': ["starke blutung", "blutet stark", "hort nicht auf zu bluten", "erbreche blut", "huste blut"],
+        'pt': ["sangramento intenso", "hemorragia", "nao para de sangrar", "vomitando sangue",
+               "tossindo sangue"],
+        'ru': ["сильное кровотечение", "кровотечение не останавливается", "рвота кровью", "кашель с кровью"],
+        'ar': ["نزيف حاد", "نزيف شديد", "تقيؤ دم", "سعال دموي"],
+        'hi': ["बहुत खून बह", "खून नहीं रुक", "खून की उल्टी", "khoon ki ulti"],
+        'zh': ["大出血", "血流不止", "吐血", "咳血"],
+        'ja': ["大量出血", "血が止まらない", "吐血", "喀血"],
+    },
+    'suicidal': {
+        'en': ["suicidal", "suicide", "kill myself", "killing myself", "end my life", "ending my life",
+               "take my own life", "want to die", "don't want to live", "self harm", "want to hurt myself",
+               "going to hurt myself"],
+        'es': ["suicidio", "suicidarme", "quitarme la vida", "matarme", "quiero morir", "no quiero vivir"],
+        'fr': ["suicide", "me suicider", "me tuer", "mettre fin a mes jours", "envie de mourir",
+               "je veux mourir"],
+        'de': ["selbstmord", "suizid", "mich umbringen", "will sterben", "mir das leben nehmen",
+               "nicht mehr leben"],
+        'pt': ["suicidio", "me matar", "quero morrer", "tirar minha vida", "nao quero mais viver"],
+        'ru': ["суицид", "самоубийство", "покончить с собой", "хочу умереть", "не хочу жить"],
+        'ar': ["انتحار", "أريد أن أموت", "اريد ان اموت", "أقتل نفسي", "اقتل نفسي"],
+        'hi': ["आत्महत्या", "खुदकुशी", "मरना चाहत", "जीना नहीं चाहत", "khudkushi", "aatmahatya"],
+        'zh': ["自杀", "想死", "不想活", "轻生", "自残"],
+        'ja': ["自殺", "死にたい", "消えたい", "自傷"],
+    },
+    'unresponsive': {
+        'en': ["unconscious", "unresponsive", "passed out", "not breathing", "won't wake up", "not waking up",
+               "collapsed", "seizure", "seizing", "convulsions", "convulsing"],
+        'es': ["inconsciente", "se desmayo", "no responde", "no despierta", "convulsiones", "convulsionando"],
+        'fr': ["inconscient", "inconsciente", "evanoui", "evanouie", "ne repond pas", "ne se reveille pas",
+               "convulsions", "crise d'epilepsie"],
+        'de': ["bewusstlos", "ohnmachtig", "reagiert nicht", "wacht nicht auf", "krampfanfall"],
+        'pt': ["inconsciente", "desmaiou", "nao responde", "nao acorda", "convulsao", "convulsoes"],
+        'ru': ["без сознания", "потерял сознание", "потеряла сознание", "не реагирует", "судороги",
+               "припадок"],
+        'ar': ["فاقد الوعي", "فقد الوعي", "لا يستجيب", "تشنجات"],
+        'hi': ["बेहोश", "होश नहीं", "दौरा पड़", "behosh"],
+        'zh': ["昏迷", "失去知觉", "不省人事", "叫不醒", "抽搐", "癫痫发作"],
+        'ja': ["意識がない", "意識不明", "気を失", "反応がない", "けいれん", "痙攣"],
+    },
+    'poisoning': {
+        'en': ["took an overdose", "taken an overdose", "overdosed", "overdosing", "took too many pills", "swallowed poison", "been poisoned",
+               "drank bleach", "ate poison"],
+        'es': ["sobredosis", "demasiadas pastillas", "trague veneno", "bebi lejia", "envenenado"],
+        'fr': ["fait une overdose", "surdose", "avale du poison", "trop de comprimes", "empoisonne"],
+        'de': ["uberdosis", "zu viele tabletten", "gift geschluckt", "vergiftet"],
+        'pt': ["teve uma overdose", "tive uma overdose", "tomou uma overdose", "remedios demais", "engoli veneno", "envenenado"],
+        'ru': ["передозировка", "наглотался таблеток", "наглоталась таблеток", "выпил яд", "выпила яд"],
+        'ar': ["جرعة زائدة", "ابتلعت سم", "شربت سم"],
+        'hi': ["ज़हर खा", "जहर खा", "ओवरडोज़", "zeher kha", "zehar kha"],
+        'zh': ["服毒", "吃了毒药", "药物过量", "吞了很多药"],
+        'ja': ["過剰摂取", "オーバードーズ", "毒を飲んだ", "薬を大量に飲んだ"],
+    },
+    'anaphylaxis': {
+        'en': ["anaphylaxis", "anaphylactic", "throat is closing", "throat closing", "throat swelling",
+               "tongue swelling", "swollen tongue", "severe allergic reaction"],
+        'es': ["anafilaxia", "reaccion alergica grave", "se me cierra la garganta", "garganta hinchada"],
+        'fr': ["anaphylaxie", "choc anaphylactique", "reaction allergique grave", "gorge gonflee"],
+        'de': ["anaphylaxie", "anaphylaktischer schock", "schwere allergische reaktion", "hals schwillt zu"],
+        'pt': ["anafilaxia", "choque anafilatico", "reacao alergica grave", "garganta fechando"],
+        'ru': ["анафилаксия", "анафилактический шок", "отек горла"],
+        'ar': ["صدمة تأقية", "حساسية مفرطة", "تورم الحلق"],
+        'hi': ["गले में सूजन", "गंभीर एलर्जी"],
+        'zh': ["过敏性休克", "严重过敏", "喉咙肿"],
+        'ja': ["アナフィラキシー", "喉が腫れ", "重いアレルギー"],
+    },
+}
+
+# Scripts written without spaces, with combining vowel signs or with attached
+# prefixes (Arabic "ال", "ب") are matched anywhere, not on word boundaries
+UNBOUNDED_LANGUAGES = frozenset(['ar', 'hi', 'zh', 'ja'])
+
+# A negation just before a phrase ("no chest pain", "sin dolor de pecho") means
+# it is not being reported; at most one word may sit in between
+NEGATION_PATTERN = re.compile(
+    r"(?:\b(?:no|not|never|without|dont|doesnt|didnt|havent|hasnt|sin|nunca|sans|pas de|kein|keine|keinen"
+    r"|nicht|ohne|sem|nao|нет|без|не|ни)\s+(?:\w+\s+)?|(?:没有|沒有|无|不是))$"
+)
+NEGATION_WINDOW = 32  # characters before a match searched for a negation
+
+# A time long past next to a phrase ("had a stroke 5 years ago", "hace dos anos")
+# means medical history, not something happening now
+HISTORY_PATTERN = re.compile(
+    r"\b(?:\w+\s+(?:years?|months?)\s+ago|last\s+(?:year|month)|as\s+a\s+(?:child|kid)"
+    r"|hace\s+\w+\s+(?:anos?|mes|meses)|il\s+y\s+a\s+\w+\s+(?:ans?|mois)|vor\s+\w+\s+(?:jahren|jahr|monaten)"
+    r"|ha\s+\w+\s+(?:anos?|mes|meses)|\w+\s+(?:лет|года?|месяцев|месяца?)\s+назад)\b"
+)
+HISTORY_WINDOW = 40  # characters around a match searched for a time long past
+
+# General questions about a condition ("what are the signs of a heart attack?",
+# "how much paracetamol is an overdose?") ask for information; a question that
+# mentions who it is about ("am I having a stroke?") is still triaged
+GENERAL_QUESTION_PATTERN = re.compile(
+    r"^\W*(?:what|how|why|which|when|is|are|can|does|do|should|que|cual|cuales|como|por\s+que|quel|quels"
+    r"|quelle|quelles|comment|pourquoi|est\s+ce\s+que|was|wie|warum|welche|welcher|ist|kann|qual|quais"
+    r"|o\s+que)\b.*\?\W*$",
+    re.DOTALL
+)
+PERSON_PATTERN = re.compile(
+    r"\b(?:i|im|ive|id|me|my|we|us|our|he|hes|him|his|she|shes|her|they|them|their|yo|mi|mis|tengo|estoy"
+    r"|nos|je|jai|moi|mon|ma|mes|il|elle|nous|quil|ich|mir|mich|mein|meine|meinem|er|sie|wir|eu|meu|minha"
+    r"|estou|tenho|ele|ela)\b"
+)
+
+RED_FLAG_ALERTS = {
+    'chest_pain': "🚨 Chest pain or pressure can be a sign of a heart attack. Call 911 (or your local emergency number) now and stay still while you wait.",
+    'breathing': "🚨 Severe difficulty breathing is a medical emergency. Call 911 now; sit upright and loosen tight clothing while you wait.",
+    'stroke': "🚨 Face drooping, arm weakness or slurred speech can mean a stroke. Call 911 now and note the time the symptoms started.",
+    'severe_bleeding': "🚨 Heavy bleeding, or vomiting or coughing up blood, needs emergency care. Call 911 now and press firmly on any wound with a clean cloth.",
+    'suicidal': "💙 You are not alone. If you are thinking about suicide or harming yourself, call or text 988 now, or text HOME to 741741. If you are in immediate danger, call 911.",
+    'unresponsive': "🚨 Someone who is unconscious, unresponsive or having a seizure needs emergency help. Call 911 now and, if they are breathing, turn them on their side.",
+    'poisoning': "🚨 For a possible overdose or poisoning, call 911 now or Poison Control at 1-800-222-1222. Do not try to make the person vomit.",
+    'anaphylaxis': "🚨 Swelling of the throat or tongue can be a severe allergic reaction. Call 911 now and use an epinephrine auto-injector if one has been prescribed.",
+}
+
+EMERGENCY_GUIDANCE = """
+🚨 *EMERGENCY CONTACTS* 🚨
+
+*Immediate Emergency:*
+📞 911 - Police/Fire/Medical Emergency
+
+*Medical Emergency:*
+🏥 Emergency Room - Go to nearest hospital
+☎️ Poison Control: 1-800-222-1222
+
+*Mental Health Crisis:*
+🧠 National Suicide Prevention Lifeline: 988
+💬 Crisis Text Line: Text HOME to 741741
+
+*Important Notes:*
+⚠️ If you're experiencing chest pain, difficulty breathing, severe bleeding, or any life-threatening symptoms, call 911 immediately!
+
+⚠️ This bot cannot replace emergency medical services. For urgent medical situations, always contact professional emergency services.
+
+🏥 For non-emergency medical advice, you can continue chatting with me or visit your local healthcare provider.
+"""
+
+# Accents, apostrophes and hyphens are dropped so "can't"/"cant" and
+# "dolor torácico"/"dolor toracico" look the same
+_FOLD = str.maketrans({
+    'á': 'a', 'à': 'a', 'â': 'a', 'ä': 'a', 'ã': 'a', 'å': 'a', 'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e',
+    'í': 'i', 'ì': 'i', 'î': 'i', 'ï': 'i', 'ó': 'o', 'ò': 'o', 'ô': 'o', 'ö': 'o', 'õ': 'o',
+    'ú': 'u', 'ù': 'u', 'û': 'u', 'ü': 'u', 'ñ': 'n', 'ç': 'c', 'ё': 'е',
+    "'": None, '’': None, '‘': None, '-': ' ',
+})
+
+
+def fold(text):
+    """Lowercase and strip the differences matching should ignore"""
+    return unicodedata.normalize('NFC', text).casefold().translate(_FOLD)
+
+
+def _phrase_tokens(phrase, bounded):
+    tokens = [r'\s+' if char == ' ' else re.escape(char) for char in ' '.join(fold(phrase).split())]
+    return [r'\b'] + tokens + [r'\b'] if bounded else tokens
+
+
+def _trie_pattern(node):
+    """Regex for a token trie, sharing common prefixes so matching does not retry each phrase"""
+    branches = [token + _trie_pattern(child) for token, child in sorted(node.items()) if token is not None]
+    if not branches:
+        return ''
+    if len(branches) == 1 and None not in node:
+        return branches[0]
+    pattern = f"(?:{'|'.join(branches)})"
+    return pattern + '?' if None in node else pattern
+
+
+def compile_red_flags(red_flags):
+    """Compile every phrase into one pattern and map each folded phrase to its category"""
+    trie = {}
+    categories = {}
+    for category, by_language in red_flags.items():
+        for language, phrases in by_language.items():
+            for phrase in phrases:
+                node = trie
+                for token in _phrase_tokens(phrase, language not in UNBOUNDED_LANGUAGES):
+                    node = node.setdefault(token, {})
+                node[None] = True  # a phrase ends here
+                categories[' '.join(fold(phrase).split())] = category
+    return re.compile(_trie_pattern(trie)), categories
+
+
+RED_FLAG_PATTERN, PHRASE_CATEGORIES = compile_red_flags(RED_FLAGS)
+
+
+def detect(message):
+    """Red-flag category mentioned in a message, or None"""
+    text = fold(message or '')
+    if GENERAL_QUESTION_PATTERN.search(text) and not PERSON_PATTERN.search(text):
+        return None
+    for match in RED_FLAG_PATTERN.finditer(text):
+        if NEGATION_PATTERN.search(text, max(0, match.start() - NEGATION_WINDOW), match.start()):
+            continue
+        if HISTORY_PATTERN.search(text[max(0, match.start() - HISTORY_WINDOW):match.end() + HISTORY_WINDOW]):
+            continue
+        return PHRASE_CATEGORIES[' '.join(match.group().split())]
+    return None
+
+
+class EmergencyResponder:
+    """Emergency replies for each red-flag category, translated ahead of time"""
+
+    def __init__(self, translation_memory=None):
+        self.translation_memory = translation_memory
+        self.table = {}  # (English text, language) -> translation
+
+    def texts(self):
+        return list(RED_FLAG_ALERTS.values()) + [EMERGENCY_GUIDANCE]
+
+    def prewarm(self, languages):
+        """Fill the table from the translation memory (translating what it lacks)"""
+        for language in languages:
+            if language == 'en' or self.translation_memory is None:
+                continue
+            for text in self.texts():
+                try:
+                    self.table[(text, language)] = self.translation_memory.translate(text, language, persist=True)
+                except Exception as e:
+                    print(f"Emergency guidance prewarm failed for '{language}': {e}")
+                    break
+
+    def prewarm_in_background(self, languages):
+        """Run prewarm on a daemon thread; replies are English until it fills the table"""
+        thread = threading.Thread(
+            target=self.prewarm, args=(list(languages),), name='triage-prewarm', daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _text(self, text, language):
+        return self.table.get((text, language), text)
+
+    def respond(self, category, language='en', markdown=True):
+        """Emergency reply for a category in the user's language, never calling the translator"""
+        TRIAGE_MATCHES.inc(category=category)
+        reply = f"{self._text(RED_FLAG_ALERTS[category], language)}\n{self._text(EMERGENCY_GUIDANCE, language)}"
+        return reply if markdown else reply.replace('*', '')
+
+    def triage(self, message, language='en', markdown=True):
+        """(category, reply) for a red-flag message, or (None, None)"""
+        category = detect(message)
+        if category is None:
+            return None, None
+        return category, self.respond(category, language, markdown)